@@ -1,21 +1,99 @@
 import os
-import requests
 import time
 from datetime import datetime
-from influxdb_client import InfluxDBClient, Point, WriteOptions
-from influxdb_client.client.write_api import SYNCHRONOUS
+from importlib.util import find_spec
 from dotenv import load_dotenv
-import reactivex
+
+# Só módulos leves no import: requests, ijson, aiohttp, numpy e o influxdb_client
+# são importados no primeiro uso, depois da validação da configuração
+from common import metrics, startup
+from common.adaptive import AdaptiveInterval, CircuitBreaker, FixedRateTicker
+from common.influx_writer import InfluxWriter
+from common.sinks import build_writer, parse_sinks
+from common.spool import WriteSpool
+from change_cache import ConditionalCache, ChangeCache
+from line_protocol import (INTERFACE_FIELDS, INTERFACE_MEASUREMENT, LOCATION_MEASUREMENT, SERIES_METADATA_MEASUREMENT,
+                           SMOKE_FIELDS, ViaIpeEncoder, numeric_fields, timestamp_ns)
+from rollup import RollupAggregator, parse_window
+from series_index import SeriesIndex
+from sharding import ShardPool, partition
 
 load_dotenv()
 
 # Configuração
 API_URL = os.getenv("VIAIPE_API_URL")
+# Lista de endpoints regionais separados por vírgula (ativa a coleta concorrente)
+API_URLS = [url.strip() for url in os.getenv("VIAIPE_API_URLS", "").split(",") if url.strip()]
+API_TIMEOUT_SECONDS = float(os.getenv("VIAIPE_API_TIMEOUT_SECONDS", "20"))
+API_CONCURRENCY = int(os.getenv("VIAIPE_API_CONCURRENCY", "5"))
+# Parse incremental da resposta (uma localidade por vez), só para VIAIPE_API_URL
+STREAMING = os.getenv("VIAIPE_STREAMING", "false").lower() in ("1", "true", "yes")
+# Tratamento de registros inalterados: "write" (escreve tudo), "skip" (omite) ou "heartbeat"
+UNCHANGED_MODE = os.getenv("VIAIPE_UNCHANGED_MODE", "write").lower()
+FORCE_REFRESH_SECONDS = int(os.getenv("VIAIPE_FORCE_REFRESH_SECONDS", "300"))
+# Rollups na borda: janelas separadas por vírgula (ex: "1m,5m,1h"; vazio desativa)
+ROLLUP_WINDOWS = [parse_window(w) for w in os.getenv("VIAIPE_ROLLUP_WINDOWS", "").split(",") if w.strip()]
+# Campos com percentis (sketch) nos rollups; os demais têm só min/max/mean/last
+ROLLUP_PERCENTILE_FIELDS = [f.strip() for f in os.getenv(
+    "VIAIPE_ROLLUP_PERCENTILE_FIELDS", "interface_avg_in,interface_avg_out,smoke_avg_val,smoke_loss"
+).split(",") if f.strip()]
+# Com rollups ativos, "false" deixa de escrever os pontos brutos
+WRITE_RAW_POINTS = os.getenv("VIAIPE_WRITE_RAW", "true").lower() in ("1", "true", "yes")
+# Análise vetorizada das interfaces (utilização, taxa de variação, anomalias); requer numpy
+ANALYTICS = os.getenv("VIAIPE_ANALYTICS", "false").lower() in ("1", "true", "yes")
+ANOMALY_ZSCORE = float(os.getenv("VIAIPE_ANOMALY_ZSCORE", "3.0"))
+ANOMALY_ALPHA = float(os.getenv("VIAIPE_ANOMALY_ALPHA", "0.1"))
+ANOMALY_WARMUP = int(os.getenv("VIAIPE_ANOMALY_WARMUP", "10"))
+UTILISATION_SCALE = float(os.getenv("VIAIPE_UTILISATION_SCALE", "8"))
+# Particionamento por hash do location_id: processos desta instância e fatia
+# (índice/total) quando várias instâncias do agente dividem a topologia
+SHARD_PROCESSES = int(os.getenv("VIAIPE_SHARD_PROCESSES", "1"))
+SHARD_INDEX = int(os.getenv("VIAIPE_SHARD_INDEX", "0"))
+SHARD_COUNT = int(os.getenv("VIAIPE_SHARD_COUNT", "1"))
+# Índice persistente das séries (vazio desativa): tags internadas, limite de séries e metadados
+SERIES_INDEX_FILE = os.getenv("VIAIPE_SERIES_INDEX_FILE", "")
+# Tags dos pontos: "full" (todas, como sem o índice) ou "ids" (só location_id/interface_graph_id;
+# nomes, tipo e lado vão para o measurement viaipe_series_metadata)
+SERIES_TAGS = os.getenv("VIAIPE_SERIES_TAGS", "full").lower()
+SERIES_MAX = int(os.getenv("VIAIPE_SERIES_MAX", "0"))
+SERIES_ALERT_RATIO = float(os.getenv("VIAIPE_SERIES_ALERT_RATIO", "0.9"))
+SERIES_TTL_DAYS = float(os.getenv("VIAIPE_SERIES_TTL_DAYS", "7"))
+METADATA_INTERVAL_SECONDS = int(os.getenv("VIAIPE_METADATA_INTERVAL_SECONDS", "3600"))
 INFLUXDB_URL = os.getenv("INFLUXDB_URL")
 INFLUXDB_TOKEN = os.getenv("INFLUXDB_TOKEN")
 INFLUXDB_ORG = os.getenv("INFLUXDB_ORG")
 INFLUXDB_BUCKET = os.getenv("INFLUXDB_BUCKET")
 INTERVAL_SECONDS = int(os.getenv("AGENT_INTERVAL_SECONDS", "10"))
+# Circuit breaker por endpoint: falhas seguidas até abrir (0 desativa), backoff máximo e jitter
+CIRCUIT_BREAKER_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", "3"))
+BACKOFF_MAX_SECONDS = float(os.getenv("BACKOFF_MAX_SECONDS", "300"))
+BACKOFF_JITTER = float(os.getenv("BACKOFF_JITTER", "0.2"))
+# Polling adaptativo: o intervalo acompanha a frequência com que os dados da API mudam
+ADAPTIVE_POLLING = os.getenv("ADAPTIVE_POLLING", "false").lower() in ("1", "true", "yes")
+ADAPTIVE_MIN_INTERVAL_SECONDS = float(os.getenv("ADAPTIVE_MIN_INTERVAL_SECONDS", str(INTERVAL_SECONDS)))
+ADAPTIVE_MAX_INTERVAL_SECONDS = float(os.getenv("ADAPTIVE_MAX_INTERVAL_SECONDS", "300"))
+INFLUXDB_BATCH_SIZE = int(os.getenv("INFLUXDB_BATCH_SIZE", "500"))
+INFLUXDB_MAX_PENDING = int(os.getenv("INFLUXDB_MAX_PENDING", "50000"))
+# Spool em disco para escritas que falharem (vazio desativa)
+INFLUXDB_SPOOL_DIR = os.getenv("INFLUXDB_SPOOL_DIR", "")
+INFLUXDB_SPOOL_MAX_MB = int(os.getenv("INFLUXDB_SPOOL_MAX_MB", "256"))
+INFLUXDB_SPOOL_MAX_AGE_HOURS = float(os.getenv("INFLUXDB_SPOOL_MAX_AGE_HOURS", "24"))
+INFLUXDB_SPOOL_REPLAY_RATE = int(os.getenv("INFLUXDB_SPOOL_REPLAY_RATE", "5000"))
+# Cliente do InfluxDB: "full" (influxdb_client) ou "slim" (line protocol por HTTP só com a
+# biblioteca padrão, sem o influxdb_client: inicialização mais rápida e menos memória)
+AGENT_RUNTIME = os.getenv("AGENT_RUNTIME", "full").lower()
+# Destinos dos pontos (influxdb, udp, file), cada um com a própria fila
+OUTPUT_SINKS = parse_sinks(os.getenv("OUTPUT_SINKS", "influxdb"))
+UDP_SINK_ADDRESS = os.getenv("UDP_SINK_ADDRESS", "")
+FILE_SINK_DIR = os.getenv("FILE_SINK_DIR", "")
+FILE_SINK_COMPRESSION = os.getenv("FILE_SINK_COMPRESSION", "gzip").lower()
+FILE_SINK_ROTATE_MB = int(os.getenv("FILE_SINK_ROTATE_MB", "64"))
+FILE_SINK_ROTATE_SECONDS = int(os.getenv("FILE_SINK_ROTATE_SECONDS", "3600"))
+FILE_SINK_MAX_FILES = int(os.getenv("FILE_SINK_MAX_FILES", "0"))
+# Auto-instrumentação: porta do endpoint Prometheus (vazio desativa) e intervalo
+# de escrita do measurement agent_self no InfluxDB (0 desativa)
+METRICS_PORT = int(os.getenv("METRICS_PORT") or "0")
+METRICS_INFLUX_INTERVAL_SECONDS = int(os.getenv("METRICS_INFLUX_INTERVAL_SECONDS", "0"))
 
 # Cabeçalhos da requisição
 HEADERS = {
@@ -25,24 +103,349 @@ HEADERS = {
 
 # Valida as variáveis de ambiente
 required_vars = {
-    "VIAIPE_API_URL": API_URL,
+    "VIAIPE_API_URL/VIAIPE_API_URLS": API_URL or API_URLS or None,
     "INFLUXDB_URL": INFLUXDB_URL,
     "INFLUXDB_TOKEN": INFLUXDB_TOKEN,
     "INFLUXDB_ORG": INFLUXDB_ORG,
     "INFLUXDB_BUCKET": INFLUXDB_BUCKET
 }
 
+if "influxdb" not in OUTPUT_SINKS:
+    required_vars = {var: value for var, value in required_vars.items() if not var.startswith("INFLUXDB_")}
+if "udp" in OUTPUT_SINKS:
+    required_vars["UDP_SINK_ADDRESS"] = UDP_SINK_ADDRESS or None
+if "file" in OUTPUT_SINKS:
+    required_vars["FILE_SINK_DIR"] = FILE_SINK_DIR or None
+
 missing_vars = [var for var, value in required_vars.items() if value is None]
 if missing_vars:
     raise EnvironmentError(f"Missing environment variables: {', '.join(missing_vars)}")
 
+if FILE_SINK_COMPRESSION not in ("gzip", "zstd", "none"):
+    raise EnvironmentError(f"Invalid FILE_SINK_COMPRESSION: {FILE_SINK_COMPRESSION} (use gzip, zstd or none)")
+
+if UNCHANGED_MODE not in ("write", "skip", "heartbeat"):
+    raise EnvironmentError(f"Invalid VIAIPE_UNCHANGED_MODE: {UNCHANGED_MODE} (use write, skip or heartbeat)")
+
+if ADAPTIVE_POLLING and not 0 < ADAPTIVE_MIN_INTERVAL_SECONDS <= ADAPTIVE_MAX_INTERVAL_SECONDS:
+    raise EnvironmentError("ADAPTIVE_MIN_INTERVAL_SECONDS must be positive and <= ADAPTIVE_MAX_INTERVAL_SECONDS")
+
+if not WRITE_RAW_POINTS and not ROLLUP_WINDOWS:
+    raise EnvironmentError("VIAIPE_WRITE_RAW=false requires VIAIPE_ROLLUP_WINDOWS")
+
+if SERIES_TAGS not in ("full", "ids"):
+    raise EnvironmentError(f"Invalid VIAIPE_SERIES_TAGS: {SERIES_TAGS} (use full or ids)")
+
+if (SERIES_TAGS != "full" or SERIES_MAX) and not SERIES_INDEX_FILE:
+    raise EnvironmentError("VIAIPE_SERIES_TAGS=ids and VIAIPE_SERIES_MAX require VIAIPE_SERIES_INDEX_FILE")
+
+if SHARD_PROCESSES < 1 or SHARD_COUNT < 1 or not 0 <= SHARD_INDEX < SHARD_COUNT:
+    raise EnvironmentError(
+        f"Invalid sharding: VIAIPE_SHARD_PROCESSES={SHARD_PROCESSES}, "
+        f"VIAIPE_SHARD_INDEX={SHARD_INDEX}, VIAIPE_SHARD_COUNT={SHARD_COUNT}"
+    )
+
+if AGENT_RUNTIME not in ("full", "slim"):
+    raise EnvironmentError(f"Invalid AGENT_RUNTIME: {AGENT_RUNTIME} (use full or slim)")
+
+# Pacotes das funcionalidades ativadas, procurados sem importá-los:
+# pacote -> (necessário, configuração que o exige, arquivo de requirements/AGENT_FEATURES)
+required_packages = {
+    "influxdb_client": (AGENT_RUNTIME == "full" and "influxdb" in OUTPUT_SINKS, "AGENT_RUNTIME=full", "influxdb"),
+    "requests": (bool(API_URL) and not API_URLS, "VIAIPE_API_URL", "streaming" if STREAMING else "api"),
+    "ijson": (STREAMING and not API_URLS, "VIAIPE_STREAMING", "streaming"),
+    "aiohttp": (bool(API_URLS), "VIAIPE_API_URLS", "regions"),
+    "numpy": (ANALYTICS, "VIAIPE_ANALYTICS", "analytics"),
+    "zstandard": ("file" in OUTPUT_SINKS and FILE_SINK_COMPRESSION == "zstd", "FILE_SINK_COMPRESSION=zstd", "zstd"),
+}
+missing_packages = [f"{name} (needed by {setting}; install requirements-{feature}.txt)"
+                    for name, (needed, setting, feature) in required_packages.items()
+                    if needed and find_spec(name) is None]
+if missing_packages:
+    raise EnvironmentError(f"Missing packages for the configured features: {', '.join(missing_packages)}")
+
+# Campos que compõem a impressão digital de cada registro
+LOCATION_FINGERPRINT_KEYS = ('name', 'lat', 'lng')
+SMOKE_FINGERPRINT_KEYS = ('loss', 'avg_val', 'max_loss', 'val', 'max_val', 'avg_loss')
+INTERFACE_FINGERPRINT_KEYS = (
+    'tipo', 'client_side', 'max_out', 'max_traffic_up', 'max_traffic_down',
+    'avg_in', 'avg_out', 'traffic_in', 'traffic_out', 'max_in'
+)
+
+# Validadores HTTP (ETag/Last-Modified) e impressões digitais dos registros já escritos
+conditional_cache = ConditionalCache()
+change_cache = ChangeCache(force_refresh_seconds=FORCE_REFRESH_SECONDS)
+
+# Circuit breakers por endpoint e intervalo adaptativo (ADAPTIVE_POLLING)
+breakers = {}
+poller = AdaptiveInterval(
+    "viaipe_api", INTERVAL_SECONDS, ADAPTIVE_MIN_INTERVAL_SECONDS, ADAPTIVE_MAX_INTERVAL_SECONDS
+) if ADAPTIVE_POLLING else None
+# Registros novos ou alterados no último ciclo (None sem cache de alterações)
+last_changes = None
+
+# Codificador de line protocol, com buffer reutilizado entre ciclos
+encoder = ViaIpeEncoder()
+
+# Agregação em janelas (VIAIPE_ROLLUP_WINDOWS); None quando desativada
+rollups = RollupAggregator(ROLLUP_WINDOWS, sketch_fields=ROLLUP_PERCENTILE_FIELDS) if ROLLUP_WINDOWS else None
+
+# Análise das interfaces (VIAIPE_ANALYTICS); numpy só é importado quando ativada
+analytics = None
+if ANALYTICS:
+    from interface_analytics import ANALYTICS_FIELDS, ANOMALY_FIELD, InterfaceAnalytics, interface_row
+    analytics = InterfaceAnalytics(scale=UTILISATION_SCALE, alpha=ANOMALY_ALPHA,
+                                   threshold=ANOMALY_ZSCORE, warmup=ANOMALY_WARMUP)
+
+# Métricas do próprio agente
+FETCH_SECONDS = metrics.REGISTRY.histogram("agent_fetch_seconds", "Duration of fetch_data")
+FETCH_FAILURES = metrics.REGISTRY.counter("agent_fetch_failures_total", "Cycles without API data")
+FETCH_SKIPPED = metrics.REGISTRY.counter("agent_fetch_skipped_total",
+                                         "Cycles without a fetch because every endpoint's circuit breaker was open")
+SAVE_SECONDS = metrics.REGISTRY.histogram("agent_save_seconds", "Duration of save_to_influx (point building and queueing)")
+POINTS_BUILT = metrics.REGISTRY.counter("agent_points_built_total", "Points built and queued for InfluxDB")
+POINTS_UNCHANGED = metrics.REGISTRY.counter("agent_points_unchanged_total", "Points skipped by the change cache")
+CYCLE_SECONDS = metrics.REGISTRY.histogram("agent_cycle_seconds", "Duration of a collection cycle")
+CYCLE_OVERRUNS = metrics.REGISTRY.counter("agent_cycle_overruns_total", "Cycles longer than AGENT_INTERVAL_SECONDS")
+ANALYTICS_SECONDS = metrics.REGISTRY.histogram("agent_analytics_seconds", "Duration of the vectorized interface analytics")
+ANOMALIES = metrics.REGISTRY.counter("agent_interface_anomalies_total", "Interfaces flagged as anomalous")
+DUPLICATE_LOCATIONS = metrics.REGISTRY.counter("agent_duplicate_locations_total",
+                                               "Locations repeated within a cycle and written only once")
+
+# Escritor persistente do InfluxDB, compartilhado entre os ciclos
+_writer = None
+# Índice de séries (VIAIPE_SERIES_INDEX_FILE), criado no primeiro uso
+_series_index = None
+# Índice da fatia quando este é um processo do pool de fatias
+_shard = None
+
+def get_writer():
+    """Retorna o escritor dos pontos (InfluxDB e/ou outros destinos), criando-o e iniciando-o no primeiro uso"""
+    global _writer
+    if _writer is None:
+        def create_influx_writer():
+            spool = None
+            if INFLUXDB_SPOOL_DIR:
+                # Cada processo de fatia tem o próprio diretório de spool
+                spool_dir = INFLUXDB_SPOOL_DIR if _shard is None else os.path.join(INFLUXDB_SPOOL_DIR, f"shard-{_shard}")
+                spool = WriteSpool(
+                    spool_dir,
+                    max_bytes=INFLUXDB_SPOOL_MAX_MB * 1024 * 1024,
+                    max_age_seconds=INFLUXDB_SPOOL_MAX_AGE_HOURS * 3600
+                )
+            if AGENT_RUNTIME == "slim":
+                from common.influx_http import HttpInfluxWriter
+                writer_class = HttpInfluxWriter
+            else:
+                writer_class = InfluxWriter
+            return writer_class(
+                url=INFLUXDB_URL,
+                token=INFLUXDB_TOKEN,
+                org=INFLUXDB_ORG,
+                bucket=INFLUXDB_BUCKET,
+                batch_size=INFLUXDB_BATCH_SIZE,
+                max_pending=INFLUXDB_MAX_PENDING,
+                spool=spool,
+                replay_rate=INFLUXDB_SPOOL_REPLAY_RATE
+            )
+
+        _writer = build_writer(
+            OUTPUT_SINKS,
+            influxdb=create_influx_writer,
+            udp_address=UDP_SINK_ADDRESS,
+            file_dir=FILE_SINK_DIR,
+            file_prefix="agent_api" if _shard is None else f"agent_api-shard{_shard}",
+            file_compression=FILE_SINK_COMPRESSION,
+            file_rotate_bytes=FILE_SINK_ROTATE_MB * 1024 * 1024,
+            file_rotate_seconds=FILE_SINK_ROTATE_SECONDS,
+            file_max_files=FILE_SINK_MAX_FILES,
+            batch_size=INFLUXDB_BATCH_SIZE,
+            max_pending=INFLUXDB_MAX_PENDING
+        )
+        metrics.REGISTRY.add_collector("agent_writer", _writer.stats)
+    return _writer
+
+def get_series_index():
+    """Retorna o índice de séries (None se desativado), carregando-o do disco no primeiro uso"""
+    global _series_index
+    if not SERIES_INDEX_FILE:
+        return None
+    if _series_index is None:
+        # Cada processo de fatia tem o próprio arquivo e uma parte do limite de séries
+        path = SERIES_INDEX_FILE if _shard is None else f"{SERIES_INDEX_FILE}.shard{_shard}"
+        max_series = SERIES_MAX if _shard is None else -(-SERIES_MAX // SHARD_PROCESSES)
+        _series_index = SeriesIndex(
+            path,
+            tag_mode=SERIES_TAGS,
+            max_series=max_series,
+            alert_ratio=SERIES_ALERT_RATIO,
+            ttl=SERIES_TTL_DAYS * 86400,
+            metadata_interval=METADATA_INTERVAL_SECONDS
+        )
+        metrics.REGISTRY.add_collector("agent_series_index", _series_index.stats)
+    return _series_index
+
+# Coletor concorrente dos endpoints regionais, criado no primeiro uso
+_collector = None
+
+def get_breaker(target):
+    """Circuit breaker do endpoint, criado no primeiro uso (None com CIRCUIT_BREAKER_THRESHOLD=0)"""
+    if CIRCUIT_BREAKER_THRESHOLD <= 0:
+        return None
+    breaker = breakers.get(target)
+    if breaker is None:
+        breaker = breakers[target] = CircuitBreaker(
+            target,
+            failure_threshold=CIRCUIT_BREAKER_THRESHOLD,
+            base_backoff=INTERVAL_SECONDS,
+            max_backoff=BACKOFF_MAX_SECONDS,
+            jitter=BACKOFF_JITTER
+        )
+    return breaker
+
+def record_fetch(url, ok):
+    """Registra o resultado da busca no circuit breaker do endpoint"""
+    breaker = get_breaker(url)
+    if breaker is not None:
+        if ok:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
+def get_collector():
+    """Retorna o coletor multi-região configurado por VIAIPE_API_URLS"""
+    global _collector
+    if _collector is None:
+        from viaipe_collector import RegionCollector
+
+        _collector = RegionCollector(
+            API_URLS,
+            headers=HEADERS,
+            timeout=API_TIMEOUT_SECONDS,
+            concurrency=API_CONCURRENCY,
+            conditional_cache=conditional_cache,
+            breaker_for=get_breaker
+        )
+    return _collector
+
+def fetch_regions():
+    """Busca concorrentemente todos os endpoints regionais da API ViaIpe"""
+    print(f"Fetching data from {len(API_URLS)} API endpoints concurrently")
+    try:
+        locations = get_collector().fetch()
+    except Exception as e:
+        print(f"Unexpected error fetching data: {str(e)}")
+        return None
+
+    if not locations:
+        if all(get_collector().last_results.get(url, {}).get("skipped") for url in API_URLS):
+            # Nenhum endpoint consultado: o ciclo foi pulado, não falhou
+            FETCH_SKIPPED.inc()
+            return None
+        print("Warning: Empty response from API")
+        return None
+
+    print(f"Found {len(locations)} locations in the API")
+    return locations
+
+def _iter_locations(first, locations, response, headers):
+    """Gera as localidades do stream, encerrando a resposta ao final.
+
+    O resultado da busca só é registrado no circuit breaker (e os validadores
+    ETag/Last-Modified no cache condicional) quando o corpo chega inteiro: uma
+    conexão que cai no meio do stream conta como falha.
+    """
+    count = 1
+    try:
+        yield first
+        for location in locations:
+            count += 1
+            yield location
+    except GeneratorExit:
+        # O consumidor parou antes do fim: o que chegou até aqui estava íntegro
+        record_fetch(API_URL, True)
+        raise
+    except Exception as e:
+        print(f"Error streaming data after {count} locations: {str(e)}")
+        FETCH_FAILURES.inc()
+        record_fetch(API_URL, False)
+    else:
+        conditional_cache.store(API_URL, headers, None)
+        record_fetch(API_URL, True)
+    finally:
+        response.close()
+        print(f"Streamed {count} locations from the API")
+
+def stream_data():
+    """Busca dados da API ViaIpe em modo streaming, sem carregar o JSON inteiro em memória"""
+    import ijson
+    import requests
+
+    try:
+        print(f"Streaming data from API: {API_URL}")
+        request_headers = {**HEADERS, **conditional_cache.request_headers(API_URL)}
+        response = requests.get(API_URL, headers=request_headers, timeout=API_TIMEOUT_SECONDS, stream=True)
+        if response.status_code == 304:
+            # No modo streaming o payload não fica em cache: não há o que reescrever
+            response.close()
+            conditional_cache.not_modified_payload(API_URL)
+            record_fetch(API_URL, True)
+            print("API data not modified since last fetch (304)")
+            return None
+
+        response.raise_for_status()
+        response.raw.decode_content = True
+        locations = ijson.items(response.raw, 'item', use_float=True)
+
+        first = next(locations, None)
+        if first is None:
+            response.close()
+            conditional_cache.store(API_URL, response.headers, None)
+            record_fetch(API_URL, True)
+            print("Warning: Empty response from API")
+            return None
+        return _iter_locations(first, locations, response, response.headers)
+
+    except requests.exceptions.Timeout:
+        print("Error fetching data (Timeout Error)")
+        record_fetch(API_URL, False)
+        return None
+    except requests.exceptions.RequestException as req_e:
+        print(f"Error fetching data (Request Error): {req_e}")
+        record_fetch(API_URL, False)
+        return None
+    except Exception as e:
+        print(f"Unexpected error fetching data: {str(e)}")
+        record_fetch(API_URL, False)
+        return None
+
 def fetch_data():
     """Busca dados da API ViaIpe"""
+    if API_URLS:
+        return fetch_regions()
+    breaker = get_breaker(API_URL)
+    if breaker is not None and not breaker.allow():
+        print(f"Skipping fetch from {API_URL}: circuit breaker open ({breaker.backoff:.0f}s backoff)")
+        FETCH_SKIPPED.inc()
+        return None
+    if STREAMING:
+        return stream_data()
+
+    import requests
+
     try:
         print(f"Fetching data from API: {API_URL}")
-        response = requests.get(API_URL, headers=HEADERS, timeout=20) # Increased timeout
-        response.raise_for_status()
-        locations = response.json()
+        request_headers = {**HEADERS, **conditional_cache.request_headers(API_URL)}
+        response = requests.get(API_URL, headers=request_headers, timeout=API_TIMEOUT_SECONDS)
+        if response.status_code == 304:
+            # Sem alterações no upstream: reaproveita o payload anterior
+            print("API data not modified since last fetch (304)")
+            locations = conditional_cache.not_modified_payload(API_URL)
+        else:
+            response.raise_for_status()
+            locations = response.json()
+            conditional_cache.store(API_URL, response.headers, locations)
+        record_fetch(API_URL, True)
 
         if not locations or len(locations) == 0:
             print("Warning: Empty response from API")
@@ -52,136 +455,369 @@ def fetch_data():
         return locations
 
     except requests.exceptions.Timeout:
-        print(f"Error fetching data (Timeout Error)")
+        print("Error fetching data (Timeout Error)")
+        record_fetch(API_URL, False)
         return None
     except requests.exceptions.RequestException as req_e:
         print(f"Error fetching data (Request Error): {req_e}")
+        record_fetch(API_URL, False)
         return None
     except Exception as e:
         print(f"Unexpected error fetching data: {str(e)}")
+        record_fetch(API_URL, False)
         return None
 
 
-def save_to_influx(locations):
-    """Salva as métricas do ViaIpe no InfluxDB, separando interfaces."""
+# Instante (monotônico) da última escrita do measurement agent_self
+_last_self_metrics = float("-inf")
+
+def write_self_metrics():
+    """Escreve as métricas do agente no InfluxDB (measurement agent_self), no máximo uma vez por intervalo"""
+    global _last_self_metrics
+    if METRICS_INFLUX_INTERVAL_SECONDS <= 0:
+        return
+    now = time.monotonic()
+    if now - _last_self_metrics >= METRICS_INFLUX_INTERVAL_SECONDS:
+        _last_self_metrics = now
+        get_writer().submit(metrics.REGISTRY.to_lines("agent_self", {"agent": "agent_api"}))
+
+def save_to_influx(locations, now=None):
+    """Salva as métricas do ViaIpe no InfluxDB, separando interfaces. Retorna os pontos enfileirados."""
     if not locations:
         print("No location data to save.")
+        return 0
+    with SAVE_SECONDS.time():
+        return _save_locations(locations, now)
+
+# Pool de processos das fatias (VIAIPE_SHARD_PROCESSES > 1), criado no primeiro uso
+_shard_pool = None
+
+def get_shard_pool():
+    """Retorna o pool de processos das fatias, iniciando-o no primeiro uso"""
+    global _shard_pool
+    if _shard_pool is None:
+        _shard_pool = ShardPool(SHARD_PROCESSES, save_shard, shutdown=close_shard).start()
+        metrics.REGISTRY.add_collector("agent_shards", _shard_pool.stats)
+    return _shard_pool
+
+def save_shard(shard, locations, now):
+    """Salva a fatia de um ciclo (roda no processo da fatia, com escritor próprio)"""
+    global _shard
+    _shard = shard
+    points = save_to_influx(locations, now)
+    writer = get_writer()
+    print(f"Shard {shard}: {writer.stats_line()}")
+    return {"locations": len(locations), "points": points, "changes": last_changes}
+
+def close_shard():
+    """Encerra o processo de uma fatia, escrevendo as janelas encerradas e esvaziando a fila"""
+    if _writer is None:
         return
+    if rollups is not None:
+        _writer.submit(rollups.flush(time.time()))
+    if _series_index is not None:
+        _series_index.save()
+    _writer.close()
+
+def save_sharded(locations):
+    """Particiona as localidades pelo hash do location_id e salva só a fatia desta instância.
+
+    Com VIAIPE_SHARD_PROCESSES > 1 cada fatia é codificada e escrita por um
+    processo próprio; todas usam o mesmo timestamp do ciclo. Localidades
+    repetidas no ciclo são escritas uma única vez.
+    """
+    now = datetime.utcnow()
+    index = SHARD_INDEX if SHARD_COUNT > 1 else None
+    shards, duplicates = partition(locations, SHARD_PROCESSES, index, SHARD_COUNT)
+    if duplicates:
+        DUPLICATE_LOCATIONS.inc(duplicates)
+        print(f"Skipped {duplicates} duplicate locations in this cycle")
+    if SHARD_PROCESSES == 1:
+        return save_to_influx(shards[0], now)
+
+    global last_changes
+    with SAVE_SECONDS.time():
+        results = get_shard_pool().run(shards, now, timeout=max(60, 3 * INTERVAL_SECONDS))
+    queued_points = 0
+    changes = []
+    for shard, result in enumerate(results):
+        if result is None:
+            print(f"Shard {shard}: no result, {len(shards[shard])} locations not written this cycle")
+            continue
+        queued_points += result["points"]
+        changes.append(result["changes"])
+    last_changes = None if None in changes or not changes else sum(changes)
+    POINTS_BUILT.inc(queued_points)
+    print(f"Queued {queued_points} API points from {sum(map(len, shards))} locations "
+          f"across {SHARD_PROCESSES} shard processes")
+    return queued_points
+
+def interface_series_tags(location_id, location_name, location_tags, interface, interface_name, interface_graph_id):
+    """Tags da interface: do índice de séries (None se recusada) ou montadas pelo codificador"""
+    series_index = get_series_index()
+    if series_index is None:
+        return encoder.interface_tags(location_tags, interface, interface_name, interface_graph_id)
+    return series_index.interface(location_id, interface_graph_id, location_name, interface_name, interface)
+
+def add_rollups(location_id, location_name, location_tags, location, smoke, timestamp):
+    """Acrescenta as amostras da localidade e de suas interfaces às janelas de rollup"""
+    if smoke is not None:
+        rollups.add(LOCATION_MEASUREMENT, location_tags, numeric_fields(SMOKE_FIELDS, smoke), timestamp)
+    for interface in location.get('data', {}).get('interfaces', ()):
+        tags = interface_series_tags(
+            location_id, location_name, location_tags, interface,
+            str(interface.get('nome', 'unknown')), str(interface.get('traffic_graph_id', 'unknown'))
+        )
+        if tags is None:
+            continue
+        rollups.add(INTERFACE_MEASUREMENT, tags, numeric_fields(INTERFACE_FIELDS, interface), timestamp)
+
+def add_analytics(rows, timestamp):
+    """Calcula a análise das interfaces do ciclo e codifica os campos extras.
+
+    ``rows`` tem uma tupla (chave, valores, escrita, tags) por interface; as
+    tags são a string pronta do índice de séries ou os argumentos de
+    ``interface_tags``, montadas só para as linhas efetivamente escritas. Os
+    campos vão para o mesmo measurement/tags/timestamp do ponto bruto e o
+    InfluxDB os une num só ponto; interfaces puladas pelo cache de alterações
+    só recebem linha quando marcadas como anomalia.
+    """
+    if not rows:
+        return
+    keys, values, written, tag_args = zip(*rows)
+    with ANALYTICS_SECONDS.time():
+        fields, anomaly = analytics.process(keys, values, timestamp)
+    for row_written, row_fields, row_anomaly, tags in zip(written, fields.tolist(), anomaly.tolist(), tag_args):
+        if row_written or row_anomaly:
+            row = list(zip(ANALYTICS_FIELDS, row_fields))
+            row.append((ANOMALY_FIELD, row_anomaly))
+            if not isinstance(tags, str):
+                tags = encoder.interface_tags(*tags)
+            encoder.add_fields(INTERFACE_MEASUREMENT, tags, row)
+    flagged = int(anomaly.sum())
+    if flagged:
+        ANOMALIES.inc(flagged)
+        print(f"Interface analytics: {flagged} anomalous interfaces out of {len(rows)}")
+
+def _save_locations(locations, now=None):
+    global last_changes
+    # Com VIAIPE_UNCHANGED_MODE=write o cache de alterações só é consultado pelo
+    # polling adaptativo (para medir as mudanças), e todos os pontos são escritos
+    cache = change_cache if UNCHANGED_MODE != "write" or ADAPTIVE_POLLING else None
+    skip_unchanged = UNCHANGED_MODE != "write"
+    misses_before = cache.misses if cache is not None else 0
+    # Um único timestamp para todos os pontos do ciclo (e para todas as fatias)
+    if now is None:
+        now = datetime.utcnow()
+    encoder.begin(now)
+    now_seconds = timestamp_ns(now) // 10 ** 9
+    series_index = get_series_index()
+    if series_index is not None:
+        series_index.begin(now_seconds)
+    queued_points = 0
+    # Interfaces do ciclo para a análise vetorizada
+    analytics_rows = [] if analytics is not None else None
+
+    for location in locations:
+        location_id = str(location.get('id', 'unknown'))
+        location_name = str(location.get('name', 'unknown'))
+        unchanged_points = 0
 
-    # Configura opções de BATCHING
-    write_options = WriteOptions(
-        batch_size=500,
-        flush_interval=5_000, # 5 segundos
-        jitter_interval=2_000,
-        retry_interval=5_000
-    )
-
-    try:
-        with InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG) as client:
-            buckets_api = client.buckets_api()
-            if not buckets_api.find_bucket_by_name(INFLUXDB_BUCKET):
-                print(f"Bucket '{INFLUXDB_BUCKET}' not found. Please create it.")
-                return
-
-            # Usa as opções de BATCHING
-            write_api = client.write_api(write_options=write_options)
-            records_to_write = [] # Lista para acumular todos os pontos
-
-            for location in locations:
-                location_id = str(location.get('id', 'unknown'))
-                location_name = str(location.get('name', 'unknown'))
-                now = datetime.utcnow()
-
-                try:
-                    # Ponto 1: Dados da Localização (lat, lng, smoke)
-                    location_point = Point("viaipe_location_metrics") \
-                        .tag("location_id", location_id) \
-                        .tag("location_name", location_name) \
-                        .field("lat", float(location.get('lat', 0.0))) \
-                        .field("lng", float(location.get('lng', 0.0))) \
-                        .time(now)
-
-                    # Adiciona dados de smoke se presentes
-                    if 'data' in location and 'smoke' in location['data']:
-                        smoke = location['data']['smoke']
-                        location_point.field("smoke_loss", float(smoke.get('loss', 0.0))) \
-                                    .field("smoke_avg_val", float(smoke.get('avg_val', 0.0))) \
-                                    .field("smoke_max_loss", float(smoke.get('max_loss', 0.0))) \
-                                    .field("smoke_val", float(smoke.get('val', 0.0))) \
-                                    .field("smoke_max_val", float(smoke.get('max_val', 0.0))) \
-                                    .field("smoke_avg_loss", float(smoke.get('avg_loss', 0.0)))
-
-                    records_to_write.append(location_point)
-
-                    # Ponto(s) 2: Dados de cada Interface
-                    if 'data' in location and 'interfaces' in location['data']:
-                        interfaces = location['data']['interfaces']
-                        for interface in interfaces:
-                            interface_name = str(interface.get('nome', 'unknown'))
-                            interface_graph_id = str(interface.get('traffic_graph_id', 'unknown'))
-
-                            interface_point = Point("viaipe_interface_metrics") \
-                                .tag("location_id", location_id) \
-                                .tag("location_name", location_name) \
-                                .tag("interface_nome", interface_name) \
-                                .tag("interface_graph_id", interface_graph_id) \
-                                .tag("interface_tipo", str(interface.get('tipo', 'unknown'))) \
-                                .tag("interface_client_side", str(interface.get('client_side', 'unknown'))) \
-                                .field("interface_max_out", float(interface.get('max_out', 0.0))) \
-                                .field("interface_max_traffic_up", float(interface.get('max_traffic_up', 0.0))) \
-                                .field("interface_max_traffic_down", float(interface.get('max_traffic_down', 0.0))) \
-                                .field("interface_avg_in", float(interface.get('avg_in', 0.0))) \
-                                .field("interface_avg_out", float(interface.get('avg_out', 0.0))) \
-                                .field("interface_traffic_in", float(interface.get('traffic_in', 0.0))) \
-                                .field("interface_traffic_out", float(interface.get('traffic_out', 0.0))) \
-                                .field("interface_max_in", float(interface.get('max_in', 0.0))) \
-                                .time(now)
-
-                            records_to_write.append(interface_point)
-
-                except Exception as loc_error:
-                    print(f"Error processing location {location_id}: {str(loc_error)}")
-                    continue # Skip this location
-
-            if records_to_write:
-                print(f"Writing {len(records_to_write)} API points (locations+interfaces) to InfluxDB via BATCHING...")
-                # Envia todos os pontos acumulados para a API de escrita em lote
-                write_api.write(bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG, record=records_to_write)
-                print(f"Batch write initiated for {len(records_to_write)} points.")
+        try:
+            if series_index is not None:
+                location_tags = series_index.location(location_id, location_name)
+                if location_tags is None:
+                    # Localidade nova acima de VIAIPE_SERIES_MAX: nenhum ponto dela é escrito
+                    continue
             else:
-                print("No valid API records prepared to write")
-
-            # Garante que o buffer de escrita seja esvaziado ao final
-            print("Flushing write buffer...")
-            write_api.flush()
-            print("Write buffer flushed.")
-
-    except Exception as e:
-        print(f"Error connecting to or writing to InfluxDB: {str(e)}")
+                location_tags = encoder.location_tags(location_id, location_name)
+            smoke = location['data']['smoke'] if 'data' in location and 'smoke' in location['data'] else None
+            if rollups is not None:
+                # Os rollups recebem todas as amostras, inclusive as que não mudaram
+                add_rollups(location_id, location_name, location_tags, location, smoke, now_seconds)
+                if not WRITE_RAW_POINTS:
+                    continue
+
+            location_fingerprint = (
+                tuple(location.get(key) for key in LOCATION_FINGERPRINT_KEYS),
+                tuple(smoke.get(key) for key in SMOKE_FINGERPRINT_KEYS) if smoke is not None else None
+            )
+            changed = cache is None or cache.changed(location_id, location_fingerprint)
+            if not changed and skip_unchanged:
+                unchanged_points += 1
+            else:
+                # Ponto 1: Dados da Localização (lat, lng, smoke)
+                encoder.add_location(location_tags, location, smoke)
+
+            # Ponto(s) 2: Dados de cada Interface
+            if 'data' in location and 'interfaces' in location['data']:
+                interfaces = location['data']['interfaces']
+                for interface in interfaces:
+                    interface_name = str(interface.get('nome', 'unknown'))
+                    interface_graph_id = str(interface.get('traffic_graph_id', 'unknown'))
+                    # Com o índice as tags (já escapadas) vêm dele; sem ele são montadas só se o ponto for escrito
+                    tags = None
+                    if series_index is not None:
+                        tags = series_index.interface(location_id, interface_graph_id, location_name,
+                                                      interface_name, interface)
+                        if tags is None:
+                            continue
+
+                    written = True
+                    if cache is not None:
+                        interface_fingerprint = tuple(interface.get(key) for key in INTERFACE_FINGERPRINT_KEYS)
+                        written = cache.changed((location_id, interface_graph_id, interface_name),
+                                                interface_fingerprint) or not skip_unchanged
+
+                    if analytics_rows is not None:
+                        analytics_rows.append((
+                            (location_id, interface_graph_id), interface_row(interface), written,
+                            tags or (location_tags, interface, interface_name, interface_graph_id),
+                        ))
+                    if not written:
+                        unchanged_points += 1
+                        continue
+
+                    if tags is not None:
+                        encoder.add_interface_fields(tags, interface)
+                    else:
+                        encoder.add_interface(location_tags, interface, interface_name, interface_graph_id)
+
+            # Heartbeat barato no lugar dos pontos que não mudaram
+            if unchanged_points and UNCHANGED_MODE == "heartbeat":
+                encoder.add_heartbeat(location_id, unchanged_points)
+            if unchanged_points:
+                POINTS_UNCHANGED.inc(unchanged_points)
+
+        except Exception as loc_error:
+            print(f"Error processing location {location_id}: {str(loc_error)}")
+            continue # Skip this location
+
+        # Entrega os pontos em lotes, mantendo o buffer (e a memória) limitado
+        if len(encoder) >= INFLUXDB_BATCH_SIZE:
+            records = encoder.take()
+            get_writer().submit(records)
+            queued_points += len(records)
+
+    if analytics_rows is not None:
+        add_analytics(analytics_rows, now_seconds)
+
+    if series_index is not None:
+        # Metadados (nomes, tipo, lado) das séries novas, renomeadas ou com o intervalo vencido
+        for tags, fields in series_index.metadata_rows():
+            encoder.add_fields(SERIES_METADATA_MEASUREMENT, tags, fields)
+        series_index.end()
+
+    records_to_write = encoder.take()
+
+    if rollups is not None:
+        # Janelas encerradas neste ciclo viram pontos pré-agregados
+        rollup_lines = rollups.collect(now_seconds)
+        if rollup_lines:
+            get_writer().submit(rollup_lines)
+            queued_points += len(rollup_lines)
+            print(f"Queued {len(rollup_lines)} rollup points ({rollups.series_count()} open series)")
+
+    if cache is not None:
+        # Esquece localidades/interfaces que deixaram de aparecer no payload
+        cache.prune(max_age=2 * FORCE_REFRESH_SECONDS)
+        print(f"Change cache: hits={cache.hits}, misses={cache.misses}, forced={cache.forced}, entries={len(cache)}")
+    # Sem pontos brutos o cache não é consultado e não há como medir as mudanças
+    last_changes = cache.misses - misses_before if cache is not None and WRITE_RAW_POINTS else None
+
+    if records_to_write:
+        # Entrega os pontos ao escritor persistente, sem bloquear o ciclo de coleta
+        get_writer().submit(records_to_write)
+        queued_points += len(records_to_write)
+
+    POINTS_BUILT.inc(queued_points)
+    if queued_points:
+        print(f"Queued {queued_points} API points (locations+interfaces) for InfluxDB")
+    else:
+        print("No valid API records prepared to write")
+    return queued_points
 
 
 if __name__ == "__main__":
+    startup.mark("imports")
     print("Starting ViaIpe API Monitoring Agent (with Batching and Interface Separation)")
-    print(f"Config: API={API_URL}, InfluxDB={INFLUXDB_URL}, Interval={INTERVAL_SECONDS}s")
-
-    while True:
-        start_time = time.time()
-        print(f"API Collection started at {datetime.now().isoformat()}")
-
-        api_data = None # Initialize api_data
-        try:
-            api_data = fetch_data()
-
-            if api_data:
-                 save_to_influx(api_data)
-            else:
-                print("Skipping InfluxDB write due to fetch error or empty data.")
-
-        except Exception as e:
-            print(f"Critical error in API main loop: {str(e)}")
-
-        # Calcula o tempo restante para o próximo ciclo
-        elapsed = time.time() - start_time
-        sleep_time = max(0, INTERVAL_SECONDS - elapsed)
-        print(f"API Collection completed in {elapsed:.2f}s. Next run in {sleep_time:.2f}s")
-        time.sleep(sleep_time)
\ No newline at end of file
+    print(f"Config: API={', '.join(API_URLS) or API_URL}, InfluxDB={INFLUXDB_URL}, Interval={INTERVAL_SECONDS}s, "
+          f"Runtime={AGENT_RUNTIME}")
+    sharded = SHARD_PROCESSES > 1 or SHARD_COUNT > 1
+    if sharded:
+        print(f"Sharding: instance {SHARD_INDEX + 1}/{SHARD_COUNT}, {SHARD_PROCESSES} processes")
+    if SHARD_PROCESSES > 1:
+        # Os processos das fatias sobem antes das threads do agente
+        get_shard_pool()
+
+    writer = get_writer()
+    if METRICS_PORT:
+        metrics.serve(metrics.REGISTRY, METRICS_PORT)
+        print(f"Serving agent metrics on :{METRICS_PORT}/metrics")
+    # Ciclos em horários fixos no relógio monotônico (ver FixedRateTicker)
+    ticker = FixedRateTicker("agent_api")
+    try:
+        while True:
+            start_time = time.monotonic()
+            print(f"API Collection started at {datetime.now().isoformat()}")
+
+            api_data = None # Initialize api_data
+            not_modified_before = conditional_cache.not_modified
+            skipped_before = FETCH_SKIPPED.value
+            try:
+                # No modo streaming o download acontece durante o save_to_influx
+                with FETCH_SECONDS.time():
+                    api_data = fetch_data()
+
+                if api_data:
+                    startup.mark("first_fetch")
+                if api_data and sharded:
+                    save_sharded(api_data)
+                elif api_data:
+                     save_to_influx(api_data)
+                elif conditional_cache.not_modified > not_modified_before:
+                    # 304 no modo streaming: nada a reescrever, mas não é falha de coleta
+                    print("Skipping InfluxDB write: API data not modified.")
+                elif FETCH_SKIPPED.value > skipped_before:
+                    # Busca pulada pelo circuit breaker: contada em agent_fetch_skipped_total
+                    print("Skipping InfluxDB write: circuit breaker open.")
+                else:
+                    FETCH_FAILURES.inc()
+                    print("Skipping InfluxDB write due to fetch error or empty data.")
+
+            except Exception as e:
+                print(f"Critical error in API main loop: {str(e)}")
+
+            interval = INTERVAL_SECONDS
+            if poller is not None:
+                # Dados novos no ciclo? (304 sem payload reaproveitado conta como inalterado)
+                if api_data:
+                    interval = poller.observe(last_changes is None or last_changes > 0)
+                elif conditional_cache.not_modified > not_modified_before:
+                    interval = poller.observe(False)
+                else:
+                    interval = poller.interval
+
+            # Calcula o tempo restante para o próximo horário da grade
+            elapsed = time.monotonic() - start_time
+            sleep_time = ticker.next_delay(interval)
+            CYCLE_SECONDS.observe(elapsed)
+            if elapsed > interval:
+                CYCLE_OVERRUNS.inc()
+            write_self_metrics()
+            print(f"API Collection completed in {elapsed:.2f}s. Next run in {sleep_time:.2f}s")
+            print(writer.stats_line())
+            print(f"Conditional fetch: not_modified={conditional_cache.not_modified}, modified={conditional_cache.modified}")
+            time.sleep(sleep_time)
+    finally:
+        if rollups is not None:
+            # Janelas já encerradas são escritas; as incompletas são descartadas (ver RollupAggregator.flush)
+            writer.submit(rollups.flush(time.time()))
+        if _shard_pool is not None:
+            _shard_pool.close()
+        if _series_index is not None:
+            _series_index.save()
+        # Esvazia a fila pendente antes de encerrar o agente
+        writer.close()
+        if _collector is not None:
+            _collector.close()
\ No newline at end of file
@@ -0,0 +1,90 @@
+import time
+
+
+class ConditionalCache:
+    """Guarda ETag/Last-Modified e o último payload de cada endpoint.
+
+    Permite enviar requisições condicionais (If-None-Match/If-Modified-Since);
+    quando o servidor responde 304 o payload anterior é reaproveitado sem novo
+    download nem novo parse do JSON.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.not_modified = 0
+        self.modified = 0
+
+    def request_headers(self, url):
+        """Cabeçalhos condicionais para a próxima requisição ao endpoint."""
+        entry = self._entries.get(url)
+        if not entry:
+            return {}
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def not_modified_payload(self, url):
+        """Payload em cache para uma resposta 304 (None se não houver)."""
+        entry = self._entries.get(url)
+        if not entry:
+            return None
+        self.not_modified += 1
+        return entry["payload"]
+
+    def store(self, url, response_headers, payload):
+        """Registra uma resposta 200 e seus validadores, se o servidor os enviar."""
+        self.modified += 1
+        etag = response_headers.get("ETag")
+        last_modified = response_headers.get("Last-Modified")
+        if etag or last_modified:
+            self._entries[url] = {"etag": etag, "last_modified": last_modified, "payload": payload}
+        else:
+            self._entries.pop(url, None)
+
+
+class ChangeCache:
+    """Cache de impressões digitais por localidade/interface.
+
+    ``changed`` indica se um registro mudou desde a última escrita ou se já
+    passou o período de atualização forçada; registros inalterados podem ser
+    omitidos (ou escritos como heartbeat) pelo agente.
+    """
+
+    def __init__(self, force_refresh_seconds=300):
+        self.force_refresh_seconds = force_refresh_seconds
+        # chave -> [fingerprint, escrito_em, visto_em]
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.forced = 0
+
+    def changed(self, key, fingerprint, now=None):
+        if now is None:
+            now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == fingerprint:
+            entry[2] = now
+            if now - entry[1] < self.force_refresh_seconds:
+                self.hits += 1
+                return False
+            self.forced += 1
+            entry[1] = now
+            return True
+        self.misses += 1
+        self._entries[key] = [fingerprint, now, now]
+        return True
+
+    def prune(self, max_age, now=None):
+        """Remove registros que não aparecem no payload há mais de ``max_age`` segundos."""
+        if now is None:
+            now = time.monotonic()
+        stale = [key for key, entry in self._entries.items() if now - entry[2] > max_age]
+        for key in stale:
+            del self._entries[key]
+        return len(stale)
+
+    def __len__(self):
+        return len(self._entries)
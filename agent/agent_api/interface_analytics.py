@@ -0,0 +1,161 @@
+import math
+
+import numpy as np
+
+# Colunas lidas de cada interface (chaves do JSON da API)
+COLUMNS = ("traffic_in", "traffic_out", "max_traffic_down", "max_traffic_up")
+_IN, _OUT, _CAP_DOWN, _CAP_UP = range(len(COLUMNS))
+
+# Campos extras escritos em viaipe_interface_metrics
+ANALYTICS_FIELDS = (
+    "interface_utilisation_in",
+    "interface_utilisation_out",
+    "interface_traffic_in_rate",
+    "interface_traffic_out_rate",
+    "interface_traffic_in_zscore",
+    "interface_traffic_out_zscore",
+)
+ANOMALY_FIELD = "interface_anomaly"
+
+
+def interface_row(interface):
+    """Valores de ``COLUMNS`` de uma interface; ausentes ou inválidos viram NaN."""
+    try:
+        return [float(interface[key]) for key in COLUMNS]
+    except (KeyError, TypeError, ValueError):
+        pass
+    row = []
+    for key in COLUMNS:
+        try:
+            row.append(float(interface.get(key)))
+        except (TypeError, ValueError):
+            row.append(math.nan)
+    return row
+
+
+class InterfaceAnalytics:
+    """Análise vetorizada das interfaces de cada ciclo com NumPy.
+
+    As interfaces do ciclo são carregadas em arrays colunares e alinhadas ao
+    estado do ciclo anterior por (location_id, traffic_graph_id): cada chave
+    ocupa um slot fixo nos arrays de estado. Numa única passada calcula:
+
+    * utilização: ``traffic_in * scale / max_traffic_down`` e
+      ``traffic_out * scale / max_traffic_up`` (``scale`` converte a unidade
+      do tráfego para a da capacidade; 8 = bytes para bits);
+    * taxa de variação por segundo de ``traffic_in``/``traffic_out`` em
+      relação ao ciclo anterior;
+    * z-score de ``traffic_in``/``traffic_out`` contra média e variância
+      móveis exponenciais (peso ``alpha``), com ``interface_anomaly = 1``
+      quando ``|z| > threshold`` depois de ``warmup`` amostras.
+
+    Valores indefinidos (sem ciclo anterior, capacidade zero, variância zero)
+    ficam NaN e são omitidos na escrita.
+    """
+
+    def __init__(self, scale=8.0, alpha=0.1, threshold=3.0, warmup=10, max_idle_cycles=30):
+        self.scale = scale
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.max_idle_cycles = max_idle_cycles
+        self._slots = {}
+        self._cycle = 0
+        self._allocate(1024)
+
+        # Métricas da análise
+        self.anomalies = 0
+
+    def _allocate(self, capacity):
+        self._prev = np.zeros((capacity, 2))
+        self._prev_time = np.full(capacity, np.nan)
+        self._mean = np.zeros((capacity, 2))
+        self._var = np.zeros((capacity, 2))
+        self._count = np.zeros(capacity, dtype=np.int64)
+        self._last_seen = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self, needed):
+        capacity = len(self._count)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        old = (self._prev, self._prev_time, self._mean, self._var, self._count, self._last_seen)
+        self._allocate(capacity)
+        for new, previous in zip((self._prev, self._prev_time, self._mean, self._var, self._count, self._last_seen), old):
+            new[:len(previous)] = previous
+
+    def _compact(self):
+        # Libera os slots de interfaces que sumiram do payload há muitos ciclos
+        keep = [(key, slot) for key, slot in self._slots.items()
+                if self._cycle - self._last_seen[slot] <= self.max_idle_cycles]
+        if len(keep) == len(self._slots):
+            return
+        old_slots = np.array([slot for _, slot in keep], dtype=np.int64)
+        state = [array[old_slots] for array in
+                 (self._prev, self._prev_time, self._mean, self._var, self._count, self._last_seen)]
+        self._allocate(max(1024, 2 * len(keep)))
+        for new, values in zip((self._prev, self._prev_time, self._mean, self._var, self._count, self._last_seen), state):
+            new[:len(values)] = values
+        self._slots = {key: index for index, (key, _) in enumerate(keep)}
+
+    def __len__(self):
+        return len(self._slots)
+
+    def process(self, keys, values, timestamp):
+        """Analisa um ciclo.
+
+        ``keys`` é a lista de chaves (location_id, traffic_graph_id) e
+        ``values`` a matriz (n x len(COLUMNS)) correspondente. Retorna
+        ``(campos, anomalia)``: matriz (n x len(ANALYTICS_FIELDS)) e vetor
+        booleano de anomalias.
+        """
+        self._cycle += 1
+        values = np.asarray(values, dtype=np.float64).reshape(len(keys), len(COLUMNS))
+        slots_map = self._slots
+        slots = np.fromiter((slots_map.setdefault(key, len(slots_map)) for key in keys),
+                            dtype=np.int64, count=len(keys))
+        self._grow(len(slots_map))
+
+        traffic = values[:, [_IN, _OUT]]
+        capacity = values[:, [_CAP_DOWN, _CAP_UP]]
+        out = np.full((len(keys), len(ANALYTICS_FIELDS)), np.nan)
+
+        # Utilização em relação à capacidade
+        np.divide(traffic * self.scale, capacity, out=out[:, 0:2], where=capacity > 0)
+
+        # Taxa de variação desde o ciclo anterior
+        elapsed = timestamp - self._prev_time[slots]
+        has_previous = elapsed > 0
+        np.divide(traffic - self._prev[slots], elapsed[:, None], out=out[:, 2:4],
+                  where=has_previous[:, None])
+
+        # z-score contra média/variância móveis exponenciais (antes de incluir a amostra)
+        mean = self._mean[slots]
+        var = self._var[slots]
+        count = self._count[slots]
+        std = np.sqrt(var)
+        ready = (count >= self.warmup)[:, None] & (std > 0)
+        np.divide(traffic - mean, std, out=out[:, 4:6], where=ready)
+        anomaly = (np.abs(np.nan_to_num(out[:, 4:6])) > self.threshold).any(axis=1)
+
+        # Atualiza o estado; a primeira amostra de cada interface inicia a média
+        # e amostras inválidas (NaN) não alteram média/variância
+        valid = np.isfinite(traffic)
+        first = count == 0
+        diff = traffic - mean
+        increment = self.alpha * diff
+        new_mean = np.where(first[:, None], traffic, mean + increment)
+        new_var = np.where(first[:, None], 0.0, (1 - self.alpha) * (var + diff * increment))
+        self._mean[slots] = np.where(valid, new_mean, mean)
+        self._var[slots] = np.where(valid, new_var, var)
+        self._count[slots] = count + valid.all(axis=1)
+        self._prev[slots] = traffic
+        self._prev_time[slots] = timestamp
+        self._last_seen[slots] = self._cycle
+
+        if self._cycle % self.max_idle_cycles == 0 and len(slots_map) > len(keys):
+            self._compact()
+
+        self.anomalies += int(anomaly.sum())
+        return out, anomaly
@@ -0,0 +1,238 @@
+import math
+from array import array
+
+from line_protocol import format_float
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_window(text):
+    """Converte ``"90s"``, ``"5m"``, ``"1h"`` (ou segundos) em segundos."""
+    text = text.strip().lower()
+    if text[-1:] in _UNITS:
+        return int(text[:-1]) * _UNITS[text[-1]]
+    return int(text)
+
+
+def window_label(seconds):
+    """Sufixo do measurement de rollup: 60 -> ``1m``, 3600 -> ``1h``."""
+    for unit in ("d", "h", "m"):
+        if seconds % _UNITS[unit] == 0:
+            return f"{seconds // _UNITS[unit]}{unit}"
+    return f"{seconds}s"
+
+
+class QuantileSketch:
+    """Sketch de quantis com erro relativo limitado (no estilo do DDSketch).
+
+    Cada valor positivo cai no bin ``ceil(log_gamma(v))``; os bins formam um
+    intervalo contíguo guardado num ``array`` de contadores, o que mantém o
+    sketch pequeno (em geral poucas centenas de bytes por série). Dois sketches com a
+    mesma precisão podem ser somados com ``merge``. Valores <= 0 (tráfego,
+    perda) são contados à parte, como zero. Ao passar de ``max_bins`` os bins
+    mais baixos são colapsados, preservando a precisão dos quantis altos.
+    """
+
+    __slots__ = ("_log_gamma", "max_bins", "_offset", "_bins", "zero_count", "count")
+
+    def __init__(self, relative_accuracy=0.01, max_bins=1024):
+        self._log_gamma = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        self.max_bins = max_bins
+        self._offset = 0
+        self._bins = array("I")
+        self.zero_count = 0
+        self.count = 0
+
+    def _grow(self, index):
+        # Estende o intervalo de bins para incluir ``index``
+        if not self._bins:
+            self._offset = index
+            self._bins.append(0)
+        elif index < self._offset:
+            self._bins[:0] = array("I", [0] * (self._offset - index))
+            self._offset = index
+        elif index >= self._offset + len(self._bins):
+            self._bins.extend([0] * (index - self._offset - len(self._bins) + 1))
+        # Colapsa os bins mais baixos
+        while len(self._bins) > self.max_bins:
+            lowest = self._bins.pop(0)
+            self._bins[0] += lowest
+            self._offset += 1
+
+    def add(self, value, count=1):
+        self.count += count
+        if value <= 1e-9:
+            self.zero_count += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self._grow(index)
+        self._bins[max(0, index - self._offset)] += count
+
+    def merge(self, other):
+        """Soma ``other`` (mesma precisão) a este sketch."""
+        self.count += other.count
+        self.zero_count += other.zero_count
+        if not other._bins:
+            return
+        self._grow(other._offset)
+        self._grow(other._offset + len(other._bins) - 1)
+        for i, n in enumerate(other._bins):
+            if n:
+                self._bins[max(0, other._offset + i - self._offset)] += n
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        gamma = math.exp(self._log_gamma)
+        for i, n in enumerate(self._bins):
+            seen += n
+            if seen > rank:
+                return 2 * gamma ** (self._offset + i) / (gamma + 1)
+        return 2 * gamma ** (self._offset + len(self._bins) - 1) / (gamma + 1)
+
+
+class FieldStats:
+    """min/max/soma/último de um campo numa janela, com sketch opcional."""
+
+    __slots__ = ("count", "min", "max", "sum", "last", "sketch")
+
+    def __init__(self, sketch=None):
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sum = 0.0
+        self.last = 0.0
+        self.sketch = sketch
+
+    def add(self, value):
+        self.count += 1
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.sum += value
+        self.last = value
+        if self.sketch is not None:
+            self.sketch.add(value)
+
+    def merge(self, other):
+        # ``other`` é sempre a janela mais recente
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sum += other.sum
+        self.last = other.last
+        if self.sketch is not None and other.sketch is not None:
+            self.sketch.merge(other.sketch)
+
+
+class RollupAggregator:
+    """Agregação na borda em janelas fixas (ex: 1m, 5m, 1h) por série.
+
+    As amostras entram só na menor janela; quando ela fecha, suas estatísticas
+    são somadas às janelas maiores (que precisam ser múltiplas da menor), então
+    o custo por amostra não cresce com o número de janelas. Cada janela fechada
+    vira uma linha no measurement ``<measurement>_<janela>`` (ex:
+    ``viaipe_interface_metrics_5m``), com as mesmas tags da série, os campos
+    ``<campo>_min``, ``_max``, ``_mean``, ``_last``, os quantis do sketch
+    (``_p50``, ``_p95``, ``_p99``) para ``sketch_fields`` e ``samples``. O
+    timestamp é o fim da janela, como no ``aggregateWindow`` do Flux.
+    """
+
+    def __init__(self, windows, sketch_fields=(), quantiles=(0.5, 0.95, 0.99), relative_accuracy=0.01):
+        self.windows = sorted(set(windows))
+        if not self.windows or self.windows[0] <= 0:
+            raise ValueError("Rollup windows must be positive")
+        base = self.windows[0]
+        for window in self.windows[1:]:
+            if window % base:
+                raise ValueError(f"Rollup window {window}s is not a multiple of {base}s")
+        self.sketch_fields = frozenset(sketch_fields)
+        self.quantiles = tuple(quantiles)
+        self.relative_accuracy = relative_accuracy
+        # janela -> {início: {(measurement, tags): {campo: FieldStats}}}
+        self._open = {window: {} for window in self.windows}
+        self.lines_emitted = 0
+
+    def _new_stats(self, field):
+        sketch = QuantileSketch(self.relative_accuracy) if field in self.sketch_fields else None
+        return FieldStats(sketch)
+
+    def add(self, measurement, tags, fields, timestamp):
+        """Acrescenta uma amostra (``tags`` já escapadas, no formato ``,k=v,...``)."""
+        base = self.windows[0]
+        start = int(timestamp) - int(timestamp) % base
+        series = self._open[base].setdefault(start, {}).setdefault((measurement, tags), {})
+        for field, value in fields.items():
+            stats = series.get(field)
+            if stats is None:
+                stats = series[field] = self._new_stats(field)
+            stats.add(value)
+
+    def _merge_up(self, start, buckets):
+        for window in self.windows[1:]:
+            target = self._open[window].setdefault(start - start % window, {})
+            for key, fields in buckets.items():
+                series = target.setdefault(key, {})
+                for field, stats in fields.items():
+                    merged = series.get(field)
+                    if merged is None:
+                        merged = series[field] = self._new_stats(field)
+                    merged.merge(stats)
+
+    def _encode(self, window, start, buckets):
+        suffix = "_" + window_label(window)
+        timestamp = f" {(start + window) * 10 ** 9}"
+        lines = []
+        for (measurement, tags), fields in buckets.items():
+            parts = []
+            samples = 0
+            for field in sorted(fields):
+                stats = fields[field]
+                samples = max(samples, stats.count)
+                values = [("min", stats.min), ("max", stats.max), ("mean", stats.sum / stats.count),
+                          ("last", stats.last)]
+                if stats.sketch is not None:
+                    values += [(f"p{round(q * 100):d}", stats.sketch.quantile(q)) for q in self.quantiles]
+                for name, value in values:
+                    value = format_float(value)
+                    if value is not None:
+                        parts.append(f"{field}_{name}={value}")
+            if parts:
+                parts.append(f"samples={samples}i")
+                lines.append(f"{measurement}{suffix}{tags} {','.join(parts)}{timestamp}")
+        return lines
+
+    def collect(self, now):
+        """Fecha as janelas que terminaram até ``now`` (segundos) e retorna suas linhas."""
+        lines = []
+        for i, window in enumerate(self.windows):
+            open_windows = self._open[window]
+            for start in sorted(s for s in open_windows if s + window <= now):
+                buckets = open_windows.pop(start)
+                if i == 0:
+                    self._merge_up(start, buckets)
+                lines.extend(self._encode(window, start, buckets))
+        self.lines_emitted += len(lines)
+        return lines
+
+    def flush(self, now):
+        """Encerramento do agente: fecha as janelas que terminaram até ``now`` e descarta as incompletas.
+
+        Uma janela incompleta não é escrita: depois de um reinício o agente
+        escreveria de novo o mesmo timestamp (fim da janela) só com as amostras
+        posteriores, sobrescrevendo o ponto parcial. Assim cada ponto de rollup
+        é escrito uma única vez, e a janela em que o agente reiniciou fica só
+        com as amostras depois do reinício (``samples`` menor).
+        """
+        lines = self.collect(now)
+        for open_windows in self._open.values():
+            open_windows.clear()
+        return lines
+
+    def series_count(self):
+        return sum(len(buckets) for open_windows in self._open.values() for buckets in open_windows.values())
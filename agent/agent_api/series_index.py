@@ -0,0 +1,236 @@
+import json
+import os
+import sys
+
+from common import metrics
+from common.line_format import tag_pair
+
+# Atributos descritivos de cada tipo de série, na ordem em que são guardados
+LOCATION_ATTRIBUTES = ("location_name",)
+INTERFACE_ATTRIBUTES = ("location_name", "interface_nome", "interface_tipo", "interface_client_side")
+
+_INDEX_VERSION = 1
+
+SERIES_REJECTED = metrics.REGISTRY.counter("agent_series_rejected_total",
+                                           "Points dropped because their series would exceed VIAIPE_SERIES_MAX")
+SERIES_RENAMES = metrics.REGISTRY.counter("agent_series_renames_total",
+                                          "Series whose descriptive attributes changed upstream")
+SERIES_CONFLICTS = metrics.REGISTRY.counter("agent_series_conflicts_total",
+                                            "Interfaces sharing a (location_id, graph_id) with different attributes")
+
+
+class SeriesIndex:
+    """Índice persistente das séries do ViaIpe, com as tags já escapadas.
+
+    Cada série é identificada por ``(location_id, graph_id)`` (``graph_id``
+    None para a série da localidade) e guarda os atributos descritivos
+    (nome da localidade, nome/tipo/lado da interface) e o conjunto de tags
+    pronto para o line protocol, internado e reaproveitado enquanto o
+    upstream não muda os atributos: o ciclo só compara os valores crus do
+    payload, sem ``str()`` nem escape por ponto.
+
+    Com ``tag_mode="full"`` os pontos mantêm todas as tags (mesma saída do
+    codificador); com ``"ids"`` só ``location_id``/``interface_graph_id``, e
+    os atributos vão para o measurement de metadados, escrito quando mudam
+    e a cada ``metadata_interval`` segundos, de modo que renomeações não
+    criam séries novas no InfluxDB.
+
+    ``max_series`` (0 = sem limite) recusa séries novas acima do limite; a
+    partir de ``alert_ratio`` do limite um alerta é impresso. Séries sem
+    pontos há ``ttl`` segundos são esquecidas. O índice é gravado em ``path``
+    (JSON, troca atômica) quando muda e a cada ``save_interval`` segundos.
+    """
+
+    def __init__(self, path, tag_mode="full", max_series=0, alert_ratio=0.9, ttl=7 * 86400,
+                 metadata_interval=3600, save_interval=300):
+        self.path = path
+        self.tag_mode = tag_mode
+        self.max_series = max_series
+        self.alert_ratio = alert_ratio
+        self.ttl = ttl
+        self.metadata_interval = metadata_interval
+        self.save_interval = save_interval
+        # chave -> [atributos, tags, valores crus, visto_em, ciclo, metadados_em, renomeações]
+        self._series = {}
+        self._metadata = []
+        self._cycle = 0
+        self._now = 0
+        self._dirty = False
+        self._saved_at = 0
+        self._alerting = False
+
+        # Métricas do último ciclo
+        self.added = 0
+        self.renamed = 0
+        self.rejected = 0
+        self.conflicts = 0
+        self.pruned = 0
+        self.load()
+
+    def __len__(self):
+        return len(self._series)
+
+    def _tags(self, location_id, graph_id, attributes):
+        # Mesmas tags (e ordem) do ViaIpeEncoder no modo "full"
+        if self.tag_mode == "ids":
+            if graph_id is None:
+                tags = tag_pair("location_id", location_id)
+            else:
+                tags = tag_pair("interface_graph_id", graph_id) + tag_pair("location_id", location_id)
+        elif graph_id is None:
+            tags = tag_pair("location_id", location_id) + tag_pair("location_name", attributes[0])
+        else:
+            location_name, name, kind, client_side = attributes
+            tags = (tag_pair("interface_client_side", client_side) + tag_pair("interface_graph_id", graph_id)
+                    + tag_pair("interface_nome", name) + tag_pair("interface_tipo", kind)
+                    + tag_pair("location_id", location_id) + tag_pair("location_name", location_name))
+        return sys.intern(tags)
+
+    def load(self):
+        """Carrega o índice de ``path``; um arquivo ausente ou inválido começa um índice vazio."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != _INDEX_VERSION:
+                raise ValueError(f"unsupported version {data.get('version')}")
+            for location_id, graph_id, attributes, last_seen, renames in data["series"]:
+                attributes = tuple(attributes)
+                self._series[(location_id, graph_id)] = [
+                    attributes, self._tags(location_id, graph_id, attributes), None, last_seen, 0, 0, renames
+                ]
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Ignoring series index {self.path}: {str(e)}")
+            self._series.clear()
+            return
+        print(f"Loaded {len(self._series)} series from {self.path}")
+
+    def save(self):
+        """Grava o índice (arquivo temporário + rename, para nunca deixar um JSON pela metade)."""
+        series = [[location_id, graph_id, list(entry[0]), entry[3], entry[6]]
+                  for (location_id, graph_id), entry in self._series.items()]
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": _INDEX_VERSION, "series": series}, f, separators=(",", ":"))
+        os.replace(self.path + ".tmp", self.path)
+        self._dirty = False
+        self._saved_at = self._now
+
+    def begin(self, now):
+        """Inicia um ciclo; ``now`` é o timestamp do ciclo em segundos."""
+        self._cycle += 1
+        self._now = now
+        self._metadata = []
+        self.added = self.renamed = self.rejected = self.conflicts = self.pruned = 0
+
+    def _lookup(self, key, raw):
+        entry = self._series.get(key)
+        if entry is not None and entry[2] == raw:
+            # Caminho rápido: mesmos valores crus, tags reaproveitadas
+            entry[3] = self._now
+            entry[4] = self._cycle
+            self._due(key, entry)
+            return entry[1]
+
+        attributes = tuple(str(value) for value in raw)
+        if entry is not None and entry[0] == attributes:
+            # Índice recém-carregado (ou valores equivalentes de outro tipo): só guarda os valores crus
+            entry[2] = raw
+        elif entry is not None and entry[4] == self._cycle:
+            # Outra interface com a mesma chave neste ciclo: não sobrescreve a primeira
+            self.conflicts += 1
+            SERIES_CONFLICTS.inc()
+            if self.tag_mode == "ids":
+                return None
+            return self._tags(key[0], key[1], attributes)
+        elif entry is not None:
+            entry[0] = attributes
+            entry[1] = self._tags(key[0], key[1], attributes)
+            entry[2] = raw
+            entry[5] = 0
+            entry[6] += 1
+            self.renamed += 1
+            self._dirty = True
+            SERIES_RENAMES.inc()
+        else:
+            if self.max_series and len(self._series) >= self.max_series:
+                self.rejected += 1
+                SERIES_REJECTED.inc()
+                return None
+            entry = self._series[key] = [attributes, self._tags(key[0], key[1], attributes), raw, 0, 0, 0, 0]
+            self.added += 1
+            self._dirty = True
+        entry[3] = self._now
+        entry[4] = self._cycle
+        self._due(key, entry)
+        return entry[1]
+
+    def _due(self, key, entry):
+        if self._now >= entry[5]:
+            entry[5] = self._now + self.metadata_interval
+            self._metadata.append((key, entry))
+
+    def location(self, location_id, location_name):
+        """Tags da série da localidade (None se recusada pelo limite)."""
+        return self._lookup((location_id, None), (location_name,))
+
+    def interface(self, location_id, graph_id, location_name, interface_name, interface):
+        """Tags da série da interface (None se recusada pelo limite ou em conflito no modo ``ids``)."""
+        return self._lookup((location_id, graph_id), (
+            location_name, interface_name, interface.get('tipo', 'unknown'), interface.get('client_side', 'unknown')
+        ))
+
+    def metadata_rows(self):
+        """(tags, campos) das séries cujos metadados vencem neste ciclo."""
+        rows = []
+        for (location_id, graph_id), entry in self._metadata:
+            if graph_id is None:
+                tags = tag_pair("location_id", location_id)
+                names = LOCATION_ATTRIBUTES
+            else:
+                tags = tag_pair("interface_graph_id", graph_id) + tag_pair("location_id", location_id)
+                names = INTERFACE_ATTRIBUTES
+            fields = sorted(zip(names, entry[0]))
+            fields.append(("renames", entry[6]))
+            rows.append((tags, fields))
+        self._metadata = []
+        return rows
+
+    def end(self):
+        """Encerra o ciclo: esquece séries antigas, emite alertas e grava o índice se preciso."""
+        expired = [key for key, entry in self._series.items() if self._now - entry[3] > self.ttl]
+        for key in expired:
+            del self._series[key]
+        if expired:
+            self.pruned = len(expired)
+            self._dirty = True
+
+        if self.max_series:
+            usage = len(self._series) / self.max_series
+            if self.rejected:
+                print(f"ALERT: series index full ({len(self._series)}/{self.max_series}), "
+                      f"dropped points of {self.rejected} new series this cycle")
+            elif usage >= self.alert_ratio and not self._alerting:
+                print(f"ALERT: series index at {usage:.0%} of VIAIPE_SERIES_MAX ({len(self._series)}/{self.max_series})")
+            self._alerting = usage >= self.alert_ratio
+        if self.renamed or self.conflicts:
+            print(f"Series index: {self.renamed} series renamed upstream, {self.conflicts} graph_id conflicts")
+
+        if self._dirty or self._now - self._saved_at >= self.save_interval:
+            try:
+                self.save()
+            except OSError as e:
+                print(f"Error saving series index {self.path}: {str(e)}")
+
+    def stats(self):
+        return {
+            "series": len(self._series),
+            "limit": self.max_series,
+            "added": self.added,
+            "renamed": self.renamed,
+            "rejected": self.rejected,
+            "pruned": self.pruned,
+        }
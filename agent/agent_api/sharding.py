@@ -0,0 +1,171 @@
+import multiprocessing
+import time
+import zlib
+
+
+def shard_hash(location_id):
+    """Hash estável (crc32) do location_id, igual entre processos e execuções."""
+    return zlib.crc32(str(location_id).encode())
+
+
+def partition(locations, count, index=None, instance_count=1):
+    """Divide as localidades em ``count`` fatias pelo hash do location_id.
+
+    Com ``index``/``instance_count`` (várias instâncias do agente), mantém só as
+    localidades desta instância (``hash % instance_count == index``) e divide as
+    restantes por ``(hash // instance_count) % count``, para que a fatia da
+    instância se espalhe por todos os processos. Localidades repetidas no mesmo
+    ciclo (ex: presentes em dois endpoints regionais) ficam só na primeira
+    ocorrência. Retorna ``(fatias, duplicadas)``.
+    """
+    shards = [[] for _ in range(count)]
+    seen = set()
+    duplicates = 0
+    for location in locations:
+        location_id = str(location.get('id', 'unknown'))
+        if location_id in seen:
+            duplicates += 1
+            continue
+        seen.add(location_id)
+        h = shard_hash(location_id)
+        if index is not None:
+            if h % instance_count != index:
+                continue
+            h //= instance_count
+        shards[h % count].append(location)
+    return shards, duplicates
+
+
+def _worker_main(conn, shard, handler, shutdown):
+    # Loop do processo de uma fatia: recebe (ciclo, localidades, instante) e responde (ciclo, resultado)
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            cycle, locations, now = message
+            start = time.perf_counter()
+            try:
+                result = handler(shard, locations, now)
+            except Exception as e:
+                print(f"Shard {shard}: error saving cycle {cycle}: {str(e)}")
+                result = None
+            conn.send((cycle, result, time.perf_counter() - start))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        if shutdown is not None:
+            shutdown()
+        conn.close()
+
+
+class ShardPool:
+    """Pool de processos persistentes, um por fatia de localidades.
+
+    Cada localidade vai sempre para o mesmo processo (hash estável do
+    location_id), então o estado mantido por localidade (cache de alterações,
+    rollups, análise das interfaces) continua válido entre os ciclos, e cada
+    processo codifica e escreve a sua fatia com o próprio escritor. ``run``
+    envia as fatias de um ciclo e espera a resposta de todos os processos antes
+    de retornar: nenhuma fatia é reenviada, então cada localidade é escrita no
+    máximo uma vez por ciclo. Um processo que morre ou estoura ``timeout`` é
+    substituído e sua fatia daquele ciclo é perdida (e contada em ``failures``).
+    """
+
+    def __init__(self, processes, handler, shutdown=None, start_method="spawn"):
+        # handler(fatia, localidades, instante) roda no processo da fatia e retorna
+        # um resultado serializável; shutdown() roda no processo ao encerrar
+        if processes < 1:
+            raise ValueError("ShardPool needs at least one process")
+        self.processes = processes
+        self.handler = handler
+        self.shutdown = shutdown
+        self._context = multiprocessing.get_context(start_method)
+        self._workers = [None] * processes
+        self._cycle = 0
+
+        # Métricas do pool
+        self.failures = 0
+        self.restarts = 0
+        self.last_durations = [0.0] * processes
+
+    def _spawn(self, shard):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main, args=(child_conn, shard, self.handler, self.shutdown),
+            name=f"viaipe-shard-{shard}", daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self._workers[shard] = (process, parent_conn)
+
+    def start(self):
+        for shard in range(self.processes):
+            if self._workers[shard] is None:
+                self._spawn(shard)
+        return self
+
+    def _restart(self, shard):
+        process, conn = self._workers[shard]
+        conn.close()
+        if process.is_alive():
+            process.kill()
+        process.join(5)
+        self.restarts += 1
+        self._spawn(shard)
+
+    def run(self, shards, now, timeout):
+        """Processa as fatias de um ciclo; retorna o resultado de cada uma (None se falhou)."""
+        self._cycle += 1
+        results = [None] * self.processes
+        sent = []
+        for shard, locations in enumerate(shards):
+            try:
+                self._workers[shard][1].send((self._cycle, locations, now))
+                sent.append(shard)
+            except (OSError, EOFError):
+                print(f"Shard {shard} is down, skipping its {len(locations)} locations this cycle")
+                self.failures += 1
+                self._restart(shard)
+
+        deadline = time.monotonic() + timeout
+        for shard in sent:
+            process, conn = self._workers[shard]
+            try:
+                while True:
+                    # Depois do prazo ainda lê as respostas que já chegaram (poll sem espera)
+                    if not conn.poll(max(0.0, deadline - time.monotonic())):
+                        raise TimeoutError(f"no answer in {timeout:.0f}s")
+                    cycle, result, duration = conn.recv()
+                    if cycle == self._cycle:
+                        break
+            except (OSError, EOFError, TimeoutError) as e:
+                print(f"Shard {shard} failed ({str(e) or 'process exited'}), restarting it")
+                self.failures += 1
+                self._restart(shard)
+                continue
+            results[shard] = result
+            self.last_durations[shard] = duration
+        return results
+
+    def stats(self):
+        return {
+            "processes": self.processes,
+            "failures": self.failures,
+            "restarts": self.restarts,
+            "slowest_shard_seconds": max(self.last_durations),
+        }
+
+    def close(self, timeout=30.0):
+        """Encerra os processos, que esvaziam seus escritores antes de sair."""
+        for process, conn in filter(None, self._workers):
+            try:
+                conn.send(None)
+            except (OSError, EOFError):
+                pass
+        for process, conn in filter(None, self._workers):
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+            conn.close()
+        self._workers = [None] * self.processes
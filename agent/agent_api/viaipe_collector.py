@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+import aiohttp
+
+
+class RegionCollector:
+    """Coleta concorrente dos endpoints regionais da API ViaIpe.
+
+    Mantém um event loop e uma sessão aiohttp (conexões keep-alive) durante toda
+    a vida do agente. Cada ciclo busca todos os endpoints ao mesmo tempo, com
+    timeout individual e limite de concorrência, de modo que uma região lenta
+    não atrasa as demais. Com um ``ConditionalCache`` as requisições usam
+    ETag/Last-Modified e respostas 304 reaproveitam o payload anterior. Com
+    ``breaker_for`` (url -> ``CircuitBreaker`` ou None), endpoints com o
+    circuito aberto são pulados até o fim do backoff.
+    """
+
+    def __init__(self, urls, headers=None, timeout=20, concurrency=5, conditional_cache=None, breaker_for=None):
+        self.urls = list(urls)
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.concurrency = max(1, concurrency)
+        self.conditional_cache = conditional_cache
+        self.breaker_for = breaker_for
+        self._loop = asyncio.new_event_loop()
+        self._session = None
+        # Resultado do último ciclo por endpoint: {url: {"ok", "locations", "duration"}}
+        self.last_results = {}
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, headers=self.headers)
+        return self._session
+
+    async def _fetch_one(self, session, semaphore, url):
+        start = time.perf_counter()
+        locations = None
+        async with semaphore:
+            try:
+                cache = self.conditional_cache
+                request_headers = cache.request_headers(url) if cache is not None else None
+                async with session.get(url, headers=request_headers,
+                                       timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+                    if response.status == 304 and cache is not None:
+                        locations = cache.not_modified_payload(url)
+                    else:
+                        response.raise_for_status()
+                        locations = await response.json(content_type=None)
+                        if cache is not None:
+                            cache.store(url, response.headers, locations)
+            except asyncio.TimeoutError:
+                print(f"Error fetching data from {url} (Timeout Error)")
+            except aiohttp.ClientError as req_e:
+                print(f"Error fetching data from {url} (Request Error): {req_e}")
+            except Exception as e:
+                print(f"Unexpected error fetching data from {url}: {str(e)}")
+
+        duration = time.perf_counter() - start
+        count = len(locations) if isinstance(locations, list) else 0
+        self.last_results[url] = {"ok": locations is not None, "locations": count, "duration": duration}
+        breaker = self.breaker_for(url) if self.breaker_for is not None else None
+        if breaker is not None:
+            if locations is not None:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+        print(f"Fetched {count} locations from {url} in {duration:.2f}s")
+        return locations if isinstance(locations, list) else []
+
+    async def _fetch_all(self):
+        session = await self._get_session()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        urls = []
+        for url in self.urls:
+            breaker = self.breaker_for(url) if self.breaker_for is not None else None
+            if breaker is not None and not breaker.allow():
+                print(f"Skipping {url}: circuit breaker open")
+                self.last_results[url] = {"ok": False, "locations": 0, "duration": 0.0, "skipped": True}
+                continue
+            urls.append(url)
+        results = await asyncio.gather(*(self._fetch_one(session, semaphore, url) for url in urls))
+        merged = []
+        for locations in results:
+            merged.extend(locations)
+        return merged
+
+    def fetch(self):
+        """Busca todos os endpoints concorrentemente e retorna as localidades combinadas."""
+        return self._loop.run_until_complete(self._fetch_all())
+
+    def close(self):
+        """Fecha a sessão HTTP e o event loop."""
+        if self._session is not None and not self._session.closed:
+            self._loop.run_until_complete(self._session.close())
+        self._loop.close()
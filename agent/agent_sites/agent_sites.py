@@ -1,13 +1,26 @@
+import asyncio
+import functools
 import os
-import requests
 import subprocess
 import time
 from datetime import datetime
-from influxdb_client import InfluxDBClient, Point, WriteOptions
-from influxdb_client.client.write_api import SYNCHRONOUS
+from importlib.util import find_spec
+from urllib.parse import urlparse
 from dotenv import load_dotenv
 import threading
-import reactivex
+from concurrent.futures import ThreadPoolExecutor
+
+# Só módulos leves no import: requests e o influxdb_client são importados no primeiro uso
+from common import metrics, startup
+from common.adaptive import CircuitBreaker, FixedRateTicker
+from common.influx_writer import InfluxWriter
+from common.line_format import format_line
+from common.sinks import build_writer, parse_sinks
+from common.spool import WriteSpool
+from dns_cache import DnsCache, read_nameservers
+from icmp_probe import IcmpProber
+from http_timing import PHASES, PageTimer
+from scheduler import SiteScheduler, load_sites, normalize_sites
 
 load_dotenv()
 
@@ -17,6 +30,64 @@ INFLUXDB_TOKEN = os.getenv("INFLUXDB_TOKEN")
 INFLUXDB_ORG = os.getenv("INFLUXDB_ORG")
 INFLUXDB_BUCKET = os.getenv("INFLUXDB_BUCKET")
 INTERVAL_SECONDS = int(os.getenv("AGENT_INTERVAL_SECONDS", "10"))
+# Circuit breaker por site: falhas seguidas (todos os testes do site) até abrir (0 desativa),
+# backoff máximo e jitter; com o circuito aberto o site só é testado ao fim do backoff
+CIRCUIT_BREAKER_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_THRESHOLD", "3"))
+BACKOFF_MAX_SECONDS = float(os.getenv("BACKOFF_MAX_SECONDS", "300"))
+BACKOFF_JITTER = float(os.getenv("BACKOFF_JITTER", "0.2"))
+INFLUXDB_BATCH_SIZE = int(os.getenv("INFLUXDB_BATCH_SIZE", "50")) # Tamanho menor de batch para testes de site
+INFLUXDB_MAX_PENDING = int(os.getenv("INFLUXDB_MAX_PENDING", "10000"))
+# Spool em disco para escritas que falharem (vazio desativa)
+INFLUXDB_SPOOL_DIR = os.getenv("INFLUXDB_SPOOL_DIR", "")
+INFLUXDB_SPOOL_MAX_MB = int(os.getenv("INFLUXDB_SPOOL_MAX_MB", "256"))
+INFLUXDB_SPOOL_MAX_AGE_HOURS = float(os.getenv("INFLUXDB_SPOOL_MAX_AGE_HOURS", "24"))
+INFLUXDB_SPOOL_REPLAY_RATE = int(os.getenv("INFLUXDB_SPOOL_REPLAY_RATE", "5000"))
+# Cliente do InfluxDB: "full" (influxdb_client) ou "slim" (line protocol por HTTP só com a
+# biblioteca padrão, sem o influxdb_client: inicialização mais rápida e menos memória)
+AGENT_RUNTIME = os.getenv("AGENT_RUNTIME", "full").lower()
+# Destinos dos pontos (influxdb, udp, file), cada um com a própria fila
+OUTPUT_SINKS = parse_sinks(os.getenv("OUTPUT_SINKS", "influxdb"))
+UDP_SINK_ADDRESS = os.getenv("UDP_SINK_ADDRESS", "")
+FILE_SINK_DIR = os.getenv("FILE_SINK_DIR", "")
+FILE_SINK_COMPRESSION = os.getenv("FILE_SINK_COMPRESSION", "gzip").lower()
+FILE_SINK_ROTATE_MB = int(os.getenv("FILE_SINK_ROTATE_MB", "64"))
+FILE_SINK_ROTATE_SECONDS = int(os.getenv("FILE_SINK_ROTATE_SECONDS", "3600"))
+FILE_SINK_MAX_FILES = int(os.getenv("FILE_SINK_MAX_FILES", "0"))
+# Auto-instrumentação: porta do endpoint Prometheus (vazio desativa) e intervalo
+# de escrita do measurement agent_self no InfluxDB (0 desativa)
+METRICS_PORT = int(os.getenv("METRICS_PORT") or "0")
+METRICS_INFLUX_INTERVAL_SECONDS = int(os.getenv("METRICS_INFLUX_INTERVAL_SECONDS", "0"))
+
+# Ping: "auto" (ICMP nativo com fallback para o comando ping), "native" ou "subprocess"
+PING_MODE = os.getenv("PING_MODE", "auto").lower()
+PING_COUNT = int(os.getenv("PING_COUNT", "4"))
+PING_TIMEOUT_SECONDS = float(os.getenv("PING_TIMEOUT_SECONDS", "5"))
+PING_INTERVAL_SECONDS = float(os.getenv("PING_INTERVAL_SECONDS", "0.2"))
+
+# Arquivo JSON com os sites a testar (vazio usa TEST_SITES)
+SITES_CONFIG_FILE = os.getenv("SITES_CONFIG_FILE", "")
+# Agendamento: "cycle" (todos os sites a cada AGENT_INTERVAL_SECONDS) ou "scheduled"
+# (cada site no seu intervalo e fase, com limites de concorrência)
+SITES_SCHEDULER = os.getenv("SITES_SCHEDULER", "cycle").lower()
+SITES_MAX_CONCURRENCY = int(os.getenv("SITES_MAX_CONCURRENCY", "50"))
+SITES_PER_HOST_CONCURRENCY = int(os.getenv("SITES_PER_HOST_CONCURRENCY", "2"))
+
+# Page load por fase (DNS, conexão, TLS, TTFB, download): "off" (tempo total via requests),
+# "cold" (conexão nova a cada teste), "warm" (conexão keep-alive reaproveitada) ou "both"
+PAGE_LOAD_TIMING = os.getenv("PAGE_LOAD_TIMING", "off").lower()
+
+# Cache de DNS dos alvos: respeita o TTL dos registros, serve entradas vencidas por até
+# DNS_STALE_SECONDS enquanto as renova e pré-resolve os nomes DNS_PREFETCH_SECONDS antes dos testes
+DNS_CACHE = os.getenv("DNS_CACHE", "true").lower() in ("1", "true", "yes")
+# Servidores consultados para obter o TTL (vazio usa /etc/resolv.conf; "system" usa só o getaddrinfo)
+DNS_NAMESERVERS = os.getenv("DNS_NAMESERVERS", "")
+DNS_DEFAULT_TTL_SECONDS = float(os.getenv("DNS_DEFAULT_TTL_SECONDS", "60"))
+DNS_MIN_TTL_SECONDS = float(os.getenv("DNS_MIN_TTL_SECONDS", "5"))
+DNS_MAX_TTL_SECONDS = float(os.getenv("DNS_MAX_TTL_SECONDS", "3600"))
+DNS_STALE_SECONDS = float(os.getenv("DNS_STALE_SECONDS", "300"))
+DNS_PREFETCH_SECONDS = float(os.getenv("DNS_PREFETCH_SECONDS", "2"))
+# Fixa o IP do alvo do ping também no page load, para que os dois testes meçam o mesmo servidor
+DNS_PIN_IPS = os.getenv("DNS_PIN_IPS", "false").lower() in ("1", "true", "yes")
 
 # Sites para testar
 TEST_SITES = [
@@ -51,21 +122,319 @@ required_vars = {
     "INFLUXDB_BUCKET": INFLUXDB_BUCKET
 }
 
+if "influxdb" not in OUTPUT_SINKS:
+    required_vars = {var: value for var, value in required_vars.items() if not var.startswith("INFLUXDB_")}
+if "udp" in OUTPUT_SINKS:
+    required_vars["UDP_SINK_ADDRESS"] = UDP_SINK_ADDRESS or None
+if "file" in OUTPUT_SINKS:
+    required_vars["FILE_SINK_DIR"] = FILE_SINK_DIR or None
+
 missing_vars = [var for var, value in required_vars.items() if value is None]
 if missing_vars:
     raise EnvironmentError(f"Missing environment variables: {', '.join(missing_vars)}")
 
-def ping_test(host, count=4):
+if FILE_SINK_COMPRESSION not in ("gzip", "zstd", "none"):
+    raise EnvironmentError(f"Invalid FILE_SINK_COMPRESSION: {FILE_SINK_COMPRESSION} (use gzip, zstd or none)")
+
+if SITES_SCHEDULER not in ("cycle", "scheduled"):
+    raise EnvironmentError(f"Invalid SITES_SCHEDULER: {SITES_SCHEDULER} (use cycle or scheduled)")
+
+if PAGE_LOAD_TIMING not in ("off", "cold", "warm", "both"):
+    raise EnvironmentError(f"Invalid PAGE_LOAD_TIMING: {PAGE_LOAD_TIMING} (use off, cold, warm or both)")
+
+if DNS_PIN_IPS and not DNS_CACHE:
+    raise EnvironmentError("DNS_PIN_IPS requires DNS_CACHE")
+
+if DNS_PIN_IPS and PAGE_LOAD_TIMING == "off":
+    raise EnvironmentError("DNS_PIN_IPS requires PAGE_LOAD_TIMING (cold, warm or both)")
+
+if AGENT_RUNTIME not in ("full", "slim"):
+    raise EnvironmentError(f"Invalid AGENT_RUNTIME: {AGENT_RUNTIME} (use full or slim)")
+
+# Pacotes das funcionalidades ativadas, procurados sem importá-los:
+# pacote -> (necessário, configuração que o exige, arquivo de requirements/AGENT_FEATURES)
+required_packages = {
+    "influxdb_client": (AGENT_RUNTIME == "full" and "influxdb" in OUTPUT_SINKS, "AGENT_RUNTIME=full", "influxdb"),
+    "requests": (PAGE_LOAD_TIMING == "off", "PAGE_LOAD_TIMING=off", "legacy-timing"),
+    "zstandard": ("file" in OUTPUT_SINKS and FILE_SINK_COMPRESSION == "zstd", "FILE_SINK_COMPRESSION=zstd", "zstd"),
+}
+missing_packages = [f"{name} (needed by {setting}; install requirements-{feature}.txt)"
+                    for name, (needed, setting, feature) in required_packages.items()
+                    if needed and find_spec(name) is None]
+if missing_packages:
+    raise EnvironmentError(f"Missing packages for the configured features: {', '.join(missing_packages)}")
+
+if SITES_CONFIG_FILE:
+    TEST_SITES = load_sites(SITES_CONFIG_FILE, INTERVAL_SECONDS)
+else:
+    # Lista embutida: mesmos padrões de intervalo e fase dos sites carregados do arquivo
+    TEST_SITES = normalize_sites(TEST_SITES, INTERVAL_SECONDS, "TEST_SITES")
+
+# Métricas do próprio agente
+SAVE_SECONDS = metrics.REGISTRY.histogram("agent_save_seconds", "Duration of save_to_influx (point building and queueing)")
+POINTS_BUILT = metrics.REGISTRY.counter("agent_points_built_total", "Points built and queued for InfluxDB")
+CYCLE_SECONDS = metrics.REGISTRY.histogram("agent_cycle_seconds", "Duration of a test cycle")
+CYCLE_OVERRUNS = metrics.REGISTRY.counter("agent_cycle_overruns_total", "Cycles longer than AGENT_INTERVAL_SECONDS")
+SCHEDULE_LAG_SECONDS = metrics.REGISTRY.histogram("agent_schedule_lag_seconds", "Delay between the scheduled and actual start of a site test")
+
+# Escritor persistente do InfluxDB, compartilhado entre os ciclos
+_writer = None
+
+def get_writer():
+    """Retorna o escritor dos pontos (InfluxDB e/ou outros destinos), criando-o e iniciando-o no primeiro uso"""
+    global _writer
+    if _writer is None:
+        def create_influx_writer():
+            spool = None
+            if INFLUXDB_SPOOL_DIR:
+                spool = WriteSpool(
+                    INFLUXDB_SPOOL_DIR,
+                    max_bytes=INFLUXDB_SPOOL_MAX_MB * 1024 * 1024,
+                    max_age_seconds=INFLUXDB_SPOOL_MAX_AGE_HOURS * 3600
+                )
+            if AGENT_RUNTIME == "slim":
+                from common.influx_http import HttpInfluxWriter
+                writer_class = HttpInfluxWriter
+            else:
+                writer_class = InfluxWriter
+            return writer_class(
+                url=INFLUXDB_URL,
+                token=INFLUXDB_TOKEN,
+                org=INFLUXDB_ORG,
+                bucket=INFLUXDB_BUCKET,
+                batch_size=INFLUXDB_BATCH_SIZE,
+                max_pending=INFLUXDB_MAX_PENDING,
+                spool=spool,
+                replay_rate=INFLUXDB_SPOOL_REPLAY_RATE
+            )
+
+        _writer = build_writer(
+            OUTPUT_SINKS,
+            influxdb=create_influx_writer,
+            udp_address=UDP_SINK_ADDRESS,
+            file_dir=FILE_SINK_DIR,
+            file_prefix="agent_sites",
+            file_compression=FILE_SINK_COMPRESSION,
+            file_rotate_bytes=FILE_SINK_ROTATE_MB * 1024 * 1024,
+            file_rotate_seconds=FILE_SINK_ROTATE_SECONDS,
+            file_max_files=FILE_SINK_MAX_FILES,
+            batch_size=INFLUXDB_BATCH_SIZE,
+            max_pending=INFLUXDB_MAX_PENDING
+        )
+        metrics.REGISTRY.add_collector("agent_writer", _writer.stats)
+    return _writer
+
+# Circuit breakers por site, criados no primeiro uso
+breakers = {}
+
+def get_breaker(site):
+    """Circuit breaker do site (None com CIRCUIT_BREAKER_THRESHOLD=0)"""
+    if CIRCUIT_BREAKER_THRESHOLD <= 0:
+        return None
+    breaker = breakers.get(site["name"])
+    if breaker is None:
+        breaker = breakers[site["name"]] = CircuitBreaker(
+            site["name"],
+            failure_threshold=CIRCUIT_BREAKER_THRESHOLD,
+            base_backoff=site.get("interval", INTERVAL_SECONDS),
+            max_backoff=BACKOFF_MAX_SECONDS,
+            jitter=BACKOFF_JITTER
+        )
+    return breaker
+
+def allowed_sites(sites):
+    """Sites que podem ser testados agora (circuito fechado ou chamada de teste)"""
+    allowed = []
+    for site in sites:
+        breaker = get_breaker(site)
+        if breaker is None or breaker.allow():
+            allowed.append(site)
+    return allowed
+
+def skipped_site_results(site):
+    """Resultados de falha de um site pulado pelo circuit breaker (``skipped``), para que a
+    indisponibilidade continue aparecendo como ``success=0`` nos painéis, e não como falta de dados"""
+    results = []
+    if "ping_target" in site:
+        results.append({"test_type": "ping", "site_name": site["name"], "target": site["ping_target"],
+                        "loss": 100.0, "rtt_avg": 0.0, "success": False, "skipped": True})
+    if "page_load_url" in site:
+        if PAGE_LOAD_TIMING == "off":
+            modes = (None,)
+        else:
+            modes = ("cold", "warm") if PAGE_LOAD_TIMING == "both" else (PAGE_LOAD_TIMING,)
+        for mode in modes:
+            result = {"test_type": "page_load", "site_name": site["name"], "url": site["page_load_url"],
+                      "load_time": 0.0, "status_code": 0, "success": False, "skipped": True}
+            if mode is not None:
+                result["connection"] = mode
+            results.append(result)
+    return results
+
+def record_site_results(sites, results):
+    """Atualiza o circuit breaker de cada site: falha quando nenhum teste do site teve sucesso"""
+    if CIRCUIT_BREAKER_THRESHOLD <= 0:
+        return
+    succeeded = {}
+    for result in results:
+        name = result.get("site_name")
+        succeeded[name] = succeeded.get(name, False) or bool(result.get("success"))
+    for site in sites:
+        if site["name"] not in succeeded:
+            continue
+        if succeeded[site["name"]]:
+            get_breaker(site).record_success()
+        else:
+            get_breaker(site).record_failure()
+
+if PING_MODE not in ("auto", "native", "subprocess"):
+    raise EnvironmentError(f"Invalid PING_MODE: {PING_MODE} (use auto, native or subprocess)")
+
+# Prober ICMP em processo; False indica que o socket ICMP não está disponível
+_icmp_prober = None
+
+def get_icmp_prober():
+    """Retorna o prober ICMP nativo, ou None se o modo subprocess deve ser usado"""
+    global _icmp_prober
+    if PING_MODE == "subprocess":
+        return None
+    if _icmp_prober is None:
+        try:
+            _icmp_prober = IcmpProber()
+            print(f"Using native ICMP prober ({_icmp_prober.mode} socket)")
+        except OSError as e:
+            if PING_MODE == "native":
+                raise
+            print(f"Native ICMP unavailable ({str(e)}), falling back to the ping command")
+            _icmp_prober = False
+    return _icmp_prober or None
+
+# Cache de DNS compartilhado pelos testes (None com DNS_CACHE=false)
+_dns_cache = None
+
+def get_dns_cache():
+    """Retorna o cache de DNS, criando-o no primeiro uso"""
+    global _dns_cache
+    if not DNS_CACHE:
+        return None
+    if _dns_cache is None:
+        if DNS_NAMESERVERS.lower() == "system":
+            nameservers = []
+        elif DNS_NAMESERVERS:
+            nameservers = [ns.strip() for ns in DNS_NAMESERVERS.split(",") if ns.strip()]
+        else:
+            nameservers = read_nameservers()
+        _dns_cache = DnsCache(
+            nameservers,
+            default_ttl=DNS_DEFAULT_TTL_SECONDS,
+            min_ttl=DNS_MIN_TTL_SECONDS,
+            max_ttl=DNS_MAX_TTL_SECONDS,
+            stale_seconds=DNS_STALE_SECONDS
+        )
+        metrics.REGISTRY.add_collector("agent_dns_cache", _dns_cache.stats)
+    return _dns_cache
+
+def url_host(url):
+    return urlparse(url).hostname
+
+def site_hosts(site):
+    """Nomes resolvidos nos testes do site"""
+    hosts = []
+    if "ping_target" in site:
+        hosts.append(site["ping_target"])
+    if "page_load_url" in site and not (DNS_PIN_IPS and hosts):
+        hosts.append(url_host(site["page_load_url"]))
+    return hosts
+
+def prefetch_dns(sites, within=0.0):
+    """Pré-resolve em segundo plano os nomes dos sites que vencem nos próximos ``within`` segundos"""
+    cache = get_dns_cache()
+    if cache is None:
+        return []
+    return cache.prefetch([host for site in sites for host in site_hosts(site)], within)
+
+def resolve_site(site):
+    """Resolve pelo cache o alvo do ping do site; retorna ({host: ip}, segundos esperando o DNS)
+
+    Com DNS_PIN_IPS o host da URL recebe o mesmo IP (ou, sem ping, o próprio IP
+    resolvido uma vez), usado por todas as medições de page load do site.
+    """
+    cache = get_dns_cache()
+    if cache is None:
+        return {}, 0.0
+    host = site.get("ping_target")
+    if host is None and DNS_PIN_IPS and "page_load_url" in site:
+        host = url_host(site["page_load_url"])
+    if host is None:
+        return {}, 0.0
+    start = time.perf_counter()
+    try:
+        ip = cache.lookup(host)
+    except OSError as e:
+        print(f"DNS resolution failed for {host}: {str(e)}")
+        return {}, time.perf_counter() - start
+    pins = {host: ip}
+    if DNS_PIN_IPS and "page_load_url" in site:
+        pins[url_host(site["page_load_url"])] = ip
+    return pins, time.perf_counter() - start
+
+def record_probe(probe, seconds, success):
+    """Registra a duração (e a falha) de um teste nas métricas do agente"""
+    metrics.REGISTRY.histogram("agent_probe_seconds", "Duration of each site test", {"probe": probe}).observe(seconds)
+    if not success:
+        metrics.REGISTRY.counter("agent_probe_failures_total", "Failed site tests", {"probe": probe}).inc()
+
+def timed_probe(probe, test, *args, **kwargs):
+    """Executa um teste bloqueante registrando sua duração"""
+    start = time.perf_counter()
+    result = test(*args, **kwargs)
+    record_probe(probe, time.perf_counter() - start, result["success"])
+    return result
+
+def run_native_ping_tests(prober, sites, resolved=None):
+    """Executa os pings de todos os sites num único event loop"""
+    sites = [site for site in sites if "ping_target" in site]
+    if not sites:
+        return []
+    resolved = resolved or {}
+    addresses = [resolved.get(site["name"], ({}, 0.0)) for site in sites]
+    results = prober.run(
+        [site["ping_target"] for site in sites],
+        count=PING_COUNT,
+        timeout=PING_TIMEOUT_SECONDS,
+        interval=PING_INTERVAL_SECONDS,
+        ips=[pins.get(site["ping_target"]) for site, (pins, _) in zip(sites, addresses)]
+    )
+    for site, result, (_, dns_time) in zip(sites, results, addresses):
+        result["dns_time"] = dns_time
+        format_native_ping(site, result)
+    return results
+
+def format_native_ping(site, result):
+    """Adapta o resultado do prober ICMP ao formato dos resultados de teste"""
+    result.pop("rtts", None)
+    record_probe("ping", result.pop("duration", 0.0), result["success"])
+    result["test_type"] = "ping"
+    result["site_name"] = site["name"]
+    print(f"Ping test - Target: {result['target']}, Loss: {result['loss']}%, "
+          f"RTT min/avg/max/mdev: {result['rtt_min']:.2f}/{result['rtt_avg']:.2f}/"
+          f"{result['rtt_max']:.2f}/{result['rtt_mdev']:.2f}ms, Jitter: {result['jitter']:.2f}ms, "
+          f"Success: {result['success']}")
+    return result
+
+def ping_test(host, count=4, ip=None):
     """Realiza o teste de ping e retorna a latência e perda de pacotes"""
+    # Com o IP já resolvido (cache de DNS) o comando não resolve o nome de novo
+    address = ip or host
     # Detect OS and adapt ping command
     if os.name == 'nt': # Windows
-        command = ["ping", "-n", str(count), "-w", "5000", host] # 5 sec timeout
+        command = ["ping", "-n", str(count), "-w", "5000", address] # 5 sec timeout
         loss_keyword = "Lost = "
         loss_index = -1
         rtt_keyword = "Average = "
         rtt_suffix = "ms"
     else: # Linux/macOS
-        command = ["ping", "-c", str(count), "-W", "5", host] # 5 sec timeout
+        command = ["ping", "-c", str(count), "-W", "5", address] # 5 sec timeout
         loss_keyword = "packet loss"
         loss_index = -1
         rtt_keyword = "rtt min/avg/max/mdev ="
@@ -143,6 +512,8 @@ def ping_test(host, count=4):
 
 def page_load_test(url):
     """Testa o tempo de carregamento da página e o código de status HTTP"""
+    import requests
+
     try:
         start_time = time.time()
         response = requests.get(url, headers=HEADERS, timeout=15) # Increased timeout
@@ -165,27 +536,67 @@ def page_load_test(url):
         print(f"Unexpected error during page load test for {url}: {str(e)}")
         return {"url": url, "load_time": 0.0, "status_code": 0, "success": False}
 
+# Medidor de page load por fase, compartilhado entre as threads (mantém o pool keep-alive)
+_page_timer = None
+
+def get_page_timer():
+    """Retorna o medidor de page load por fase, criando-o no primeiro uso"""
+    global _page_timer
+    if _page_timer is None:
+        _page_timer = PageTimer(
+            # Mesma negociação de compressão do requests, para medir os mesmos bytes
+            headers=dict(HEADERS, **{'accept-encoding': 'gzip, deflate'}),
+            timeout=15,
+            pool=PAGE_LOAD_TIMING != "cold",
+            resolver=get_dns_cache().lookup if DNS_CACHE else None
+        )
+    return _page_timer
+
+def run_page_load_tests(url, pins=None):
+    """Executa o(s) teste(s) de page load da URL conforme PAGE_LOAD_TIMING (``pins``: IPs fixados por host)"""
+    if PAGE_LOAD_TIMING == "off":
+        return [timed_probe("page_load", page_load_test, url)]
+
+    timer = get_page_timer()
+    # No modo "both" a medição warm reaproveita a conexão aberta pela medição cold
+    modes = ("cold", "warm") if PAGE_LOAD_TIMING == "both" else (PAGE_LOAD_TIMING,)
+    results = []
+    for mode in modes:
+        result = timed_probe("page_load", timer.measure, url, warm=mode == "warm", pinned=pins)
+        if result["status_code"]:
+            print(f"Page load test ({mode}) - URL: {url}, Time: {result['load_time']:.3f}s, "
+                  f"DNS/connect/TLS/TTFB/download: {result['dns_time'] * 1000:.1f}/"
+                  f"{result['connect_time'] * 1000:.1f}/{result['tls_time'] * 1000:.1f}/"
+                  f"{result['ttfb'] * 1000:.1f}/{result['download_time'] * 1000:.1f}ms, "
+                  f"Bytes: {result['bytes']}, Status: {result['status_code']}")
+        results.append(result)
+    return results
+
 # Função auxiliar para executar testes de um único site (para threading)
-def test_single_site(site_config, results_list):
+def test_single_site(site_config, results_list, run_ping=True, resolved=None):
     site_name = site_config["name"]
     print(f"-- [Thread] Testing site: {site_name} --")
     site_results = [] # Resultados para este site específico
-
-    # Teste de ping
-    if "ping_target" in site_config:
-        ping_result = ping_test(site_config["ping_target"])
-        ping_result["test_type"] = "ping"
-        ping_result["site_name"] = site_name
-        site_results.append(ping_result)
-    else:
-        print(f"Skipping ping test for {site_name} (no target defined)")
+    pins, dns_time = resolved or ({}, 0.0)
+
+    # Teste de ping (quando não é feito pelo prober ICMP nativo)
+    if run_ping:
+        if "ping_target" in site_config:
+            target = site_config["ping_target"]
+            ping_result = timed_probe("ping", ping_test, target, ip=pins.get(target))
+            ping_result["dns_time"] = dns_time
+            ping_result["test_type"] = "ping"
+            ping_result["site_name"] = site_name
+            site_results.append(ping_result)
+        else:
+            print(f"Skipping ping test for {site_name} (no target defined)")
 
     # Teste de carregamento de página
     if "page_load_url" in site_config:
-        page_load_result = page_load_test(site_config["page_load_url"])
-        page_load_result["test_type"] = "page_load"
-        page_load_result["site_name"] = site_name
-        site_results.append(page_load_result)
+        for page_load_result in run_page_load_tests(site_config["page_load_url"], pins if DNS_PIN_IPS else None):
+            page_load_result["test_type"] = "page_load"
+            page_load_result["site_name"] = site_name
+            site_results.append(page_load_result)
     else:
          print(f"Skipping page load test for {site_name} (no URL defined)")
 
@@ -199,111 +610,255 @@ def run_network_tests_concurrent():
     print("Running network tests concurrently...")
     threads = []
     all_results = [] # Lista para coletar resultados de todas as threads
-
-    for site in TEST_SITES:
+    prober = get_icmp_prober()
+    # Sites com o circuito aberto ficam fora deste ciclo
+    sites = allowed_sites(TEST_SITES)
+    if len(sites) < len(TEST_SITES):
+        print(f"Skipping {len(TEST_SITES) - len(sites)} sites with an open circuit breaker")
+        for site in TEST_SITES:
+            if site not in sites:
+                all_results.extend(skipped_site_results(site))
+
+    # Resolve os alvos uma vez por ciclo (o ping e o page load de um site usam o mesmo resultado);
+    # os nomes ainda sem cache começam a ser resolvidos em paralelo e as consultas esperam por eles
+    prefetch_dns(sites)
+    resolved = {site["name"]: resolve_site(site) for site in sites}
+
+    for site in sites:
         # Cria e inicia uma thread para cada site
-        thread = threading.Thread(target=test_single_site, args=(site, all_results))
+        thread = threading.Thread(target=test_single_site,
+                                  args=(site, all_results, prober is None, resolved[site["name"]]))
         threads.append(thread)
         thread.start()
 
+    # Com o ICMP nativo os pings de todos os sites rodam aqui, em paralelo às threads
+    if prober is not None:
+        try:
+            all_results.extend(run_native_ping_tests(prober, sites, resolved))
+        except Exception as e:
+            print(f"Native ping tests failed: {str(e)}")
+
     # Espera todas as threads terminarem
     print(f"Waiting for {len(threads)} test threads to complete...")
     for thread in threads:
         thread.join()
     print("All test threads completed.")
 
+    record_site_results(sites, all_results)
     return all_results
 
+# Threads para os testes bloqueantes (page load e ping via subprocess) do modo agendado
+_executor = None
+
+async def run_site_tests(site):
+    """Executa os testes de um site no modo agendado"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SITES_MAX_CONCURRENCY, thread_name_prefix="site-test")
+    loop = asyncio.get_running_loop()
+    site_results = []
+    breaker = get_breaker(site)
+    if breaker is not None and not breaker.allow():
+        return skipped_site_results(site)
+
+    # Normalmente já pré-resolvido pelo agendador (prepare_site), então não espera pelo DNS
+    pins, dns_time = await loop.run_in_executor(_executor, resolve_site, site)
+
+    if "ping_target" in site:
+        target = site["ping_target"]
+        prober = get_icmp_prober()
+        if prober is not None:
+            result = await prober.probe(
+                target,
+                count=PING_COUNT,
+                timeout=PING_TIMEOUT_SECONDS,
+                interval=PING_INTERVAL_SECONDS,
+                ip=pins.get(target)
+            )
+            result["dns_time"] = dns_time
+            site_results.append(format_native_ping(site, result))
+        else:
+            result = await loop.run_in_executor(_executor, functools.partial(
+                timed_probe, "ping", ping_test, target, ip=pins.get(target)))
+            result["dns_time"] = dns_time
+            result["test_type"] = "ping"
+            result["site_name"] = site["name"]
+            site_results.append(result)
+
+    if "page_load_url" in site:
+        results = await loop.run_in_executor(_executor, run_page_load_tests, site["page_load_url"],
+                                             pins if DNS_PIN_IPS else None)
+        for result in results:
+            result["test_type"] = "page_load"
+            result["site_name"] = site["name"]
+            site_results.append(result)
+
+    record_site_results([site], site_results)
+    return site_results
+
+def prepare_site(site):
+    """Pré-resolve, antes do horário do site, os nomes que vencem até o teste"""
+    prefetch_dns([site], DNS_PREFETCH_SECONDS * 2)
+
+def run_scheduled(writer):
+    """Modo agendado: cada site no seu intervalo e fase, até o agente ser encerrado"""
+    scheduler = SiteScheduler(
+        TEST_SITES,
+        run_site_tests,
+        save_to_influx,
+        global_concurrency=SITES_MAX_CONCURRENCY,
+        per_host_concurrency=SITES_PER_HOST_CONCURRENCY,
+        report_interval=INTERVAL_SECONDS,
+        lag_histogram=SCHEDULE_LAG_SECONDS,
+        prepare=prepare_site if DNS_CACHE else None,
+        prepare_lead=DNS_PREFETCH_SECONDS
+    )
+    metrics.REGISTRY.add_collector("agent_scheduler", scheduler.stats)
+
+    async def report_writer():
+        while True:
+            await asyncio.sleep(INTERVAL_SECONDS)
+            print(writer.stats_line())
+            write_self_metrics()
+
+    async def main():
+        reporter = asyncio.ensure_future(report_writer())
+        try:
+            await scheduler.run()
+        finally:
+            reporter.cancel()
+
+    try:
+        asyncio.run(main())
+    finally:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+
+# Instante (monotônico) da última escrita do measurement agent_self
+_last_self_metrics = float("-inf")
+
+def write_self_metrics():
+    """Escreve as métricas do agente no InfluxDB (measurement agent_self), no máximo uma vez por intervalo"""
+    global _last_self_metrics
+    if METRICS_INFLUX_INTERVAL_SECONDS <= 0:
+        return
+    now = time.monotonic()
+    if now - _last_self_metrics >= METRICS_INFLUX_INTERVAL_SECONDS:
+        _last_self_metrics = now
+        get_writer().submit(metrics.REGISTRY.to_lines("agent_self", {"agent": "agent_sites"}))
+
 def save_to_influx(test_results):
     """Salva os resultados dos testes de rede no InfluxDB usando BATCHING"""
     if not test_results:
         print("No network test results to save.")
         return
+    # Nos sites a "coleta" é o primeiro lote de resultados de teste
+    startup.mark("first_fetch")
+    with SAVE_SECONDS.time():
+        _save_results(test_results)
 
-    # Configura opções de BATCHING
-    write_options = WriteOptions(
-        batch_size=50, # Tamanho menor de batch para testes de site
-        flush_interval=5_000, # 5 segundos
-        jitter_interval=2_000,
-        retry_interval=5_000
-    )
+def _save_results(test_results):
 
-    try:
-        with InfluxDBClient(url=INFLUXDB_URL, token=INFLUXDB_TOKEN, org=INFLUXDB_ORG) as client:
-            buckets_api = client.buckets_api()
-            if not buckets_api.find_bucket_by_name(INFLUXDB_BUCKET):
-                print(f"Bucket '{INFLUXDB_BUCKET}' not found. Please create it.")
-                return
-
-            # Usa as opções de BATCHING
-            write_api = client.write_api(write_options=write_options)
-            records = []
-            now = datetime.utcnow() # Pega o timestamp uma vez para todos os pontos do ciclo
-
-            for test in test_results:
-                try:
-                    point = Point("network_tests") \
-                        .tag("site", test["site_name"]) \
-                        .tag("test_type", test["test_type"]) \
-                        .time(now) # Usa o mesmo timestamp
-
-                    if test["test_type"] == "ping":
-                        point.tag("target", test["target"]) \
-                             .field("loss", float(test["loss"])) \
-                             .field("rtt_avg", float(test["rtt_avg"])) \
-                             .field("success", float(test["success"])) # Converte bool para float
-                    elif test["test_type"] == "page_load":
-                        point.tag("url", test["url"]) \
-                             .field("load_time", float(test["load_time"])) \
-                             .field("status_code", int(test["status_code"])) \
-                             .field("success", float(test["success"])) # Converte bool para float
-
-                    records.append(point)
-
-                except Exception as test_error:
-                    print(f"Error processing test result for {test.get('site_name', 'unknown')} ({test.get('test_type', 'unknown')}): {str(test_error)}")
-                    continue
-
-            if records:
-                print(f"Writing {len(records)} network test points to InfluxDB via BATCHING...")
-                write_api.write(bucket=INFLUXDB_BUCKET, org=INFLUXDB_ORG, record=records)
-                print(f"Batch write initiated for {len(records)} points.")
-            else:
-                print("No valid network test records prepared to write")
+    records = []
+    now = datetime.utcnow() # Pega o timestamp uma vez para todos os pontos do ciclo
 
-            # Garante que o buffer de escrita seja esvaziado ao final
-            print("Flushing write buffer...")
-            write_api.flush()
-            print("Write buffer flushed.")
+    for test in test_results:
+        try:
+            # Mesma linha que o Point("network_tests") geraria, sem depender do influxdb_client
+            tags = {"site": test["site_name"], "test_type": test["test_type"]}
+            fields = {}
+
+            if test["test_type"] == "ping":
+                tags["target"] = test["target"]
+                fields["loss"] = float(test["loss"])
+                fields["rtt_avg"] = float(test["rtt_avg"])
+                fields["success"] = float(test["success"]) # Converte bool para float
+                # Estatísticas adicionais do prober ICMP nativo e tempo de espera pelo DNS
+                for key in ("rtt_min", "rtt_max", "rtt_mdev", "jitter", "dns_time"):
+                    if key in test:
+                        fields[key] = float(test[key])
+            elif test["test_type"] == "page_load":
+                tags["url"] = test["url"]
+                fields["load_time"] = float(test["load_time"])
+                fields["status_code"] = int(test["status_code"])
+                fields["success"] = float(test["success"]) # Converte bool para float
+                # Fases do page load (PAGE_LOAD_TIMING), separadas por conexão cold/warm
+                if "connection" in test:
+                    tags["connection"] = test["connection"]
+                for key in PHASES:
+                    if key in test:
+                        fields[key] = float(test[key])
+                if "bytes" in test:
+                    fields["bytes"] = int(test["bytes"])
+                    fields["reused"] = float(test["reused"])
+            # Teste não executado (circuit breaker aberto), gravado como falha
+            if test.get("skipped"):
+                fields["skipped"] = 1.0
+
+            line = format_line("network_tests", tags, fields, now) # Usa o mesmo timestamp
+            if line:
+                records.append(line)
+
+        except Exception as test_error:
+            print(f"Error processing test result for {test.get('site_name', 'unknown')} ({test.get('test_type', 'unknown')}): {str(test_error)}")
+            continue
+
+    if records:
+        print(f"Queueing {len(records)} network test points for InfluxDB...")
+        # Entrega os pontos ao escritor persistente, sem bloquear o ciclo de testes
+        get_writer().submit(records)
+        POINTS_BUILT.inc(len(records))
+    else:
+        print("No valid network test records prepared to write")
 
-    except Exception as e:
-        print(f"Error connecting to or writing to InfluxDB: {str(e)}")
 
 if __name__ == "__main__":
+    startup.mark("imports")
     print("Starting Network Sites Monitoring Agent (with Batching and Threading)")
-    print(f"Config: InfluxDB={INFLUXDB_URL}, Interval={INTERVAL_SECONDS}s")
+    print(f"Config: InfluxDB={INFLUXDB_URL}, Interval={INTERVAL_SECONDS}s, Runtime={AGENT_RUNTIME}")
     print(f"Testing Sites: {', '.join([s['name'] for s in TEST_SITES])}")
+    print(f"Scheduler: {SITES_SCHEDULER}")
 
-    while True:
-        start_time = time.time()
-        print(f"Network Test Cycle started at {datetime.now().isoformat()}")
-
-        results = [] # Initialize results
-        try:
-            # Chama a função concorrente
-            results = run_network_tests_concurrent()
-
-            if results:
-                save_to_influx(results)
-            else:
-                 print("Skipping InfluxDB write as no test results were generated.")
+    writer = get_writer()
+    if METRICS_PORT:
+        metrics.serve(metrics.REGISTRY, METRICS_PORT)
+        print(f"Serving agent metrics on :{METRICS_PORT}/metrics")
+    try:
+        if SITES_SCHEDULER == "scheduled":
+            run_scheduled(writer)
+        else:
+            # Ciclos em horários fixos no relógio monotônico (ver FixedRateTicker)
+            ticker = FixedRateTicker("agent_sites")
+            while True:
+                start_time = time.monotonic()
+                print(f"Network Test Cycle started at {datetime.now().isoformat()}")
 
-        except Exception as e:
-            print(f"Critical error in Sites main loop: {str(e)}")
-            # Optionally add more robust error handling/logging here
-
-        # Calcula o tempo restante para o próximo ciclo
-        elapsed = time.time() - start_time
-        sleep_time = max(0, INTERVAL_SECONDS - elapsed)
-        print(f"Network Test Cycle completed in {elapsed:.2f}s. Next run in {sleep_time:.2f}s")
-        time.sleep(sleep_time)
\ No newline at end of file
+                results = [] # Initialize results
+                try:
+                    # Chama a função concorrente
+                    results = run_network_tests_concurrent()
+
+                    if results:
+                        save_to_influx(results)
+                    else:
+                         print("Skipping InfluxDB write as no test results were generated.")
+
+                except Exception as e:
+                    print(f"Critical error in Sites main loop: {str(e)}")
+                    # Optionally add more robust error handling/logging here
+
+                # Calcula o tempo restante para o próximo horário da grade
+                elapsed = time.monotonic() - start_time
+                sleep_time = ticker.next_delay(INTERVAL_SECONDS)
+                CYCLE_SECONDS.observe(elapsed)
+                if elapsed > INTERVAL_SECONDS:
+                    CYCLE_OVERRUNS.inc()
+                write_self_metrics()
+                # Renova em segundo plano os nomes que vencem antes do próximo ciclo
+                prefetch_dns(TEST_SITES, sleep_time + DNS_PREFETCH_SECONDS)
+                print(f"Network Test Cycle completed in {elapsed:.2f}s. Next run in {sleep_time:.2f}s")
+                print(writer.stats_line())
+                time.sleep(sleep_time)
+    finally:
+        # Esvazia a fila pendente antes de encerrar o agente
+        writer.close()
@@ -0,0 +1,265 @@
+import ipaddress
+import random
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from common import metrics
+
+_TYPE_A = 1
+_CLASS_IN = 1
+_RCODE_NXDOMAIN = 3
+
+DNS_SECONDS = metrics.REGISTRY.histogram("agent_dns_seconds", "Duration of DNS resolutions made by the cache")
+
+
+class DnsResponseError(OSError):
+    """Resposta da consulta que não pode ser usada (truncada ou malformada)."""
+
+
+def read_nameservers(path="/etc/resolv.conf"):
+    """Servidores IPv4 listados em ``resolv.conf`` (lista vazia se o arquivo não existir)."""
+    nameservers = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == "nameserver" and "." in parts[1]:
+                    nameservers.append(parts[1])
+    except OSError:
+        pass
+    return nameservers
+
+
+def build_query(host, query_id):
+    """Consulta DNS (tipo A, recursão desejada) para ``host``."""
+    qname = b"".join(bytes([len(label)]) + label for label in host.rstrip(".").encode("idna").split(b"."))
+    return struct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0) + qname + b"\x00" + struct.pack("!HH", _TYPE_A, _CLASS_IN)
+
+
+def _skip_name(data, offset):
+    # Pula um nome (sequência de rótulos ou ponteiro de compressão) e retorna o offset seguinte
+    while True:
+        length = data[offset]
+        if length >= 0xC0:
+            return offset + 2
+        offset += 1
+        if length == 0:
+            return offset
+        offset += length
+
+
+def parse_response(data, query_id):
+    """Extrai ``(endereços, ttl)`` dos registros A da resposta.
+
+    O TTL é o menor da cadeia (CNAMEs incluídos), como um resolvedor faria
+    ao guardar a resposta. Levanta ``socket.gaierror`` para NXDOMAIN/erros do
+    servidor, ``DnsResponseError`` para respostas truncadas (bit TC) ou
+    malformadas e ``ValueError`` para respostas que não são desta consulta.
+    """
+    if len(data) < 12:
+        raise DnsResponseError("malformed DNS response")
+    response_id, flags, questions, answers = struct.unpack_from("!HHHH", data)
+    if response_id != query_id or not flags & 0x8000:
+        raise ValueError("DNS response does not match the query")
+    if flags & 0x0200:
+        raise DnsResponseError("truncated DNS response")
+    rcode = flags & 0x000F
+    if rcode:
+        raise socket.gaierror(socket.EAI_NONAME if rcode == _RCODE_NXDOMAIN else socket.EAI_FAIL,
+                              f"DNS rcode {rcode}")
+
+    offset = 12
+    addresses = []
+    ttl = None
+    try:
+        for _ in range(questions):
+            offset = _skip_name(data, offset) + 4
+        for _ in range(answers):
+            offset = _skip_name(data, offset)
+            rtype, rclass, record_ttl, length = struct.unpack_from("!HHIH", data, offset)
+            offset += 10
+            if offset + length > len(data):
+                raise DnsResponseError("malformed DNS response")
+            if rclass == _CLASS_IN:
+                ttl = record_ttl if ttl is None else min(ttl, record_ttl)
+                if rtype == _TYPE_A and length == 4:
+                    addresses.append(socket.inet_ntoa(data[offset:offset + 4]))
+            offset += length
+    except (IndexError, struct.error):
+        raise DnsResponseError("malformed DNS response")
+    if not addresses:
+        raise socket.gaierror(socket.EAI_NODATA, "no A records in the DNS response")
+    return addresses, ttl
+
+
+def query_a(host, nameserver, timeout=2.0):
+    """Consulta os registros A de ``host`` em ``nameserver`` (``ip`` ou ``ip:porta``) via UDP.
+
+    Retorna ``(endereços, ttl)``. Respostas de outras consultas são ignoradas
+    até o timeout; uma resposta truncada ou malformada falha na hora com
+    ``DnsResponseError``, sem esperar o timeout.
+    """
+    address, _, port = nameserver.partition(":")
+    query_id = random.getrandbits(16)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect((address, int(port or 53)))
+        sock.send(build_query(host, query_id))
+        deadline = time.monotonic() + timeout
+        while True:
+            data = sock.recv(512)
+            try:
+                return parse_response(data, query_id)
+            except ValueError:
+                # Resposta atrasada de outra consulta: continua esperando até o timeout
+                if time.monotonic() >= deadline:
+                    raise socket.timeout("no valid DNS response")
+
+
+class DnsCache:
+    """Cache de resolução de nomes (IPv4) que respeita o TTL dos registros.
+
+    Os nomes são resolvidos com uma consulta A direta aos ``nameservers`` (o
+    ``getaddrinfo`` não informa o TTL); se ela falhar, ou se o nome não existir
+    no DNS (ex: ``/etc/hosts``), cai para o resolvedor do sistema com
+    ``default_ttl``. O TTL fica limitado a [``min_ttl``, ``max_ttl``].
+
+    Uma entrada vencida continua sendo servida por até ``stale_seconds``
+    enquanto é renovada em segundo plano (stale-while-revalidate), então o
+    teste nunca espera pelo DNS depois da primeira resolução; se a renovação
+    falhar, o endereço antigo segue valendo até o fim dessa janela. Resoluções
+    simultâneas do mesmo nome são feitas uma única vez. ``prefetch`` renova
+    antecipadamente os nomes que vão vencer antes do próximo teste.
+    """
+
+    def __init__(self, nameservers=(), default_ttl=60.0, min_ttl=5.0, max_ttl=3600.0, stale_seconds=300.0,
+                 timeout=2.0, refresh_workers=4, clock=time.monotonic):
+        self.nameservers = list(nameservers)
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.stale_seconds = stale_seconds
+        self.timeout = timeout
+        self.clock = clock
+        self._entries = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="dns-refresh")
+
+        # Métricas do cache
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def _query(self, host):
+        # Consulta direta (com TTL) e, se não resolver, o resolvedor do sistema
+        for nameserver in self.nameservers:
+            try:
+                return query_a(host, nameserver, self.timeout)
+            except (socket.gaierror, DnsResponseError):
+                # Nome inexistente ou resposta que não cabe no UDP: o resolvedor do sistema decide
+                break
+            except OSError:
+                continue
+        infos = socket.getaddrinfo(host, None, family=socket.AF_INET, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        return addresses, self.default_ttl
+
+    def _resolve(self, host):
+        # Resolve e guarda ``host``; quem chega durante uma resolução em andamento espera por ela
+        with self._lock:
+            future = self._pending.get(host)
+            owner = future is None
+            if owner:
+                future = self._pending[host] = Future()
+        if not owner:
+            return future.result()
+
+        start = time.perf_counter()
+        try:
+            addresses, ttl = self._query(host)
+            ttl = min(max(ttl, self.min_ttl), self.max_ttl)
+            with self._lock:
+                self._entries[host] = (addresses, self.clock() + ttl)
+            future.set_result(addresses)
+            return addresses
+        except Exception as e:
+            self.errors += 1
+            future.set_exception(e)
+            raise
+        finally:
+            DNS_SECONDS.observe(time.perf_counter() - start)
+            with self._lock:
+                self._pending.pop(host, None)
+
+    def _refresh(self, host):
+        try:
+            self._resolve(host)
+        except Exception as e:
+            print(f"DNS refresh failed for {host}: {str(e)}")
+
+    def _refresh_later(self, host):
+        with self._lock:
+            if host in self._pending:
+                return None
+        self.refreshes += 1
+        return self._executor.submit(self._refresh, host)
+
+    def lookup(self, host):
+        """Endereço IPv4 de ``host``, do cache quando possível (bloqueia só sem entrada utilizável)."""
+        try:
+            ipaddress.IPv4Address(host)
+            return host
+        except ValueError:
+            pass
+
+        entry = self._entries.get(host)
+        now = self.clock()
+        if entry is not None and now < entry[1]:
+            self.hits += 1
+            return entry[0][0]
+        if entry is not None and now < entry[1] + self.stale_seconds:
+            self.stale_hits += 1
+            self._refresh_later(host)
+            return entry[0][0]
+        self.misses += 1
+        return self._resolve(host)[0]
+
+    def prefetch(self, hosts, within=0.0):
+        """Renova em segundo plano os nomes sem entrada ou que vencem nos próximos ``within`` segundos.
+
+        Retorna os futures das renovações iniciadas.
+        """
+        deadline = self.clock() + within
+        futures = []
+        for host in dict.fromkeys(hosts):
+            entry = self._entries.get(host)
+            if entry is not None and entry[1] > deadline:
+                continue
+            try:
+                ipaddress.IPv4Address(host)
+                continue
+            except ValueError:
+                pass
+            future = self._refresh_later(host)
+            if future is not None:
+                futures.append(future)
+        return futures
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+        }
@@ -0,0 +1,178 @@
+import http.client
+import socket
+import ssl
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+REDIRECT_STATUS = (301, 302, 303, 307, 308)
+PHASES = ("dns_time", "connect_time", "tls_time", "ttfb", "download_time")
+
+# Erros de uma conexão do pool que o servidor já fechou: refaz a requisição numa nova
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                 ConnectionResetError, BrokenPipeError)
+
+
+class PageTimer:
+    """Mede o page load por fase: DNS, conexão TCP, handshake TLS, TTFB e download.
+
+    Cada fase é medida com ``time.perf_counter`` em torno da própria operação
+    (``getaddrinfo``, ``connect``, handshake, envio até os cabeçalhos da
+    resposta, leitura do corpo). Redirecionamentos são seguidos e as fases de
+    cada salto são somadas.
+
+    Em medições ``warm`` a requisição reaproveita uma conexão keep-alive do
+    pool (DNS, conexão e TLS ficam zerados), isolando a latência do servidor;
+    em medições ``cold`` abre sempre uma conexão nova. Com ``pool=True`` as
+    conexões ficam abertas para a próxima medição ``warm``.
+
+    ``resolver(host)`` (ex: ``DnsCache.lookup``) substitui o ``getaddrinfo`` na
+    fase de DNS. Em ``measure``, ``pinned`` ({host: ip}) conecta os hosts
+    indicados a um IP fixo, mantendo o nome no SNI e no cabeçalho Host.
+    """
+
+    def __init__(self, headers=None, timeout=15.0, ssl_context=None, pool=True, max_idle_per_host=2,
+                 max_redirects=5, resolver=None):
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.pool = pool
+        self.max_idle_per_host = max_idle_per_host
+        self.max_redirects = max_redirects
+        self.resolver = resolver
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def _checkout(self, key):
+        with self._lock:
+            conns = self._idle.get(key)
+            return conns.pop() if conns else None
+
+    def _checkin(self, key, conn):
+        with self._lock:
+            conns = self._idle.setdefault(key, [])
+            if len(conns) < self.max_idle_per_host:
+                conns.append(conn)
+                return
+        conn.close()
+
+    def _connect(self, scheme, host, port, timings, ip=None):
+        start = time.perf_counter()
+        if ip is None and self.resolver is not None:
+            ip = self.resolver(host)
+        if ip is not None:
+            family = socket.AF_INET6 if ":" in ip else socket.AF_INET
+            socktype, proto, address = socket.SOCK_STREAM, 0, (ip, port)
+        else:
+            family, socktype, proto, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+        resolved = time.perf_counter()
+        timings["dns_time"] += resolved - start
+
+        sock = socket.socket(family, socktype, proto)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(address)
+            connected = time.perf_counter()
+            timings["connect_time"] += connected - resolved
+            if scheme == "https":
+                sock = self.ssl_context.wrap_socket(sock, server_hostname=host)
+                timings["tls_time"] += time.perf_counter() - connected
+        except Exception:
+            sock.close()
+            raise
+
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        conn.sock = sock
+        return conn
+
+    def _get(self, url, warm, timings, pinned=None):
+        """Uma requisição GET (sem seguir redirecionamentos); retorna (resposta, reutilizou)."""
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported URL scheme: {url}")
+        port = parts.port or (443 if scheme == "https" else 80)
+        ip = pinned.get(parts.hostname) if pinned else None
+        # Conexões com IP fixo ficam separadas no pool das resolvidas normalmente
+        key = (scheme, parts.hostname, port, ip)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+        conn = self._checkout(key) if warm else None
+        while True:
+            reused = conn is not None
+            if conn is None:
+                conn = self._connect(scheme, parts.hostname, port, timings, ip)
+            try:
+                sent = time.perf_counter()
+                conn.request("GET", path, headers=self.headers)
+                response = conn.getresponse()
+                first_byte = time.perf_counter()
+                size = 0
+                while True:
+                    chunk = response.read(65536)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+            except _STALE_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                conn = None
+                continue
+            except Exception:
+                conn.close()
+                raise
+            timings["ttfb"] += first_byte - sent
+            timings["download_time"] += time.perf_counter() - first_byte
+            timings["bytes"] += size
+
+            if self.pool and not response.will_close:
+                self._checkin(key, conn)
+            else:
+                conn.close()
+            return response, reused
+
+    def measure(self, url, warm=False, pinned=None):
+        """Mede o carregamento de ``url``; ``warm`` reaproveita uma conexão do pool."""
+        timings = dict.fromkeys(PHASES, 0.0)
+        timings["bytes"] = 0
+        result = {"url": url, "connection": "warm" if warm else "cold"}
+        start = time.perf_counter()
+        try:
+            current = url
+            redirects = 0
+            reused = False
+            while True:
+                response, reused_now = self._get(current, warm, timings, pinned)
+                reused = reused or reused_now
+                location = response.getheader("Location")
+                if response.status not in REDIRECT_STATUS or not location or redirects >= self.max_redirects:
+                    break
+                current = urljoin(current, location)
+                redirects += 1
+
+            result.update(timings)
+            result.update({
+                "load_time": time.perf_counter() - start,
+                "status_code": response.status,
+                "success": 200 <= response.status < 300,
+                "redirects": redirects,
+                "reused": reused,
+            })
+        except socket.timeout:
+            print(f"Page load test timeout for {url}")
+            result.update({"load_time": 0.0, "status_code": 0, "success": False})
+        except Exception as e:
+            print(f"Page load test failed for {url}: {str(e)}")
+            result.update({"load_time": 0.0, "status_code": 0, "success": False})
+        return result
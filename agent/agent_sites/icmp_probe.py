@@ -0,0 +1,181 @@
+import asyncio
+import math
+import os
+import socket
+import struct
+import time
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+
+def open_icmp_socket():
+    """Abre um socket ICMP não bloqueante.
+
+    Tenta primeiro o socket de datagrama sem privilégios (exige que o GID do
+    processo esteja em ``net.ipv4.ping_group_range``) e depois o socket raw
+    (exige CAP_NET_RAW). Retorna ``(socket, raw)`` ou levanta ``OSError``.
+    """
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        raw = False
+    except OSError:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        raw = True
+    sock.setblocking(False)
+    return sock, raw
+
+
+def checksum(data):
+    """Checksum da internet (RFC 1071)."""
+    if len(data) % 2:
+        data += b"\x00"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def summarize_rtts(rtts, count):
+    """Estatísticas no formato do ``ping``: perda, min/avg/max/mdev e jitter (ms)."""
+    received = [rtt for rtt in rtts if rtt is not None]
+    loss = 100.0 * (count - len(received)) / count if count else 100.0
+    if not received:
+        return {"loss": loss, "rtt_min": 0.0, "rtt_avg": 0.0, "rtt_max": 0.0,
+                "rtt_mdev": 0.0, "jitter": 0.0, "success": False}
+    avg = sum(received) / len(received)
+    mdev = math.sqrt(max(0.0, sum(rtt * rtt for rtt in received) / len(received) - avg * avg))
+    # Jitter: média das diferenças absolutas entre RTTs consecutivos
+    diffs = [abs(b - a) for a, b in zip(received, received[1:])]
+    jitter = sum(diffs) / len(diffs) if diffs else 0.0
+    return {"loss": loss, "rtt_min": min(received), "rtt_avg": avg, "rtt_max": max(received),
+            "rtt_mdev": mdev, "jitter": jitter, "success": True}
+
+
+class IcmpProber:
+    """Prober ICMP em processo: vários alvos num único event loop e num único socket.
+
+    Cada echo request recebe um número de sequência único; as respostas são
+    associadas à requisição por (IP de origem, sequência), sem processos
+    filhos nem parse da saída do ``ping``.
+    """
+
+    def __init__(self):
+        self._sock, self._raw = open_icmp_socket()
+        # Em sockets de datagrama o kernel substitui o identificador pela porta local
+        self._ident = os.getpid() & 0xFFFF
+        self._seq = 0
+        self._waiters = {}
+        # Event loop em que o socket está registrado para leitura
+        self._reader_loop = None
+
+    @property
+    def mode(self):
+        return "raw" if self._raw else "dgram"
+
+    def close(self):
+        self.detach()
+        self._sock.close()
+
+    def attach(self, loop):
+        """Registra o socket para leitura em ``loop`` (o prober atende um loop por vez)."""
+        if self._reader_loop is loop:
+            return
+        self.detach()
+        loop.add_reader(self._sock.fileno(), self._on_readable)
+        self._reader_loop = loop
+
+    def detach(self):
+        loop, self._reader_loop = self._reader_loop, None
+        if loop is not None and not loop.is_closed():
+            loop.remove_reader(self._sock.fileno())
+
+    def _next_seq(self):
+        self._seq = (self._seq + 1) & 0xFFFF
+        return self._seq
+
+    def _packet(self, seq):
+        payload = struct.pack("!d", time.time()) + b"\x00" * 48
+        header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, self._ident, seq)
+        header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, checksum(header + payload), self._ident, seq)
+        return header + payload
+
+    def _on_readable(self):
+        while True:
+            try:
+                data, addr = self._sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                print(f"Error reading ICMP socket: {str(e)}")
+                return
+            received_at = time.perf_counter()
+            if self._raw:
+                # O socket raw entrega o cabeçalho IP junto
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < 8:
+                continue
+            icmp_type, _, _, ident, seq = struct.unpack("!BBHHH", data[:8])
+            if icmp_type != ICMP_ECHO_REPLY or (self._raw and ident != self._ident):
+                continue
+            waiter = self._waiters.pop((addr[0], seq), None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(received_at)
+
+    async def _echo(self, ip, delay, timeout):
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(delay)
+        seq = self._next_seq()
+        waiter = loop.create_future()
+        self._waiters[(ip, seq)] = waiter
+        sent_at = time.perf_counter()
+        try:
+            self._sock.sendto(self._packet(seq), (ip, 0))
+            received_at = await asyncio.wait_for(waiter, timeout)
+            return (received_at - sent_at) * 1000.0
+        except (asyncio.TimeoutError, OSError):
+            return None
+        finally:
+            self._waiters.pop((ip, seq), None)
+
+    async def probe(self, host, count=4, timeout=5.0, interval=0.2, ip=None):
+        """Envia ``count`` echo requests a ``host`` e retorna as estatísticas."""
+        loop = asyncio.get_running_loop()
+        self.attach(loop)
+        start = time.perf_counter()
+        if ip is None:
+            infos = await loop.getaddrinfo(host, None, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            ip = infos[0][4][0]
+        rtts = await asyncio.gather(*(self._echo(ip, i * interval, timeout) for i in range(count)))
+        result = {"target": host, "ip": ip, "rtts": rtts, "duration": time.perf_counter() - start}
+        result.update(summarize_rtts(rtts, count))
+        return result
+
+    async def probe_many(self, hosts, count=4, timeout=5.0, interval=0.2, ips=None):
+        """Testa todos os alvos concorrentemente, compartilhando o socket.
+
+        ``ips`` (mesma ordem de ``hosts``, None para resolver) evita a resolução
+        de nomes já resolvidos pelo chamador.
+        """
+        ips = ips or [None] * len(hosts)
+        self.attach(asyncio.get_running_loop())
+        try:
+            results = await asyncio.gather(
+                *(self.probe(host, count, timeout, interval, ip) for host, ip in zip(hosts, ips)),
+                return_exceptions=True
+            )
+        finally:
+            self.detach()
+
+        final = []
+        for host, result in zip(hosts, results):
+            if isinstance(result, Exception):
+                print(f"Ping test failed for {host}: {str(result)}")
+                result = {"target": host, "ip": None, "rtts": []}
+                result.update(summarize_rtts([], count))
+            final.append(result)
+        return final
+
+    def run(self, hosts, count=4, timeout=5.0, interval=0.2, ips=None):
+        """Versão síncrona de ``probe_many``."""
+        return asyncio.run(self.probe_many(hosts, count, timeout, interval, ips))
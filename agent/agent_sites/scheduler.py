@@ -0,0 +1,198 @@
+import asyncio
+import json
+import math
+import zlib
+from urllib.parse import urlparse
+
+
+def target_host(site):
+    """Host usado no limite de concorrência por host."""
+    if site.get("ping_target"):
+        return site["ping_target"]
+    if site.get("page_load_url"):
+        return urlparse(site["page_load_url"]).hostname or site["page_load_url"]
+    return site["name"]
+
+
+def default_offset(name, interval):
+    """Fase estável (derivada do nome) para espalhar os testes ao longo do intervalo."""
+    return (zlib.crc32(name.encode()) % 1000) / 1000.0 * interval
+
+
+def normalize_sites(sites, default_interval, source="sites"):
+    """Valida os sites e preenche ``interval``/``offset`` de quem não os define.
+
+    Sem eles usa-se o intervalo padrão e uma fase derivada do nome. ``source``
+    identifica a origem da lista nas mensagens de erro.
+    """
+    if not isinstance(sites, list):
+        raise ValueError(f"{source}: expected a JSON list of sites")
+
+    names = set()
+    for site in sites:
+        if not isinstance(site, dict) or not site.get("name"):
+            raise ValueError(f"{source}: every site needs a 'name'")
+        if site["name"] in names:
+            raise ValueError(f"{source}: duplicated site name '{site['name']}'")
+        names.add(site["name"])
+        if "ping_target" not in site and "page_load_url" not in site:
+            raise ValueError(f"{source}: site '{site['name']}' has no ping_target or page_load_url")
+        site["interval"] = float(site.get("interval", default_interval))
+        if site["interval"] <= 0:
+            raise ValueError(f"{source}: site '{site['name']}' has a non-positive interval")
+        site["offset"] = float(site.get("offset", default_offset(site["name"], site["interval"])))
+    return sites
+
+
+def load_sites(path, default_interval):
+    """Carrega os sites de um arquivo JSON (lista de objetos no formato de TEST_SITES).
+
+    Cada site pode definir ``interval`` e ``offset`` em segundos; sem eles
+    usa-se o intervalo padrão e uma fase derivada do nome.
+    """
+    with open(path, encoding="utf-8") as f:
+        sites = json.load(f)
+    return normalize_sites(sites, default_interval, path)
+
+
+class SiteScheduler:
+    """Agenda os testes de cada site no seu próprio intervalo e fase.
+
+    Cada site roda em taxa fixa (``próxima = agendada + intervalo``, no relógio
+    monotônico do loop), com limite global e por host de testes simultâneos.
+    Se a execução anterior de um site ainda não terminou, a nova é pulada; se o
+    agendador atrasar mais de um intervalo, os horários perdidos são descartados.
+    O atraso de agendamento (início real - horário agendado, incluindo a espera
+    pelos limites de concorrência) é medido em cada execução e, se informado,
+    observado em ``lag_histogram``. ``prepare(site)``, se informado, é chamado
+    ``prepare_lead`` segundos antes de cada execução (ex: pré-resolução de DNS)
+    e não deve bloquear o loop.
+    """
+
+    def __init__(self, sites, run_site, on_results, global_concurrency=50, per_host_concurrency=2,
+                 report_interval=10.0, lag_histogram=None, prepare=None, prepare_lead=0.0):
+        self.sites = sites
+        self.run_site = run_site
+        self.on_results = on_results
+        self.prepare = prepare
+        self.prepare_lead = prepare_lead
+        self.report_interval = report_interval
+        self.lag_histogram = lag_histogram
+        # Os semáforos são criados em run(), já com o event loop em execução
+        self._global_concurrency = global_concurrency
+        self._global = None
+        self._per_host_concurrency = per_host_concurrency
+        self._hosts = {}
+        self._in_flight = set()
+        self._tasks = set()
+
+        # Métricas do agendador
+        self.runs = 0
+        self.skipped_in_flight = 0
+        self.missed_slots = 0
+        self.errors = 0
+        self._lag_count = 0
+        self._lag_total = 0.0
+        self._lag_max = 0.0
+        self.last_lag = 0.0
+
+    def _host_semaphore(self, host):
+        semaphore = self._hosts.get(host)
+        if semaphore is None:
+            semaphore = self._hosts[host] = asyncio.Semaphore(self._per_host_concurrency)
+        return semaphore
+
+    def _record_lag(self, lag):
+        if self.lag_histogram is not None:
+            self.lag_histogram.observe(lag)
+        self.last_lag = lag
+        self._lag_count += 1
+        self._lag_total += lag
+        self._lag_max = max(self._lag_max, lag)
+
+    def stats(self, reset=False):
+        """Métricas acumuladas; ``reset`` zera a janela de atraso de agendamento."""
+        stats = {
+            "sites": len(self.sites),
+            "in_flight": len(self._in_flight),
+            "runs": self.runs,
+            "skipped_in_flight": self.skipped_in_flight,
+            "missed_slots": self.missed_slots,
+            "errors": self.errors,
+            "lag_avg": self._lag_total / self._lag_count if self._lag_count else 0.0,
+            "lag_max": self._lag_max,
+            "lag_last": self.last_lag,
+        }
+        if reset:
+            self._lag_count = 0
+            self._lag_total = 0.0
+            self._lag_max = 0.0
+        return stats
+
+    def stats_line(self, reset=False):
+        s = self.stats(reset)
+        return (f"Scheduler: sites={s['sites']}, in_flight={s['in_flight']}, runs={s['runs']}, "
+                f"skipped={s['skipped_in_flight']}, missed={s['missed_slots']}, errors={s['errors']}, "
+                f"lag avg/max={s['lag_avg'] * 1000:.1f}/{s['lag_max'] * 1000:.1f}ms")
+
+    async def _run_once(self, site, scheduled):
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._global, self._host_semaphore(target_host(site)):
+                self._record_lag(max(0.0, loop.time() - scheduled))
+                results = await self.run_site(site)
+            self.runs += 1
+            if results:
+                self.on_results(results)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error testing site {site['name']}: {str(e)}")
+        finally:
+            self._in_flight.discard(site["name"])
+
+    async def _site_loop(self, site, start):
+        loop = asyncio.get_running_loop()
+        interval = site["interval"]
+        next_run = start + site["offset"] % interval
+        while True:
+            if self.prepare is not None:
+                await asyncio.sleep(max(0.0, next_run - self.prepare_lead - loop.time()))
+                try:
+                    self.prepare(site)
+                except Exception as e:
+                    print(f"Error preparing site {site['name']}: {str(e)}")
+            await asyncio.sleep(max(0.0, next_run - loop.time()))
+            if site["name"] in self._in_flight:
+                self.skipped_in_flight += 1
+            else:
+                self._in_flight.add(site["name"])
+                task = asyncio.ensure_future(self._run_once(site, next_run))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            next_run += interval
+            behind = loop.time() - next_run
+            if behind > 0:
+                # Atrasou mais de um intervalo: pula os horários perdidos em vez de acumular
+                missed = math.ceil(behind / interval)
+                self.missed_slots += missed
+                next_run += missed * interval
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            print(self.stats_line(reset=True))
+
+    async def run(self):
+        """Executa o agendamento até ser cancelado."""
+        # No Python 3.9 um Semaphore criado fora do loop fica preso a outro event loop
+        self._global = asyncio.Semaphore(self._global_concurrency)
+        self._hosts = {}
+        start = asyncio.get_running_loop().time()
+        loops = [asyncio.ensure_future(self._site_loop(site, start)) for site in self.sites]
+        loops.append(asyncio.ensure_future(self._report_loop()))
+        try:
+            await asyncio.gather(*loops)
+        finally:
+            for task in loops + list(self._tasks):
+                task.cancel()
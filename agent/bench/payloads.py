@@ -0,0 +1,51 @@
+import json
+import random
+
+
+def synthetic_location(index, interfaces, rng=random):
+    """Localidade sintética com as mesmas chaves lidas pelo agent_api."""
+    return {
+        "id": index,
+        "name": f"PoP Sintético {index}",
+        "lat": round(rng.uniform(-33.0, 5.0), 6),
+        "lng": round(rng.uniform(-73.0, -35.0), 6),
+        "data": {
+            "smoke": {
+                "loss": round(rng.uniform(0, 5), 3),
+                "avg_val": round(rng.uniform(1, 80), 3),
+                "max_loss": round(rng.uniform(0, 20), 3),
+                "val": round(rng.uniform(1, 80), 3),
+                "max_val": round(rng.uniform(80, 300), 3),
+                "avg_loss": round(rng.uniform(0, 5), 3),
+            },
+            "interfaces": [
+                {
+                    "nome": f"Cliente {index}-{j}",
+                    "traffic_graph_id": index * 1000 + j,
+                    "tipo": rng.choice(["CLIENTE", "BACKBONE", "PTT"]),
+                    "client_side": rng.choice(["true", "false"]),
+                    "max_out": rng.uniform(1e8, 1e10),
+                    "max_traffic_up": 1e10,
+                    "max_traffic_down": 1e10,
+                    "avg_in": rng.uniform(1e6, 1e9),
+                    "avg_out": rng.uniform(1e6, 1e9),
+                    "traffic_in": rng.uniform(1e6, 1e9),
+                    "traffic_out": rng.uniform(1e6, 1e9),
+                    "max_in": rng.uniform(1e8, 1e10),
+                }
+                for j in range(interfaces)
+            ],
+        },
+    }
+
+
+def write_payload(path, locations, interfaces, seed=42):
+    """Grava um payload com ``locations`` x ``interfaces`` sem montar a lista inteira em memória."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i in range(locations):
+            if i:
+                f.write(",")
+            json.dump(synthetic_location(i, interfaces, rng), f, ensure_ascii=False)
+        f.write("]")
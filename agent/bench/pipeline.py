@@ -0,0 +1,336 @@
+"""Benchmark de carga do pipeline de coleta (fetch -> line protocol -> escrita).
+
+Gera um payload sintético do ViaIpe (N localidades x M interfaces) e uma lista
+de sites sintéticos, serve-os por um stub HTTP local e executa, em processos
+separados, os ciclos do agent_api (``fetch_data`` + ``save_to_influx``) e do
+agent_sites (``run_network_tests_concurrent`` + ``save_to_influx``), escrevendo
+com o ``InfluxWriter`` real num sink local de line protocol. Cada ciclo só
+termina quando todos os pontos chegaram ao sink.
+
+Reporta vazão (pontos/s), p50/p99 do tempo de ciclo por fase, alocações
+(tracemalloc, num ciclo extra) e pico de RSS, em JSON. Roda sem rede externa.
+
+Uso:
+    python agent/bench/pipeline.py --locations 2000 --interfaces 10 --output atual.json
+    python agent/bench/pipeline.py --locations 2000 --interfaces 10 --compare atual.json
+"""
+import argparse
+import gzip
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [AGENT_DIR]
+
+from bench.payloads import write_payload
+
+PAGE_BODY = b"<html><body>" + b"x" * 10_000 + b"</body></html>"
+# flush_interval do escritor durante o benchmark (o padrão do agente é 1 s)
+DRAIN_FLUSH_INTERVAL = 0.005
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Stub do ViaIpe/sites e sink do InfluxDB v2 num único servidor."""
+
+    protocol_version = "HTTP/1.1"
+    payload = b"[]"
+    lines = 0
+    bytes = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/api/v2/buckets"):
+            # Verificação do bucket feita pelo InfluxWriter
+            body = json.dumps({"buckets": [{"id": "bench", "name": "bench", "retentionRules": []}]})
+            self._send(200, body.encode())
+        elif self.path.startswith("/page"):
+            self._send(200, PAGE_BODY, "text/html")
+        else:
+            # Sem ETag/Last-Modified: todo ciclo baixa o payload completo
+            self._send(200, self.payload)
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        cls = type(self)
+        with cls.lock:
+            cls.lines += data.count(b"\n") + (0 if data.endswith(b"\n") or not data else 1)
+            cls.bytes += len(data)
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def percentile(values, q):
+    """Percentil por posição mais próxima."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(cycles, points):
+    phases = {}
+    for phase in cycles[0]:
+        values = [cycle[phase] for cycle in cycles]
+        phases[phase] = {
+            "p50": round(percentile(values, 0.50), 6),
+            "p99": round(percentile(values, 0.99), 6),
+            "mean": round(sum(values) / len(values), 6),
+        }
+    total_p50 = phases["total"]["p50"]
+    return {
+        "points_per_cycle": points,
+        "throughput_points_per_second": round(points / total_p50, 1) if total_p50 else 0.0,
+        "cycle_seconds": phases,
+    }
+
+
+def _wait_written(writer, target, timeout=120.0):
+    # O ciclo termina quando o escritor entregou todos os pontos ao sink
+    deadline = time.monotonic() + timeout
+    while writer.points_written < target:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Timed out waiting for writes ({writer.points_written}/{target})")
+        time.sleep(0.001)
+
+
+def _run_cycles(run_cycle, writer, cycles, warmup, allocations):
+    """Executa os ciclos; cada ``run_cycle()`` retorna (tempos por fase, pontos enfileirados)."""
+    timings = []
+    points = 0
+    # Um ciclo com menos pontos que o batch_size (o agent_sites, ou o resto do último lote)
+    # esperaria o flush_interval inteiro, e o write_drain mediria só essa espera
+    writer.flush_interval = DRAIN_FLUSH_INTERVAL
+    expected = writer.points_written
+    for i in range(warmup + cycles):
+        start = time.perf_counter()
+        phases, queued = run_cycle()
+        queued_at = time.perf_counter()
+        expected += queued
+        _wait_written(writer, expected)
+        phases["write_drain"] = time.perf_counter() - queued_at
+        phases["total"] = time.perf_counter() - start
+        if i >= warmup:
+            timings.append(phases)
+            points = queued
+
+    result = summarize(timings, points)
+    if allocations:
+        # Ciclo extra sob tracemalloc (bem mais lento, não entra nos tempos)
+        tracemalloc.start()
+        _, queued = run_cycle()
+        _wait_written(writer, expected + queued)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["alloc_peak_bytes"] = peak
+        result["alloc_retained_bytes"] = current
+    return result
+
+
+def run_api_child(args):
+    import agent_api
+
+    writer = agent_api.get_writer()
+
+    def cycle():
+        built = agent_api.POINTS_BUILT.value
+        start = time.perf_counter()
+        data = agent_api.fetch_data()
+        fetched = time.perf_counter()
+        agent_api.save_to_influx(data)
+        built = int(agent_api.POINTS_BUILT.value - built)
+        # Com VIAIPE_STREAMING o download acontece dentro do build
+        return {"fetch": fetched - start, "build": time.perf_counter() - fetched}, built
+
+    try:
+        return _run_cycles(cycle, writer, args.cycles, args.warmup, not args.no_allocations)
+    finally:
+        writer.close()
+
+
+def run_sites_child(args, base_url):
+    import agent_sites
+
+    agent_sites.TEST_SITES = [
+        {"name": f"site{i}", "ping_target": "127.0.0.1", "page_load_url": f"{base_url}/page?{i}"}
+        for i in range(args.sites)
+    ]
+    writer = agent_sites.get_writer()
+
+    def cycle():
+        built = agent_sites.POINTS_BUILT.value
+        start = time.perf_counter()
+        results = agent_sites.run_network_tests_concurrent()
+        tested = time.perf_counter()
+        agent_sites.save_to_influx(results)
+        built = int(agent_sites.POINTS_BUILT.value - built)
+        return {"tests": tested - start, "build": time.perf_counter() - tested}, built
+
+    try:
+        return _run_cycles(cycle, writer, args.cycles, args.warmup, not args.no_allocations)
+    finally:
+        writer.close()
+
+
+def child_main(args):
+    target, base_url = args.child
+    sys.path[:0] = [os.path.join(AGENT_DIR, f"agent_{target}")]
+    os.environ.update({
+        "INFLUXDB_URL": base_url,
+        "INFLUXDB_TOKEN": "bench",
+        "INFLUXDB_ORG": "bench",
+        "INFLUXDB_BUCKET": "bench",
+        "VIAIPE_API_URL": f"{base_url}/viaipe",
+        "VIAIPE_STREAMING": "true" if args.streaming else "false",
+        "INFLUXDB_MAX_PENDING": str(10 ** 7),
+        "PING_COUNT": "1",
+        "PING_INTERVAL_SECONDS": "0",
+        "PING_TIMEOUT_SECONDS": "1",
+    })
+    # O log do agente é descartado (ou vai para stderr com --verbose); stdout carrega só o resultado
+    stdout = sys.stdout
+    sys.stdout = sys.stderr if args.verbose else open(os.devnull, "w")
+    result = run_api_child(args) if target == "api" else run_sites_child(args, base_url)
+    result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stdout.write(json.dumps(result) + "\n")
+
+
+def compare(report, baseline, tolerance):
+    """Compara com um relatório anterior; retorna a lista de regressões."""
+    regressions = []
+    for target, current in report["results"].items():
+        previous = baseline.get("results", {}).get(target)
+        if not previous:
+            continue
+        checks = [
+            ("cycle p50", current["cycle_seconds"]["total"]["p50"], previous["cycle_seconds"]["total"]["p50"], True),
+            ("cycle p99", current["cycle_seconds"]["total"]["p99"], previous["cycle_seconds"]["total"]["p99"], True),
+            ("peak RSS", current["peak_rss_kb"], previous["peak_rss_kb"], True),
+            ("throughput", current["throughput_points_per_second"], previous["throughput_points_per_second"], False),
+        ]
+        for name, now, before, lower_is_better in checks:
+            if not before:
+                continue
+            change = (now - before) / before
+            print(f"{target:>5} {name:>10}: {before:.4g} -> {now:.4g} ({change:+.1%})")
+            if (change > tolerance) if lower_is_better else (change < -tolerance):
+                regressions.append(f"{target} {name} {change:+.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--locations", type=int, default=2000)
+    parser.add_argument("--interfaces", type=int, default=10)
+    parser.add_argument("--sites", type=int, default=20)
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--targets", default="api,sites", help="api, sites ou api,sites")
+    parser.add_argument("--streaming", action="store_true", help="usa VIAIPE_STREAMING no agent_api")
+    parser.add_argument("--no-allocations", action="store_true", help="pula o ciclo sob tracemalloc")
+    parser.add_argument("--output", help="grava o relatório JSON neste arquivo")
+    parser.add_argument("--compare", help="relatório JSON anterior para detectar regressões")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="variação aceita no --compare (padrão: 0.2)")
+    parser.add_argument("--json", action="store_true", help="imprime apenas o relatório em JSON")
+    parser.add_argument("--verbose", action="store_true", help="mostra o log dos agentes")
+    parser.add_argument("--child", nargs=2, metavar=("TARGET", "URL"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child_main(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "payload.json")
+        write_payload(path, args.locations, args.interfaces)
+        with open(path, "rb") as f:
+            _StubHandler.payload = f.read()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    results = {}
+    try:
+        for target in [t.strip() for t in args.targets.split(",") if t.strip()]:
+            command = [sys.executable, os.path.abspath(__file__), "--child", target, base_url]
+            for option in ("locations", "interfaces", "sites", "cycles", "warmup"):
+                command += [f"--{option}", str(getattr(args, option))]
+            for flag in ("streaming", "no_allocations", "verbose"):
+                if getattr(args, flag):
+                    command.append(f"--{flag.replace('_', '-')}")
+            proc = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True)
+            results[target] = json.loads(proc.stdout.strip().splitlines()[-1])
+    finally:
+        server.shutdown()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "locations": args.locations,
+            "interfaces": args.interfaces,
+            "sites": args.sites,
+            "cycles": args.cycles,
+            "warmup": args.warmup,
+            "streaming": args.streaming,
+            "payload_bytes": len(_StubHandler.payload),
+        },
+        "sink": {"lines": _StubHandler.lines, "bytes": _StubHandler.bytes},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print(f"Payload: {args.locations} locations x {args.interfaces} interfaces "
+              f"({len(_StubHandler.payload) / 1e6:.1f} MB), {args.sites} sites, {args.cycles} cycles")
+        for target, r in results.items():
+            total = r["cycle_seconds"]["total"]
+            phases = ", ".join(f"{name} {v['p50'] * 1000:.1f}ms" for name, v in r["cycle_seconds"].items()
+                               if name != "total")
+            line = (f"{target:>5}: {r['points_per_cycle']} points/cycle, "
+                    f"{r['throughput_points_per_second']:.0f} points/s, "
+                    f"cycle p50/p99 {total['p50'] * 1000:.1f}/{total['p99'] * 1000:.1f}ms ({phases}), "
+                    f"peak RSS {r['peak_rss_kb'] / 1024:.1f} MB")
+            if "alloc_peak_bytes" in r:
+                line += f", alloc peak {r['alloc_peak_bytes'] / 1e6:.1f} MB"
+            print(line)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
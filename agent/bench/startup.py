@@ -0,0 +1,240 @@
+"""Benchmark de inicialização dos agentes (cold start até o primeiro ponto escrito).
+
+Inicia cada agente como um processo novo (``python agent_api.py`` /
+``python agent_sites.py``), várias vezes, contra um stub HTTP local que serve um
+payload sintético do ViaIpe e faz o papel do InfluxDB. Mede, por agente e
+modo (``AGENT_RUNTIME=full`` e ``slim``):
+
+* o tempo até o stub receber a primeira escrita, visto de fora do processo;
+* as etapas reportadas pelo próprio agente (``agent_startup_seconds``:
+  imports, first_fetch, first_write);
+* o RSS ocioso, lido do ``/proc`` depois do primeiro ciclo.
+
+Reporta a mediana das execuções em JSON. Roda sem rede externa (Linux).
+
+Uso:
+    python agent/bench/startup.py --runs 5 --output atual.json
+    python agent/bench/startup.py --runs 5 --compare atual.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [AGENT_DIR]
+
+from bench.payloads import write_payload
+
+PAGE_BODY = b"<html><body>" + b"x" * 10_000 + b"</body></html>"
+STARTUP_LINE = re.compile(r"^Startup: (.+) after ([\d.]+)s$")
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Stub do ViaIpe/sites e do InfluxDB v2; guarda o instante da primeira escrita."""
+
+    protocol_version = "HTTP/1.1"
+    payload = b"[]"
+    first_write = None
+    written = threading.Event()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/api/v2/buckets"):
+            body = json.dumps({"buckets": [{"id": "bench", "name": "bench", "retentionRules": []}]})
+            self._send(200, body.encode())
+        elif self.path.startswith("/page"):
+            self._send(200, PAGE_BODY, "text/html")
+        else:
+            self._send(200, self.payload)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        cls = type(self)
+        if cls.first_write is None:
+            cls.first_write = time.perf_counter()
+            cls.written.set()
+        self._send(204)
+
+
+def rss_kb(pid):
+    """RSS atual do processo (VmRSS) em KiB."""
+    with open(f"/proc/{pid}/status", encoding="ascii") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def run_once(target, runtime, base_url, sites_file, idle, timeout, verbose):
+    """Inicia o agente, espera a primeira escrita e o RSS ocioso; retorna as medidas."""
+    env = dict(os.environ, **{
+        "PYTHONPATH": AGENT_DIR,
+        "PYTHONUNBUFFERED": "1",
+        "AGENT_RUNTIME": runtime,
+        "INFLUXDB_URL": base_url,
+        "INFLUXDB_TOKEN": "bench",
+        "INFLUXDB_ORG": "bench",
+        "INFLUXDB_BUCKET": "bench",
+        "VIAIPE_API_URL": f"{base_url}/viaipe",
+        "SITES_CONFIG_FILE": sites_file,
+        "AGENT_INTERVAL_SECONDS": "60",
+        "METRICS_PORT": "",
+        "METRICS_INFLUX_INTERVAL_SECONDS": "0",
+        "PING_COUNT": "1",
+        "PING_INTERVAL_SECONDS": "0",
+        "PING_TIMEOUT_SECONDS": "1",
+    })
+    _StubHandler.first_write = None
+    _StubHandler.written.clear()
+    cwd = os.path.join(AGENT_DIR, f"agent_{target}")
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, f"agent_{target}.py"], cwd=cwd, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    output = []
+    reader = threading.Thread(target=lambda: output.extend(proc.stdout), daemon=True)
+    reader.start()
+    try:
+        if not _StubHandler.written.wait(timeout):
+            raise RuntimeError(f"agent_{target} ({runtime}) wrote nothing within {timeout:.0f}s")
+        first_write = _StubHandler.first_write - start
+        time.sleep(idle)
+        rss = rss_kb(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait(10)
+        reader.join(5)
+    if verbose:
+        sys.stderr.write("".join(output))
+
+    result = {"first_write_observed": first_write, "idle_rss_kb": rss}
+    for line in output:
+        match = STARTUP_LINE.match(line.strip())
+        if match:
+            result[match.group(1).replace(" ", "_")] = float(match.group(2))
+    return result
+
+
+def summarize(runs):
+    """Mediana de cada medida entre as execuções."""
+    keys = sorted({key for run in runs for key in run})
+    summary = {key: statistics.median(run[key] for run in runs if key in run) for key in keys}
+    return {key: round(value, 6) if isinstance(value, float) else int(value) for key, value in summary.items()}
+
+
+def compare(report, baseline, tolerance):
+    """Compara com um relatório anterior; retorna a lista de regressões."""
+    regressions = []
+    for name, current in report["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        for key in ("first_write_observed", "imports", "idle_rss_kb"):
+            now, before = current.get(key), previous.get(key)
+            if not now or not before:
+                continue
+            change = (now - before) / before
+            print(f"{name:>11} {key:>20}: {before:.4g} -> {now:.4g} ({change:+.1%})")
+            if change > tolerance:
+                regressions.append(f"{name} {key} {change:+.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--locations", type=int, default=200)
+    parser.add_argument("--interfaces", type=int, default=5)
+    parser.add_argument("--sites", type=int, default=3)
+    parser.add_argument("--targets", default="api,sites", help="api, sites ou api,sites")
+    parser.add_argument("--runtimes", default="full,slim", help="full, slim ou full,slim")
+    parser.add_argument("--idle", type=float, default=2.0, help="segundos após a primeira escrita até medir o RSS")
+    parser.add_argument("--timeout", type=float, default=60.0, help="limite para a primeira escrita de cada execução")
+    parser.add_argument("--output", help="grava o relatório JSON neste arquivo")
+    parser.add_argument("--compare", help="relatório JSON anterior para detectar regressões")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="variação aceita no --compare (padrão: 0.2)")
+    parser.add_argument("--json", action="store_true", help="imprime apenas o relatório em JSON")
+    parser.add_argument("--verbose", action="store_true", help="mostra o log dos agentes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "payload.json")
+        write_payload(path, args.locations, args.interfaces)
+        with open(path, "rb") as f:
+            _StubHandler.payload = f.read()
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+
+        sites_file = os.path.join(tmp, "sites.json")
+        with open(sites_file, "w", encoding="utf-8") as f:
+            json.dump([{"name": f"site{i}", "ping_target": "127.0.0.1", "page_load_url": f"{base_url}/page?{i}"}
+                       for i in range(args.sites)], f)
+
+        results = {}
+        try:
+            for target in [t.strip() for t in args.targets.split(",") if t.strip()]:
+                for runtime in [r.strip() for r in args.runtimes.split(",") if r.strip()]:
+                    runs = [run_once(target, runtime, base_url, sites_file, args.idle, args.timeout, args.verbose)
+                            for _ in range(args.runs)]
+                    results[f"{target}-{runtime}"] = summarize(runs)
+        finally:
+            server.shutdown()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "runs": args.runs,
+            "locations": args.locations,
+            "interfaces": args.interfaces,
+            "sites": args.sites,
+            "idle": args.idle,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print(f"Startup: {args.runs} runs per agent/runtime (median), "
+              f"{args.locations} locations x {args.interfaces} interfaces, {args.sites} sites")
+        for name, r in results.items():
+            stages = ", ".join(f"{stage} {r[stage] * 1000:.0f}ms" for stage in ("imports", "first_fetch", "first_write")
+                               if stage in r)
+            print(f"{name:>11}: first write {r['first_write_observed'] * 1000:.0f}ms ({stages}), "
+                  f"idle RSS {r['idle_rss_kb'] / 1024:.1f} MB")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Benchmark de memória: ``response.json()`` x parse em streaming (VIAIPE_STREAMING).
+
+Gera um payload sintético, serve-o por um servidor HTTP local e executa, em
+processos separados, o caminho fetch -> codificação do agent_api em cada modo,
+reportando o pico de RSS. Não acessa a rede nem o InfluxDB.
+
+Uso: python agent/bench/streaming_memory.py --locations 10000 --interfaces 10
+"""
+import argparse
+import functools
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [AGENT_DIR, os.path.join(AGENT_DIR, "agent_api")]
+
+from bench.payloads import write_payload
+
+
+class _NullWriter:
+    """Substitui o InfluxWriter: apenas conta os pontos recebidos."""
+
+    def __init__(self):
+        self.points = 0
+
+    def submit(self, records):
+        self.points += len(records)
+        return True
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def run_child(mode, url):
+    os.environ.update({
+        "VIAIPE_API_URL": url,
+        "VIAIPE_STREAMING": "true" if mode == "streaming" else "false",
+        "INFLUXDB_URL": "http://127.0.0.1:9",
+        "INFLUXDB_TOKEN": "bench",
+        "INFLUXDB_ORG": "bench",
+        "INFLUXDB_BUCKET": "bench",
+    })
+    import agent_api
+
+    writer = agent_api._writer = _NullWriter()
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    agent_api.save_to_influx(agent_api.fetch_data())
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "mode": mode,
+        "points": writer.points,
+        "seconds": round(elapsed, 3),
+        "baseline_rss_kb": baseline_kb,
+        "peak_rss_kb": peak_kb,
+        "delta_rss_kb": peak_kb - baseline_kb,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--locations", type=int, default=10_000)
+    parser.add_argument("--interfaces", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="imprime apenas o resultado em JSON")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "URL"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # O log do agente vai para stderr; stdout carrega só o resultado
+        stdout = sys.stdout
+        sys.stdout = sys.stderr
+        result = run_child(*args.child)
+        stdout.write(json.dumps(result) + "\n")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_payload(os.path.join(tmp, "payload.json"), args.locations, args.interfaces)
+        handler = functools.partial(_QuietHandler, directory=tmp)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/payload.json"
+        payload_bytes = os.path.getsize(os.path.join(tmp, "payload.json"))
+
+        results = []
+        try:
+            for mode in ("json", "streaming"):
+                proc = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", mode, url],
+                    capture_output=True, text=True, check=True
+                )
+                results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        finally:
+            server.shutdown()
+
+    report = {
+        "locations": args.locations,
+        "interfaces": args.interfaces,
+        "payload_bytes": payload_bytes,
+        "results": results,
+    }
+    if args.json:
+        print(json.dumps(report))
+        return
+
+    print(f"Payload: {args.locations} locations x {args.interfaces} interfaces ({payload_bytes / 1e6:.1f} MB)")
+    for r in results:
+        print(f"{r['mode']:>10}: {r['points']} points in {r['seconds']:.2f}s, "
+              f"peak RSS {r['peak_rss_kb'] / 1024:.1f} MB (+{r['delta_rss_kb'] / 1024:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Componentes compartilhados entre os agentes de coleta (agent_api e agent_sites)."""
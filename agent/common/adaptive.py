@@ -0,0 +1,177 @@
+import math
+import random
+import time
+
+from .metrics import REGISTRY
+
+_DECISIONS_HELP = "Adaptive polling decisions (breaker transitions, skipped polls, interval changes)"
+
+
+def record_decision(target, decision):
+    """Conta uma decisão do agendamento adaptativo (métrica agent_poll_decisions_total)."""
+    REGISTRY.counter("agent_poll_decisions_total", _DECISIONS_HELP,
+                     {"target": target, "decision": decision}).inc()
+
+
+class CircuitBreaker:
+    """Circuit breaker com backoff exponencial e jitter para um endpoint/alvo.
+
+    Depois de ``failure_threshold`` falhas seguidas o circuito abre e as
+    chamadas são puladas durante o backoff, que dobra a cada nova abertura
+    (``base_backoff * 2^n``, até ``max_backoff``) com jitter de ±``jitter``
+    para que vários agentes não voltem ao mesmo tempo. Passado o backoff, uma
+    única chamada de teste é liberada (meio aberto): sucesso fecha o circuito
+    e zera o backoff, falha reabre com o próximo degrau.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+    _STATE_NAMES = ("closed", "half_open", "open")
+
+    def __init__(self, target, failure_threshold=3, base_backoff=10.0, max_backoff=300.0, jitter=0.2,
+                 clock=time.monotonic):
+        self.target = target
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opens = 0
+        self.backoff = 0.0
+        self.open_until = 0.0
+        self._state_gauge = REGISTRY.gauge("agent_breaker_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+                                           {"target": target})
+        self._backoff_gauge = REGISTRY.gauge("agent_backoff_seconds", "Current circuit breaker backoff",
+                                             {"target": target})
+
+    @property
+    def state_name(self):
+        return self._STATE_NAMES[self.state]
+
+    def _set_state(self, state):
+        self.state = state
+        self._state_gauge.set(state)
+
+    def allow(self):
+        """Indica se a chamada pode ser feita agora."""
+        if self.state == self.CLOSED:
+            return True
+        now = self.clock()
+        if now >= self.open_until:
+            # Chamada de teste; se ela não reportar resultado, outra é liberada após o mesmo backoff
+            self.open_until = now + max(self.backoff, self.base_backoff)
+            self._set_state(self.HALF_OPEN)
+            record_decision(self.target, "half_open_trial")
+            return True
+        record_decision(self.target, "skip_open")
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            record_decision(self.target, "close")
+            print(f"Circuit breaker for {self.target} closed after {self.failures} failures")
+        self.failures = 0
+        self.opens = 0
+        self.backoff = 0.0
+        self._backoff_gauge.set(0.0)
+        self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** self.opens)
+            self.backoff = backoff * random.uniform(1 - self.jitter, 1 + self.jitter)
+            self.open_until = self.clock() + self.backoff
+            self.opens += 1
+            self._backoff_gauge.set(self.backoff)
+            self._set_state(self.OPEN)
+            record_decision(self.target, "open")
+            print(f"Circuit breaker for {self.target} open for {self.backoff:.1f}s "
+                  f"after {self.failures} consecutive failures")
+
+
+class AdaptiveInterval:
+    """Intervalo de polling ajustado à frequência com que o upstream muda.
+
+    ``observe(changed)`` é chamado a cada coleta. O período entre mudanças é
+    estimado por média móvel exponencial e o intervalo segue ``factor`` vezes
+    esse período (0.5 = duas coletas por mudança, para não perder nenhuma),
+    limitado a [``min_interval``, ``max_interval``]. Se o upstream passa mais
+    que o período estimado sem mudar, o intervalo cresce aos poucos (``step``);
+    quando toda coleta vê dados novos, ele cai até o período real ou o mínimo.
+    """
+
+    def __init__(self, target, initial, min_interval, max_interval, factor=0.5, alpha=0.3, step=1.25,
+                 clock=time.monotonic):
+        self.target = target
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.alpha = alpha
+        self.step = step
+        self.clock = clock
+        self.interval = min(max(initial, min_interval), max_interval)
+        self.change_period = None
+        self._last_change = None
+        self._gauge = REGISTRY.gauge("agent_poll_interval_seconds", "Current adaptive polling interval",
+                                     {"target": target})
+        self._gauge.set(self.interval)
+
+    def observe(self, changed):
+        """Registra se a última coleta trouxe dados novos; retorna o novo intervalo."""
+        now = self.clock()
+        if changed:
+            if self._last_change is not None:
+                period = now - self._last_change
+                if self.change_period is None:
+                    self.change_period = period
+                else:
+                    self.change_period += self.alpha * (period - self.change_period)
+            self._last_change = now
+        if self.change_period is None:
+            return self.interval
+
+        target = self.factor * self.change_period
+        if not changed and now - self._last_change > self.change_period:
+            # O upstream está mais lento que o estimado: desacelera gradualmente
+            target = max(target, self.interval * self.step)
+        target = min(max(target, self.min_interval), self.max_interval)
+        if abs(target - self.interval) >= 0.05 * self.interval:
+            record_decision(self.target, "slower" if target > self.interval else "faster")
+            print(f"Poll interval for {self.target}: {self.interval:.1f}s -> {target:.1f}s "
+                  f"(upstream changes every ~{self.change_period:.0f}s)")
+            self.interval = target
+            self._gauge.set(target)
+        return self.interval
+
+
+class FixedRateTicker:
+    """Agendamento de taxa fixa num relógio monotônico.
+
+    Os ciclos começam em ``início + k * intervalo``, sem acumular a deriva do
+    ``sleep(intervalo - duração)``. Um ciclo que estoura o intervalo não
+    dispara o próximo imediatamente: os horários perdidos são pulados (e
+    contados em ``agent_schedule_missed_slots_total``) e a coleta volta à grade,
+    mantendo os timestamps regulares. Mudar o intervalo reancora a grade no
+    início do ciclo atual.
+    """
+
+    def __init__(self, name, clock=time.monotonic):
+        self.clock = clock
+        self.last_start = clock()
+        self.missed_slots = 0
+        self._missed = REGISTRY.counter("agent_schedule_missed_slots_total",
+                                        "Schedule slots skipped because a cycle overran", {"loop": name})
+
+    def next_delay(self, interval):
+        """Avança para o próximo horário da grade e retorna quanto falta para ele."""
+        next_start = self.last_start + interval
+        now = self.clock()
+        if now > next_start:
+            missed = math.ceil((now - next_start) / interval)
+            self.missed_slots += missed
+            self._missed.inc(missed)
+            next_start += missed * interval
+        self.last_start = next_start
+        return max(0.0, next_start - now)
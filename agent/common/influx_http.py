@@ -0,0 +1,129 @@
+import http.client
+import json
+import threading
+from urllib.parse import urlencode, urlsplit
+
+from .influx_writer import InfluxWriter
+from .sinks import to_lines
+
+
+class InfluxHttpError(Exception):
+    """Resposta de erro da API do InfluxDB; ``status`` como no ``ApiException`` do influxdb_client."""
+
+    def __init__(self, status, reason, body=b""):
+        self.status = status
+        self.reason = reason
+        message = body.decode("utf-8", "replace").strip()[:500]
+        super().__init__(f"HTTP {status} {reason}" + (f": {message}" if message else ""))
+
+
+class LineProtocolClient:
+    """Cliente HTTP mínimo da API v2 do InfluxDB: escrita de line protocol e consulta de bucket.
+
+    Usa só o ``http.client`` da biblioteca padrão, com um pool de até
+    ``pool_size`` conexões keep-alive. Uma conexão ociosa que o servidor já
+    fechou é descartada e a requisição é repetida em outra conexão.
+    """
+
+    def __init__(self, url, token, timeout=10.0, pool_size=2):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Invalid InfluxDB URL: {url}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._headers = {"Authorization": f"Token {token}", "Accept": "application/json"}
+        self._idle = []
+        self._lock = threading.Lock()
+
+        # Métricas do pool
+        self.connections_opened = 0
+        self.requests = 0
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        self.connections_opened += 1
+        return cls(self.host, self.port, timeout=self.timeout), False
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method, path, body=None, headers=None):
+        """Executa a requisição e retorna ``(status, motivo, corpo)``."""
+        headers = dict(self._headers, **(headers or {}))
+        while True:
+            conn, reused = self._acquire()
+            try:
+                conn.request(method, self.base_path + path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (ConnectionResetError, BrokenPipeError, http.client.BadStatusLine):
+                conn.close()
+                if reused:
+                    # Keep-alive encerrado pelo servidor enquanto a conexão estava ociosa
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            self.requests += 1
+            if response.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            return response.status, response.reason, data
+
+    def write(self, org, bucket, lines):
+        """Envia as linhas (bytes) com precisão de nanossegundos; levanta ``InfluxHttpError`` se recusadas."""
+        query = urlencode({"org": org, "bucket": bucket, "precision": "ns"})
+        status, reason, data = self.request(
+            "POST", f"/api/v2/write?{query}", body=b"\n".join(lines),
+            headers={"Content-Type": "text/plain; charset=utf-8"}
+        )
+        if not 200 <= status < 300:
+            raise InfluxHttpError(status, reason, data)
+
+    def bucket_exists(self, bucket):
+        """Indica se o bucket existe (mesma consulta do ``find_bucket_by_name``)."""
+        status, reason, data = self.request("GET", f"/api/v2/buckets?{urlencode({'name': bucket})}")
+        if status == 404:
+            return False
+        if status != 200:
+            raise InfluxHttpError(status, reason, data)
+        return bool(json.loads(data).get("buckets"))
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class HttpInfluxWriter(InfluxWriter):
+    """``InfluxWriter`` que escreve pelo ``LineProtocolClient``, sem o ``influxdb_client``.
+
+    Fila, lotes, spool e reenvio são os mesmos; muda só o transporte. Usado no
+    modo ``AGENT_RUNTIME=slim``, que reduz o tempo de inicialização e a memória
+    do agente.
+    """
+
+    def _connect(self):
+        if self._client is None:
+            self._client = LineProtocolClient(self.url, self.token, timeout=self.timeout_ms / 1000)
+        if not self._bucket_checked:
+            if not self._client.bucket_exists(self.bucket):
+                raise RuntimeError(f"Bucket '{self.bucket}' not found. Please create it.")
+            self._bucket_checked = True
+
+    def _send(self, batch):
+        self._client.write(self.org, self.bucket, to_lines(batch))
@@ -0,0 +1,290 @@
+import random
+import threading
+import time
+from collections import deque
+
+from . import startup
+from .metrics import REGISTRY, SIZE_BUCKETS
+from .sinks import to_lines
+
+WRITE_SECONDS = REGISTRY.histogram("agent_write_seconds", "Latency of InfluxDB batch writes")
+WRITE_BATCH_POINTS = REGISTRY.histogram("agent_write_batch_points", "Points per InfluxDB batch write",
+                                        buckets=SIZE_BUCKETS)
+
+
+class InfluxWriter:
+    """Escritor persistente do InfluxDB compartilhado entre os ciclos de coleta.
+
+    Mantém um único cliente (com pool de conexões HTTP) durante toda a vida do
+    agente, verifica o bucket apenas na inicialização (e novamente após uma
+    falha) e esvazia uma fila limitada em memória numa thread de fundo. O loop
+    de coleta apenas enfileira os pontos com ``submit`` e nunca bloqueia.
+
+    Com um ``WriteSpool``, os lotes que falham (e a fila pendente) vão para o
+    disco em vez de voltar à memória, e são reenviados em segundo plano, com
+    taxa limitada a ``replay_rate`` linhas/s, quando o InfluxDB volta a
+    responder. Os dados novos sempre têm prioridade sobre o reenvio.
+
+    O ``influxdb_client`` só é importado na primeira conexão (na thread de
+    escrita), não no import do agente; até o primeiro lote entregue a fila é
+    esvaziada sem esperar o ``flush_interval``. ``HttpInfluxWriter``
+    (``influx_http``) troca o cliente por um HTTP mínimo mantendo a fila e o
+    spool.
+    """
+
+    name = "influxdb"
+
+    def __init__(self, url, token, org, bucket, batch_size=500, max_pending=50_000,
+                 flush_interval=1.0, retry_interval=5.0, timeout_ms=10_000,
+                 spool=None, replay_rate=5000):
+        self.url = url
+        self.token = token
+        self.org = org
+        self.bucket = bucket
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.timeout_ms = timeout_ms
+        self.spool = spool
+        self.replay_rate = replay_rate
+        self._next_replay = 0.0
+        self._healthy = True
+
+        self._client = None
+        self._write_api = None
+        self._bucket_checked = False
+
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+        # Métricas do escritor
+        self.points_written = 0
+        self.points_dropped = 0
+        self.batches_written = 0
+        self.write_failures = 0
+        self.points_rejected = 0
+        self.last_write_latency = 0.0
+        self._latency_total = 0.0
+
+    def start(self):
+        """Inicia a thread de escrita em segundo plano."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="influx-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, records):
+        """Enfileira os pontos sem bloquear. Retorna False se a fila estiver cheia."""
+        if not records:
+            return True
+        with self._cond:
+            if len(self._pending) + len(records) > self.max_pending:
+                if self.spool is not None:
+                    print(f"Write queue full ({len(self._pending)} pending), spooling {len(records)} points to disk")
+                    self.spool.append(self._to_lines(records))
+                    return True
+                self.points_dropped += len(records)
+                print(f"Write queue full ({len(self._pending)} pending), dropping {len(records)} points")
+                return False
+            self._pending.extend(records)
+            # Até o primeiro lote entregue não espera o flush_interval: o primeiro ponto sai logo
+            if len(self._pending) >= self.batch_size or not self.batches_written:
+                self._cond.notify()
+        return True
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    def stats(self):
+        """Retorna um retrato das métricas do escritor."""
+        avg_latency = self._latency_total / self.batches_written if self.batches_written else 0.0
+        stats = {
+            "queue_depth": self.queue_depth,
+            "points_written": self.points_written,
+            "points_dropped": self.points_dropped,
+            "points_rejected": self.points_rejected,
+            "batches_written": self.batches_written,
+            "write_failures": self.write_failures,
+            "last_write_latency": self.last_write_latency,
+            "avg_write_latency": avg_latency,
+        }
+        if self.spool is not None:
+            stats.update({
+                "spool_bytes": self.spool.size_bytes,
+                "spool_lines_spooled": self.spool.lines_spooled,
+                "spool_lines_replayed": self.spool.lines_replayed,
+                "spool_bytes_evicted": self.spool.bytes_evicted,
+            })
+        return stats
+
+    def stats_line(self):
+        s = self.stats()
+        line = (f"Writer: queue={s['queue_depth']}, written={s['points_written']}, "
+                f"dropped={s['points_dropped']}, failures={s['write_failures']}, "
+                f"last_latency={s['last_write_latency'] * 1000:.1f}ms, "
+                f"avg_latency={s['avg_write_latency'] * 1000:.1f}ms")
+        if self.spool is not None:
+            line += (f", spool={s['spool_bytes'] / 1024:.0f}KiB, spooled={s['spool_lines_spooled']}, "
+                     f"replayed={s['spool_lines_replayed']}, evicted={s['spool_bytes_evicted'] / 1024:.0f}KiB")
+        return line
+
+    def close(self, timeout=10.0):
+        """Esvazia a fila pendente e encerra o cliente."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._disconnect()
+        if self.spool is not None:
+            self.spool.close()
+
+    @staticmethod
+    def _to_lines(records):
+        # Serializa os registros em line protocol (bytes) para o spool
+        return to_lines(records)
+
+    @staticmethod
+    def _is_rejected(error):
+        # Lote recusado pelo InfluxDB (line protocol inválido): repetir não adianta
+        return getattr(error, "status", None) in (400, 422)
+
+    def _replay_due(self):
+        return self.spool is not None and time.monotonic() >= self._next_replay and bool(self.spool)
+
+    def _connect(self):
+        if self._client is None:
+            from influxdb_client import InfluxDBClient
+            from influxdb_client.client.write_api import SYNCHRONOUS
+
+            self._client = InfluxDBClient(url=self.url, token=self.token, org=self.org, timeout=self.timeout_ms)
+            self._write_api = self._client.write_api(write_options=SYNCHRONOUS)
+        if not self._bucket_checked:
+            if not self._client.buckets_api().find_bucket_by_name(self.bucket):
+                raise RuntimeError(f"Bucket '{self.bucket}' not found. Please create it.")
+            self._bucket_checked = True
+
+    def _disconnect(self):
+        # Após uma falha o bucket é verificado de novo na próxima conexão
+        self._bucket_checked = False
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception as e:
+                print(f"Error closing InfluxDB client: {str(e)}")
+        self._client = None
+        self._write_api = None
+
+    def _next_batch(self):
+        with self._cond:
+            # Antes do primeiro lote entregue, pontos já na fila saem sem esperar o flush_interval
+            first = not self.batches_written and self._pending
+            if len(self._pending) < self.batch_size and not self._stopping and not first:
+                timeout = self.flush_interval
+                if self.spool is not None and self.spool:
+                    timeout = min(timeout, max(0.0, self._next_replay - time.monotonic()))
+                self._cond.wait(timeout)
+            n = min(self.batch_size, len(self._pending))
+            return [self._pending.popleft() for _ in range(n)]
+
+    def _requeue(self, batch):
+        # Devolve o lote ao início da fila, respeitando o limite de pendências
+        with self._cond:
+            room = max(0, self.max_pending - len(self._pending))
+            if room < len(batch):
+                self.points_dropped += len(batch) - room
+                batch = batch[len(batch) - room:]
+            self._pending.extendleft(reversed(batch))
+
+    def _send(self, batch):
+        self._write_api.write(bucket=self.bucket, org=self.org, record=batch)
+
+    def _write_batch(self, batch):
+        start = time.perf_counter()
+        self._connect()
+        self._send(batch)
+        latency = time.perf_counter() - start
+        WRITE_SECONDS.observe(latency)
+        WRITE_BATCH_POINTS.observe(len(batch))
+        self.last_write_latency = latency
+        self._latency_total += latency
+        self.batches_written += 1
+        self.points_written += len(batch)
+        self._healthy = True
+        startup.mark("first_write")
+
+    def _spool_pending(self, batch):
+        # Move o lote que falhou e toda a fila pendente para o disco
+        with self._cond:
+            pending = list(self._pending)
+            self._pending.clear()
+        lines = self._to_lines(batch) + self._to_lines(pending)
+        self.spool.append(lines)
+        print(f"Spooled {len(lines)} points to disk ({self.spool.size_bytes / 1024:.0f} KiB pending)")
+
+    def _schedule_retry(self):
+        self._healthy = False
+        # Jitter evita que vários agentes reenviem o backlog ao mesmo tempo
+        self._next_replay = time.monotonic() + self.retry_interval + random.uniform(0, self.retry_interval)
+
+    def _replay_spool(self):
+        lines, token = self.spool.read_batch(self.batch_size)
+        try:
+            if lines:
+                self._write_batch(lines)
+        except Exception as e:
+            self.write_failures += 1
+            if self._is_rejected(e):
+                print(f"InfluxDB rejected {len(lines)} spooled points, discarding them: {str(e)}")
+                self.points_rejected += len(lines)
+                self.spool.ack(token)
+                return
+            print(f"Error replaying spooled points to InfluxDB: {str(e)}")
+            self._disconnect()
+            self._schedule_retry()
+            return
+        self.spool.ack(token)
+        # Limita a taxa de reenvio para não sobrecarregar o InfluxDB recém-recuperado
+        self._next_replay = time.monotonic() + len(lines) / self.replay_rate
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if self._stopping:
+                    return
+                if self._replay_due():
+                    self._replay_spool()
+                continue
+            if self.spool is not None and not self._healthy and time.monotonic() < self._next_replay:
+                # InfluxDB indisponível: vai direto para o disco até a próxima tentativa
+                self.spool.append(self._to_lines(batch))
+                continue
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                self.write_failures += 1
+                print(f"Error connecting to or writing to InfluxDB: {str(e)}")
+                if self._is_rejected(e):
+                    self.points_rejected += len(batch)
+                    continue
+                self._disconnect()
+                if self.spool is not None:
+                    self._spool_pending(batch)
+                    self._schedule_retry()
+                    if self._stopping:
+                        return
+                    continue
+                if self._stopping:
+                    self.points_dropped += len(batch)
+                    return
+                self._requeue(batch)
+                time.sleep(self.retry_interval)
+                continue
+            if self._replay_due():
+                self._replay_spool()
@@ -0,0 +1,81 @@
+import math
+from datetime import datetime, timezone
+
+EPOCH = datetime.fromtimestamp(0, tz=timezone.utc)
+
+# Mesmo escape de chaves/valores de tag usado pelo influxdb_client
+_ESCAPE_KEY = str.maketrans({
+    ',': r'\,',
+    '=': r'\=',
+    ' ': r'\ ',
+    '\n': r'\n',
+    '\t': r'\t',
+    '\r': r'\r',
+})
+
+
+def timestamp_ns(value):
+    """Converte um datetime (ingênuo = UTC) em nanossegundos, como o ``Point.time``."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value.astimezone(timezone.utc) - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10 ** 9 + delta.microseconds * 10 ** 3
+
+
+def escape_tag(value):
+    """Escapa um valor de tag exatamente como o ``Point`` (com o espaço após ``\\`` final)."""
+    escaped = str(value).translate(_ESCAPE_KEY)
+    if escaped.endswith('\\'):
+        escaped += ' '
+    return escaped
+
+
+def tag_pair(key, value):
+    """``,chave=valor`` escapado; vazio quando o valor é vazio (o ``Point`` omite a tag)."""
+    escaped = escape_tag(value)
+    return f",{key}={escaped}" if escaped else ""
+
+
+def escape_string_field(value):
+    """Valor de campo string entre aspas, com ``\\`` e ``"`` escapados."""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def format_float(value):
+    """Formata um campo float como o ``Point``; retorna None para valores não finitos."""
+    value = float(value)
+    if not math.isfinite(value):
+        return None
+    s = repr(value)
+    if s.endswith('.0'):
+        s = s[:-2]
+    return s
+
+
+def format_line(measurement, tags, fields, timestamp):
+    """Linha de line protocol com a mesma saída do ``Point.to_line_protocol()``.
+
+    Tags e campos em ordem alfabética; tags vazias ou None e campos None ou
+    não finitos são omitidos; ``int`` vira inteiro (``i``), ``bool`` vira
+    ``true``/``false`` e ``str`` vira string. ``timestamp`` é um datetime
+    (ingênuo = UTC). Retorna "" quando não sobra nenhum campo, como o ``Point``.
+    """
+    parts = []
+    for key, value in sorted(fields.items()):
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = "true" if value else "false"
+        elif isinstance(value, int):
+            value = f"{value}i"
+        elif isinstance(value, str):
+            value = escape_string_field(value)
+        else:
+            value = format_float(value)
+            if value is None:
+                continue
+        parts.append(f"{key}={value}")
+    if not parts:
+        return ""
+    tag_text = "".join(tag_pair(key, value) for key, value in sorted(tags.items()) if value is not None)
+    return f"{measurement}{tag_text} {','.join(parts)} {timestamp_ns(timestamp)}"
@@ -0,0 +1,253 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Buckets padrão (segundos), do Prometheus estendidos para ciclos longos
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Buckets para tamanhos (pontos por lote, linhas por ciclo)
+SIZE_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10_000, 50_000, 100_000)
+
+_TAG_ESCAPE = str.maketrans({',': r'\,', '=': r'\=', ' ': r'\ '})
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in items) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """Contador monotônico."""
+
+    kind = "counter"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """Valor instantâneo."""
+
+    kind = "gauge"
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """Histograma de buckets fixos (contagem acumulada por limite superior)."""
+
+    kind = "histogram"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """Observa a duração do bloco (``perf_counter``)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def cumulative(self):
+        """Pares (limite superior, contagem acumulada), terminando em +Inf."""
+        with self._lock:
+            counts = list(self._counts)
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """Estimativa do quantil por interpolação linear dentro do bucket (como ``histogram_quantile``)."""
+        buckets = self.cumulative()
+        total = buckets[-1][1]
+        if not total:
+            return 0.0
+        rank = q * total
+        lower_bound, lower_count = 0.0, 0
+        for bound, count in buckets:
+            if count >= rank:
+                if bound == math.inf:
+                    return lower_bound
+                if count == lower_count:
+                    return bound
+                return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+            lower_bound, lower_count = bound, count
+        return lower_bound
+
+
+class MetricsRegistry:
+    """Registro de métricas do próprio agente (auto-instrumentação).
+
+    As métricas são identificadas por nome e labels; ``counter``/``gauge``/
+    ``histogram`` retornam sempre a mesma instância para a mesma combinação,
+    então os pontos instrumentados podem guardá-la e apenas incrementá-la.
+    Registrar uma métrica custa um lookup em dicionário; atualizar, um lock
+    sem contenção. ``add_collector`` expõe como gauges os valores de um
+    ``stats()`` já existente (ex: ``InfluxWriter.stats``), lidos só na coleta.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._help = {}
+        self._collectors = []
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        key = (name, tuple(sorted((labels or {}).items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = cls(**kwargs)
+                    self._help.setdefault(name, help_text)
+        if not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} already registered as a {metric.kind}")
+        return metric
+
+    def counter(self, name, help_text="", labels=None):
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text="", labels=None):
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text="", labels=None, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def add_collector(self, prefix, collect):
+        """Registra ``collect()`` -> dict de valores numéricos, expostos como ``<prefix>_<chave>``."""
+        with self._lock:
+            self._collectors.append((prefix, collect))
+
+    def _snapshot(self):
+        # [(nome, labels, métrica)] incluindo os gauges dos coletores
+        with self._lock:
+            items = [(name, labels, metric) for (name, labels), metric in self._metrics.items()]
+            collectors = list(self._collectors)
+        for prefix, collect in collectors:
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"Error collecting {prefix} metrics: {str(e)}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)):
+                    gauge = Gauge()
+                    gauge.set(value)
+                    items.append((f"{prefix}_{key}", (), gauge))
+        items.sort(key=lambda item: (item[0], item[1]))
+        return items
+
+    def render(self):
+        """Métricas no formato texto do Prometheus (versão 0.0.4)."""
+        out = []
+        last_name = None
+        for name, labels, metric in self._snapshot():
+            if name != last_name:
+                help_text = self._help.get(name)
+                if help_text:
+                    out.append(f"# HELP {name} {help_text}")
+                out.append(f"# TYPE {name} {metric.kind}")
+                last_name = name
+            if metric.kind == "histogram":
+                for bound, count in metric.cumulative():
+                    out.append(f"{name}_bucket{_label_text(labels, ('le', _format_value(bound)))} {count}")
+                out.append(f"{name}_sum{_label_text(labels)} {_format_value(metric.sum)}")
+                out.append(f"{name}_count{_label_text(labels)} {metric.count}")
+            else:
+                out.append(f"{name}{_label_text(labels)} {_format_value(metric.value)}")
+        return "\n".join(out) + "\n"
+
+    def to_lines(self, measurement="agent_self", tags=None):
+        """Retrato das métricas em line protocol, uma linha por série (tag ``metric``).
+
+        Histogramas viram ``count``, ``sum``, ``p50`` e ``p99``; contadores e
+        gauges, ``value``.
+        """
+        timestamp = time.time_ns()
+        base = measurement + "".join(
+            f",{k}={str(v).translate(_TAG_ESCAPE)}" for k, v in sorted((tags or {}).items()))
+        lines = []
+        for name, labels, metric in self._snapshot():
+            tag_text = base + f",metric={name}" + "".join(
+                f",{k}={str(v).translate(_TAG_ESCAPE)}" for k, v in labels)
+            if metric.kind == "histogram":
+                fields = (f"count={metric.count}i,sum={float(metric.sum)!r},"
+                          f"p50={metric.quantile(0.5)!r},p99={metric.quantile(0.99)!r}")
+            else:
+                value = float(metric.value)
+                if not math.isfinite(value):
+                    continue
+                fields = f"value={value!r}"
+            lines.append(f"{tag_text} {fields} {timestamp}")
+        return lines
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(registry, port, host="0.0.0.0"):
+    """Expõe ``/metrics`` numa thread de fundo; retorna o servidor HTTP."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+# Registro padrão do processo, compartilhado pelo agente e pelo pacote common
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,398 @@
+import gzip
+import os
+import re
+import socket
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from . import startup
+from .metrics import REGISTRY
+
+SINK_WRITE_SECONDS = REGISTRY.histogram("agent_sink_write_seconds", "Latency of sink batch writes")
+
+
+def to_lines(records):
+    """Serializa os registros (Point, str ou bytes) em linhas de line protocol (bytes)."""
+    lines = []
+    for record in records:
+        if hasattr(record, "to_line_protocol"):
+            record = record.to_line_protocol()
+        if isinstance(record, str):
+            record = record.encode()
+        if record:
+            lines.append(record)
+    return lines
+
+
+class QueuedSink:
+    """Base dos destinos com fila própria e thread de escrita.
+
+    ``submit`` só enfileira (fila limitada a ``max_pending``, descartando o
+    excedente) e a thread entrega lotes de até ``batch_size`` linhas a
+    ``_write``. Um destino lento ou com erro perde pontos, mas nunca bloqueia o
+    ciclo de coleta nem os outros destinos. Mesma interface do
+    ``InfluxWriter``: ``submit``, ``stats``, ``stats_line`` e ``close``.
+    """
+
+    name = "sink"
+
+    def __init__(self, batch_size=500, max_pending=50_000, flush_interval=1.0):
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+        # Métricas do destino
+        self.points_written = 0
+        self.points_dropped = 0
+        self.batches_written = 0
+        self.write_failures = 0
+        self.last_write_latency = 0.0
+
+    def start(self):
+        """Inicia a thread de escrita em segundo plano."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-sink", daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, records):
+        """Enfileira os pontos sem bloquear. Retorna False se a fila estiver cheia."""
+        if not records:
+            return True
+        with self._cond:
+            if len(self._pending) + len(records) > self.max_pending:
+                self.points_dropped += len(records)
+                print(f"{self.name} sink queue full ({len(self._pending)} pending), dropping {len(records)} points")
+                return False
+            self._pending.extend(records)
+            # Até o primeiro lote entregue não espera o flush_interval: o primeiro ponto sai logo
+            if len(self._pending) >= self.batch_size or not self.batches_written:
+                self._cond.notify()
+        return True
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "points_written": self.points_written,
+            "points_dropped": self.points_dropped,
+            "batches_written": self.batches_written,
+            "write_failures": self.write_failures,
+            "last_write_latency": self.last_write_latency,
+        }
+
+    def stats_line(self):
+        s = self.stats()
+        return (f"{self.name}: queue={s['queue_depth']}, written={s['points_written']}, "
+                f"dropped={s['points_dropped']}, failures={s['write_failures']}")
+
+    def close(self, timeout=10.0):
+        """Esvazia a fila pendente e libera os recursos do destino."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._close()
+
+    def _write(self, lines):
+        raise NotImplementedError
+
+    def _idle(self):
+        # Chamado quando a fila está vazia (ex: rotação de arquivos por tempo)
+        pass
+
+    def _close(self):
+        pass
+
+    def _next_batch(self):
+        with self._cond:
+            # Antes do primeiro lote entregue, pontos já na fila saem sem esperar o flush_interval
+            first = not self.batches_written and self._pending
+            if len(self._pending) < self.batch_size and not self._stopping and not first:
+                self._cond.wait(self.flush_interval)
+            n = min(self.batch_size, len(self._pending))
+            return [self._pending.popleft() for _ in range(n)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if self._stopping:
+                    return
+                self._idle()
+                continue
+            lines = to_lines(batch)
+            start = time.perf_counter()
+            try:
+                self._write(lines)
+            except Exception as e:
+                # Destinos sem reenvio: o lote é descartado
+                self.write_failures += 1
+                self.points_dropped += len(batch)
+                print(f"Error writing {len(batch)} points to {self.name} sink: {str(e)}")
+                continue
+            latency = time.perf_counter() - start
+            SINK_WRITE_SECONDS.observe(latency)
+            self.last_write_latency = latency
+            self.batches_written += 1
+            self.points_written += len(batch)
+            startup.mark("first_write")
+
+
+class UdpSink(QueuedSink):
+    """Line protocol por UDP, sem confirmação (serviço UDP do InfluxDB/Telegraf).
+
+    O endereço é resolvido na criação do destino. As linhas são agrupadas em datagramas de até ``max_packet`` bytes (o padrão
+    cabe num MTU Ethernet, evitando fragmentação). Erros de envio descartam o
+    datagrama; não há retentativa nem spool.
+    """
+
+    name = "udp"
+
+    def __init__(self, host, port, max_packet=1400, **kwargs):
+        super().__init__(**kwargs)
+        self.host = host
+        self.port = int(port)
+        # Resolve o nome uma única vez: o sendto com hostname faria uma consulta DNS por datagrama
+        try:
+            family, _, _, _, self.address = socket.getaddrinfo(host, self.port, type=socket.SOCK_DGRAM)[0]
+        except socket.gaierror as e:
+            raise EnvironmentError(f"Cannot resolve UDP_SINK_ADDRESS host {host}: {str(e)}")
+        self.max_packet = max_packet
+        self._socket = socket.socket(family, socket.SOCK_DGRAM)
+        self.packets_sent = 0
+        self.packets_dropped = 0
+
+    def _send(self, packet):
+        try:
+            self._socket.sendto(packet, self.address)
+            self.packets_sent += 1
+        except OSError as e:
+            self.packets_dropped += 1
+            if self.packets_dropped == 1 or self.packets_dropped % 1000 == 0:
+                print(f"Error sending UDP line protocol to {self.host}:{self.port}: {str(e)}")
+
+    def _write(self, lines):
+        packet = bytearray()
+        for line in lines:
+            if packet and len(packet) + len(line) + 1 > self.max_packet:
+                self._send(packet)
+                packet = bytearray()
+            packet += line
+            packet += b"\n"
+        if packet:
+            self._send(packet)
+
+    def stats(self):
+        stats = super().stats()
+        stats["packets_sent"] = self.packets_sent
+        stats["packets_dropped"] = self.packets_dropped
+        return stats
+
+    def _close(self):
+        self._socket.close()
+
+
+class FileSink(QueuedSink):
+    """Arquivos locais de line protocol comprimidos (gzip ou zstd), com rotação.
+
+    Escreve em ``<prefixo>-<AAAAMMDDTHHMMSS>.lp.<ext>.part`` e renomeia para o
+    nome final ao fechar o arquivo, então só arquivos completos aparecem com a
+    extensão final. Rotaciona a cada ``rotate_bytes`` (não comprimidos) ou
+    ``rotate_seconds`` e, com ``max_files``, apaga os arquivos mais antigos.
+    Os arquivos podem ser importados com ``influx write --compression gzip``.
+    """
+
+    name = "file"
+
+    def __init__(self, directory, prefix="agent", compression="gzip", rotate_bytes=64 * 1024 * 1024,
+                 rotate_seconds=3600, max_files=0, level=None, **kwargs):
+        super().__init__(**kwargs)
+        if compression not in ("gzip", "zstd", "none"):
+            raise ValueError(f"Invalid file sink compression: {compression} (use gzip, zstd or none)")
+        if compression == "zstd":
+            try:
+                import zstandard
+            except ImportError:
+                raise RuntimeError("File sink compression 'zstd' requires the zstandard package")
+            self._zstd = zstandard
+        self.directory = directory
+        self.prefix = prefix
+        self.compression = compression
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.max_files = max_files
+        self.level = level
+        # Só os arquivos deste destino (não os de um prefixo mais longo, ex: agent_api-shard0)
+        self._name_pattern = re.compile(
+            rf"^{re.escape(prefix)}-\d{{8}}T\d{{6}}(-\d+)?{re.escape(self._extension)}$"
+        )
+        os.makedirs(directory, exist_ok=True)
+        self._file = None
+        self._path = None
+        self._opened_at = 0.0
+        self._bytes = 0
+        self.files_written = 0
+
+    @property
+    def _extension(self):
+        return {"gzip": ".lp.gz", "zstd": ".lp.zst", "none": ".lp"}[self.compression]
+
+    def _open(self):
+        name = f"{self.prefix}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}{self._extension}"
+        path = os.path.join(self.directory, name)
+        suffix = 1
+        while os.path.exists(path) or os.path.exists(path + ".part"):
+            path = os.path.join(self.directory, f"{name[:-len(self._extension)]}-{suffix}{self._extension}")
+            suffix += 1
+        raw = open(path + ".part", "wb")
+        if self.compression == "gzip":
+            self._file = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=self.level or 6)
+            self._raw = raw
+        elif self.compression == "zstd":
+            self._file = self._zstd.ZstdCompressor(level=self.level or 3).stream_writer(raw)
+            self._raw = raw
+        else:
+            self._file = self._raw = raw
+        self._path = path
+        self._opened_at = time.monotonic()
+        self._bytes = 0
+
+    def _rotate(self):
+        # Fecha o arquivo atual, publica o nome final e aplica o limite de arquivos
+        if self._file is None:
+            return
+        self._file.close()
+        if self._raw is not self._file and not self._raw.closed:
+            self._raw.close()
+        os.replace(self._path + ".part", self._path)
+        self._file = self._raw = None
+        self.files_written += 1
+        if self.max_files:
+            files = sorted(
+                (os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if self._name_pattern.match(name)),
+                key=os.path.getmtime
+            )
+            for path in files[:-self.max_files]:
+                os.remove(path)
+
+    def _write(self, lines):
+        if self._file is None:
+            self._open()
+        data = b"\n".join(lines) + b"\n"
+        self._file.write(data)
+        self._bytes += len(data)
+        if self._bytes >= self.rotate_bytes:
+            self._rotate()
+        else:
+            self._idle()
+
+    def _idle(self):
+        if self._file is not None and time.monotonic() - self._opened_at >= self.rotate_seconds:
+            self._rotate()
+
+    def stats(self):
+        stats = super().stats()
+        stats.update({"files_written": self.files_written, "current_file_bytes": self._bytes if self._file else 0})
+        return stats
+
+    def _close(self):
+        self._rotate()
+
+
+class FanOut:
+    """Entrega os mesmos pontos a vários destinos, cada um com a própria fila.
+
+    ``submit`` apenas enfileira em cada destino, então um destino lento ou
+    indisponível perde pontos na sua fila sem atrasar a coleta nem os demais.
+    ``stats`` prefixa as métricas com o nome de cada destino.
+    """
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+
+    def start(self):
+        for sink in self.sinks:
+            sink.start()
+        return self
+
+    def submit(self, records):
+        accepted = True
+        for sink in self.sinks:
+            accepted = sink.submit(records) and accepted
+        return accepted
+
+    @property
+    def queue_depth(self):
+        return max((sink.queue_depth for sink in self.sinks), default=0)
+
+    def stats(self):
+        stats = {}
+        for sink in self.sinks:
+            for key, value in sink.stats().items():
+                stats[f"{getattr(sink, 'name', 'influxdb')}_{key}"] = value
+        return stats
+
+    def stats_line(self):
+        return " | ".join(sink.stats_line() for sink in self.sinks)
+
+    def close(self, timeout=10.0):
+        for sink in self.sinks:
+            sink.close(timeout)
+
+
+SINK_NAMES = ("influxdb", "udp", "file")
+
+
+def parse_sinks(text):
+    """Lista de destinos de ``OUTPUT_SINKS`` (ex: ``"influxdb,file"``); valida os nomes."""
+    names = [name.strip().lower() for name in text.split(",") if name.strip()]
+    invalid = [name for name in names if name not in SINK_NAMES]
+    if invalid or not names:
+        raise EnvironmentError(f"Invalid OUTPUT_SINKS: {text} (use a comma-separated list of {', '.join(SINK_NAMES)})")
+    return names
+
+
+def parse_address(text):
+    """``host:port`` (ou ``[ipv6]:port``) em (host, porta)."""
+    host, _, port = text.strip().rpartition(":")
+    if not host or not port.isdigit():
+        raise EnvironmentError(f"Invalid UDP_SINK_ADDRESS: {text} (use host:port)")
+    return host.strip("[]"), int(port)
+
+
+def build_writer(names, influxdb=None, udp_address="", file_dir="", file_prefix="agent",
+                 file_compression="gzip", file_rotate_bytes=64 * 1024 * 1024, file_rotate_seconds=3600,
+                 file_max_files=0, batch_size=500, max_pending=50_000):
+    """Cria e inicia os destinos configurados; com mais de um, retorna um ``FanOut``.
+
+    ``influxdb`` é uma função que cria o ``InfluxWriter``, chamada só quando o
+    destino ``influxdb`` está na lista.
+    """
+    sinks = []
+    for name in names:
+        if name == "influxdb":
+            sinks.append(influxdb())
+        elif name == "udp":
+            host, port = parse_address(udp_address)
+            sinks.append(UdpSink(host, port, batch_size=batch_size, max_pending=max_pending))
+        elif name == "file":
+            sinks.append(FileSink(
+                file_dir, prefix=file_prefix, compression=file_compression, rotate_bytes=file_rotate_bytes,
+                rotate_seconds=file_rotate_seconds, max_files=file_max_files,
+                batch_size=batch_size, max_pending=max_pending
+            ))
+    writer = sinks[0] if len(sinks) == 1 else FanOut(sinks)
+    return writer.start()
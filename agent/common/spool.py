@@ -0,0 +1,170 @@
+import os
+import threading
+import time
+
+
+class WriteSpool:
+    """Spool em disco (write-ahead) para pontos que não puderam ser escritos.
+
+    Os pontos são gravados em line protocol em segmentos append-only
+    (``spool-<seq>.lp``). Um segmento é fechado ao atingir o tamanho ou a idade
+    máxima; apenas segmentos fechados são reenviados, do mais antigo para o
+    mais novo. Quando o spool passa do limite total, ou um segmento passa da
+    idade máxima, os segmentos mais antigos são descartados. Os segmentos
+    sobrevivem a reinícios do agente.
+
+    Um segmento é apagado só depois de reenviado por completo. Se o agente
+    cair no meio do reenvio, o segmento é reenviado desde o início; como as
+    linhas trazem timestamp, o InfluxDB apenas sobrescreve os pontos repetidos.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, segment_bytes=8 * 1024 * 1024,
+                 max_age_seconds=24 * 3600, segment_age_seconds=60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.max_age_seconds = max_age_seconds
+        self.segment_age_seconds = segment_age_seconds
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Segmentos fechados, do mais antigo para o mais novo: [seq, tamanho]
+        self._closed = []
+        for name in sorted(os.listdir(directory)):
+            seq = self._parse_name(name)
+            if seq is not None:
+                self._closed.append([seq, os.path.getsize(self._path(seq))])
+        self._closed.sort()
+        self._next_seq = self._closed[-1][0] + 1 if self._closed else 0
+
+        self._active = None
+        self._active_seq = None
+        self._active_bytes = 0
+        self._active_opened = 0.0
+        # Posição de leitura no segmento mais antigo
+        self._read_offset = 0
+
+        # Métricas do spool
+        self.lines_spooled = 0
+        self.lines_replayed = 0
+        self.bytes_evicted = 0
+        self.segments_evicted = 0
+
+    @staticmethod
+    def _parse_name(name):
+        if name.startswith("spool-") and name.endswith(".lp"):
+            try:
+                return int(name[6:-3])
+            except ValueError:
+                return None
+        return None
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f"spool-{seq:010d}.lp")
+
+    @property
+    def size_bytes(self):
+        return sum(size for _, size in self._closed) + self._active_bytes - self._read_offset
+
+    def __bool__(self):
+        return self.size_bytes > 0
+
+    def append(self, lines):
+        """Acrescenta linhas (bytes) ao segmento ativo."""
+        if not lines:
+            return
+        data = b"\n".join(lines) + b"\n"
+        with self._lock:
+            self._rotate_if_old()
+            if self._active is None:
+                self._active_seq = self._next_seq
+                self._next_seq += 1
+                self._active = open(self._path(self._active_seq), "ab")
+                self._active_bytes = 0
+                self._active_opened = time.monotonic()
+            self._active.write(data)
+            self._active.flush()
+            self._active_bytes += len(data)
+            self.lines_spooled += len(lines)
+            if self._active_bytes >= self.segment_bytes:
+                self._close_active()
+            self._enforce_limits()
+
+    def _close_active(self):
+        if self._active is not None:
+            self._active.close()
+            self._closed.append([self._active_seq, self._active_bytes])
+            self._active = None
+            self._active_seq = None
+            self._active_bytes = 0
+
+    def _rotate_if_old(self):
+        if self._active is not None and time.monotonic() - self._active_opened >= self.segment_age_seconds:
+            self._close_active()
+
+    def _drop_oldest(self):
+        seq, size = self._closed.pop(0)
+        try:
+            os.remove(self._path(seq))
+        except FileNotFoundError:
+            pass
+        self.bytes_evicted += size - self._read_offset
+        self.segments_evicted += 1
+        self._read_offset = 0
+
+    def _enforce_limits(self):
+        now = time.time()
+        while self._closed and self.size_bytes > self.max_bytes:
+            self._drop_oldest()
+        while self._closed:
+            try:
+                age = now - os.path.getmtime(self._path(self._closed[0][0]))
+            except FileNotFoundError:
+                age = self.max_age_seconds + 1
+            if age <= self.max_age_seconds:
+                break
+            self._drop_oldest()
+
+    def read_batch(self, max_lines):
+        """Lê até ``max_lines`` linhas do segmento mais antigo, sem removê-las.
+
+        Retorna ``(linhas, token)``; chame ``ack(token)`` após reenviá-las.
+        """
+        with self._lock:
+            self._rotate_if_old()
+            self._enforce_limits()
+            if not self._closed:
+                return [], None
+            seq, size = self._closed[0]
+            lines = []
+            with open(self._path(seq), "rb") as f:
+                f.seek(self._read_offset)
+                while len(lines) < max_lines:
+                    line = f.readline()
+                    # Linha sem "\n" no fim do arquivo: escrita interrompida, descarta
+                    if not line.endswith(b"\n"):
+                        f.seek(size)
+                        break
+                    if len(line) > 1:
+                        lines.append(line[:-1])
+                end = f.tell()
+            return lines, (seq, end, len(lines))
+
+    def ack(self, token):
+        """Confirma o reenvio de um lote lido por ``read_batch``."""
+        if token is None:
+            return
+        seq, end, count = token
+        with self._lock:
+            if not self._closed or self._closed[0][0] != seq:
+                return
+            self.lines_replayed += count
+            self._read_offset = end
+            if end >= self._closed[0][1]:
+                os.remove(self._path(seq))
+                self._closed.pop(0)
+                self._read_offset = 0
+
+    def close(self):
+        with self._lock:
+            self._close_active()
@@ -0,0 +1,52 @@
+import os
+import threading
+import time
+
+from .metrics import REGISTRY
+
+_STARTUP_HELP = "Seconds from process start to each startup milestone (imports, first_fetch, first_write)"
+
+
+def _process_age():
+    # Idade do processo pelo /proc (inclui o boot do interpretador); sem /proc, 0 no import deste módulo
+    try:
+        with open("/proc/self/stat", encoding="ascii") as f:
+            # O nome do executável (entre parênteses) pode conter espaços
+            start_ticks = int(f.read().rpartition(")")[2].split()[19])
+        with open("/proc/uptime", encoding="ascii") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+_AGE_AT_IMPORT = _process_age()
+_MONOTONIC_AT_IMPORT = time.monotonic()
+_marks = {}
+_lock = threading.Lock()
+
+
+def since_start():
+    """Segundos desde o início do processo."""
+    return _AGE_AT_IMPORT + time.monotonic() - _MONOTONIC_AT_IMPORT
+
+
+def mark(stage):
+    """Registra a primeira ocorrência de uma etapa da inicialização (métrica agent_startup_seconds).
+
+    Chamadas seguintes para a mesma etapa são ignoradas, então os pontos do
+    ciclo podem chamá-la sempre (custa um lookup em dicionário).
+    """
+    if stage in _marks:
+        return
+    with _lock:
+        if stage in _marks:
+            return
+        seconds = _marks[stage] = since_start()
+    REGISTRY.gauge("agent_startup_seconds", _STARTUP_HELP, {"stage": stage}).set(seconds)
+    print(f"Startup: {stage.replace('_', ' ')} after {seconds:.3f}s")
+
+
+def marks():
+    """Etapas já registradas -> segundos desde o início do processo."""
+    return dict(_marks)
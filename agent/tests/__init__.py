@@ -0,0 +1 @@
+"""Testes dos agentes de coleta (pytest)."""
@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pytest
+
+# Os módulos dos agentes são importados pelo nome, como nos contêineres
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (AGENT_DIR, os.path.join(AGENT_DIR, "agent_api"), os.path.join(AGENT_DIR, "agent_sites")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Configuração mínima para importar os agentes (nada é conectado no import)
+INFLUXDB_ENV = {
+    "INFLUXDB_URL": "http://127.0.0.1:9",
+    "INFLUXDB_TOKEN": "test",
+    "INFLUXDB_ORG": "test",
+    "INFLUXDB_BUCKET": "test",
+}
+AGENT_API_ENV = dict(INFLUXDB_ENV, VIAIPE_API_URL="http://127.0.0.1:9/api")
+
+
+class FakeWriter:
+    """Escritor em memória no lugar do ``InfluxWriter``; guarda as linhas recebidas."""
+
+    def __init__(self):
+        self.lines = []
+
+    def submit(self, records):
+        self.lines.extend(records)
+
+    def stats(self):
+        return {}
+
+
+@pytest.fixture
+def agent_api(monkeypatch):
+    """Módulo ``agent_api`` com cache, codificador e escritor novos a cada teste."""
+    for name, value in AGENT_API_ENV.items():
+        monkeypatch.setenv(name, value)
+    import agent_api as module
+    from change_cache import ChangeCache, ConditionalCache
+    from line_protocol import ViaIpeEncoder
+
+    monkeypatch.setattr(module, "change_cache", ChangeCache(force_refresh_seconds=module.FORCE_REFRESH_SECONDS))
+    monkeypatch.setattr(module, "conditional_cache", ConditionalCache())
+    monkeypatch.setattr(module, "encoder", ViaIpeEncoder())
+    monkeypatch.setattr(module, "_writer", FakeWriter())
+    return module
+
+
+@pytest.fixture
+def agent_sites(monkeypatch):
+    """Módulo ``agent_sites`` com o prober ICMP e o escritor reiniciados a cada teste."""
+    for name, value in INFLUXDB_ENV.items():
+        monkeypatch.setenv(name, value)
+    import agent_sites as module
+
+    monkeypatch.setattr(module, "_icmp_prober", None)
+    monkeypatch.setattr(module, "_writer", FakeWriter())
+    return module
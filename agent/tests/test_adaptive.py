@@ -0,0 +1,161 @@
+import asyncio
+import itertools
+
+import pytest
+
+from common.adaptive import AdaptiveInterval, CircuitBreaker, FixedRateTicker
+
+# Alvos/loops únicos por teste: as métricas ficam no registro global
+_names = itertools.count()
+
+
+def unique(prefix):
+    return f"test-{prefix}-{next(_names)}"
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_after_threshold_and_backs_off_exponentially():
+    clock = FakeClock()
+    breaker = CircuitBreaker(unique("breaker"), failure_threshold=3, base_backoff=10, max_backoff=35, jitter=0,
+                             clock=clock)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state_name == "open" and breaker.backoff == 10
+
+    clock.now = 9.9
+    assert not breaker.allow()
+    clock.now = 10
+    # Fim do backoff: uma única chamada de teste
+    assert breaker.allow() and breaker.state_name == "half_open"
+    assert not breaker.allow()
+
+    # Falha no meio aberto reabre no próximo degrau, limitado a max_backoff
+    for expected in (20, 35, 35):
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN and breaker.backoff == expected
+        clock.now += expected
+        assert breaker.allow()
+
+    breaker.record_success()
+    assert (breaker.state, breaker.failures, breaker.backoff, breaker.opens) == (CircuitBreaker.CLOSED, 0, 0.0, 0)
+    # Depois de fechar volta ao primeiro degrau
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.backoff == 10
+
+
+def test_unanswered_trial_is_released_again_after_the_backoff():
+    clock = FakeClock()
+    breaker = CircuitBreaker(unique("breaker"), failure_threshold=1, base_backoff=10, jitter=0, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    assert breaker.allow()
+    # A chamada de teste não reportou resultado (ex: exceção fora do breaker)
+    clock.now = 19
+    assert not breaker.allow()
+    clock.now = 20
+    assert breaker.allow()
+
+
+def test_breaker_jitter_stays_within_bounds():
+    for _ in range(50):
+        breaker = CircuitBreaker(unique("breaker"), failure_threshold=1, base_backoff=10, jitter=0.2,
+                                 clock=FakeClock())
+        breaker.record_failure()
+        assert 8 <= breaker.backoff <= 12
+
+
+def test_adaptive_interval_follows_the_change_period():
+    clock = FakeClock()
+    poller = AdaptiveInterval(unique("poll"), initial=60, min_interval=10, max_interval=600, clock=clock)
+    # Sem período estimado o intervalo inicial é mantido
+    assert poller.observe(True) == 60
+    for _ in range(5):
+        clock.now += 100
+        interval = poller.observe(True)
+    # Duas coletas por mudança
+    assert interval == pytest.approx(50)
+
+    # Upstream parado: nada muda dentro do período estimado, depois desacelera aos poucos
+    clock.now += 50
+    assert poller.observe(False) == pytest.approx(50)
+    intervals = []
+    for _ in range(20):
+        clock.now += poller.interval
+        intervals.append(poller.observe(False))
+    assert intervals[:3] == pytest.approx([50, 62.5, 78.125])
+    # Cresce até o máximo (ajustes menores que 5% são ignorados)
+    assert intervals == sorted(intervals) and 570 <= intervals[-1] <= 600
+
+    # Mudanças a cada 20 s: o intervalo volta ao mínimo
+    for _ in range(30):
+        clock.now += 20
+        interval = poller.observe(True)
+    assert interval == pytest.approx(10, rel=0.05)
+
+
+def test_adaptive_interval_ignores_small_adjustments():
+    clock = FakeClock()
+    poller = AdaptiveInterval(unique("poll"), initial=50, min_interval=1, max_interval=600, clock=clock)
+    poller.observe(True)
+    clock.now += 102
+    # Alvo de 51 s: menos de 5% de diferença, o intervalo não muda
+    assert poller.observe(True) == 50
+
+
+def test_ticker_keeps_a_fixed_grid_and_skips_missed_slots():
+    clock = FakeClock(100.0)
+    ticker = FixedRateTicker(unique("loop"), clock=clock)
+    assert ticker.next_delay(10) == 10
+    # Ciclos de durações diferentes não acumulam deriva
+    clock.now = 113
+    assert ticker.next_delay(10) == 7
+    clock.now = 120.5
+    assert ticker.next_delay(10) == 9.5
+    # Ciclo que estoura a grade: os horários 140 e 150 ficaram para trás e são pulados
+    clock.now = 155
+    assert ticker.next_delay(10) == 5
+    assert ticker.last_start == 160 and ticker.missed_slots == 2
+    # Novo intervalo reancora a grade no início do ciclo atual
+    clock.now = 161
+    assert ticker.next_delay(30) == 29
+
+
+def test_open_site_breaker_writes_failure_points(agent_sites, monkeypatch):
+    monkeypatch.setattr(agent_sites, "CIRCUIT_BREAKER_THRESHOLD", 1)
+    monkeypatch.setattr(agent_sites, "PAGE_LOAD_TIMING", "both")
+    monkeypatch.setattr(agent_sites, "breakers", {})
+    site = {"name": unique("site"), "ping_target": "192.0.2.1", "page_load_url": "https://down.example/",
+            "interval": 60.0, "offset": 0.0}
+    agent_sites.record_site_results([site], [{"site_name": site["name"], "success": False}])
+    assert agent_sites.get_breaker(site).state_name == "open"
+
+    results = asyncio.run(agent_sites.run_site_tests(site))
+    assert [(r["test_type"], r.get("connection")) for r in results] == [
+        ("ping", None), ("page_load", "cold"), ("page_load", "warm")]
+    agent_sites.save_to_influx(results)
+    lines = agent_sites.get_writer().lines
+    assert len(lines) == 3
+    assert all("success=0" in line and "skipped=1" in line for line in lines)
+    # Os pontos pulados não contam como nova falha do site
+    assert agent_sites.get_breaker(site).failures == 1
+
+
+def test_open_api_breaker_counts_a_skip_not_a_failure(agent_api, monkeypatch):
+    monkeypatch.setattr(agent_api, "CIRCUIT_BREAKER_THRESHOLD", 1)
+    monkeypatch.setattr(agent_api, "breakers", {})
+    agent_api.record_fetch(agent_api.API_URL, False)
+    skipped, failures = agent_api.FETCH_SKIPPED.value, agent_api.FETCH_FAILURES.value
+    assert agent_api.fetch_data() is None
+    assert agent_api.FETCH_SKIPPED.value == skipped + 1
+    assert agent_api.FETCH_FAILURES.value == failures
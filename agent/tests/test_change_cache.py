@@ -0,0 +1,120 @@
+from datetime import datetime
+
+from change_cache import ChangeCache, ConditionalCache
+
+URL = "http://viaipe.test/api/norte"
+NOW = datetime(2024, 5, 1, 12, 0, 0)
+
+
+def location(lat=-1.5, traffic_in=100.0):
+    return {
+        "id": "pop-pa",
+        "name": "PoP PA",
+        "lat": lat,
+        "lng": -48.5,
+        "data": {
+            "smoke": {"loss": 0.0, "avg_val": 12.5, "max_loss": 0.0, "val": 11.0, "max_val": 20.0, "avg_loss": 0.0},
+            "interfaces": [
+                {"nome": "ipe-1", "traffic_graph_id": "10", "tipo": "backbone", "client_side": "A",
+                 "traffic_in": traffic_in, "traffic_out": 50.0},
+                {"nome": "ipe-2", "traffic_graph_id": "11", "tipo": "cliente", "client_side": "B",
+                 "traffic_in": 7.0, "traffic_out": 3.0},
+            ],
+        },
+    }
+
+
+def measurements(lines):
+    return [line.split(b",", 1)[0].decode() for line in lines]
+
+
+def test_conditional_cache_sends_validators_and_reuses_payload():
+    cache = ConditionalCache()
+    assert cache.request_headers(URL) == {}
+    assert cache.not_modified_payload(URL) is None
+
+    payload = [{"id": "pop-pa"}]
+    cache.store(URL, {"ETag": '"v1"', "Last-Modified": "Wed, 01 May 2024 12:00:00 GMT"}, payload)
+    assert cache.request_headers(URL) == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Wed, 01 May 2024 12:00:00 GMT",
+    }
+    assert cache.not_modified_payload(URL) is payload
+    assert (cache.modified, cache.not_modified) == (1, 1)
+
+
+def test_conditional_cache_drops_entry_without_validators():
+    cache = ConditionalCache()
+    cache.store(URL, {"ETag": '"v1"'}, [1])
+    assert cache.request_headers(URL) == {"If-None-Match": '"v1"'}
+
+    # Sem ETag/Last-Modified não há como revalidar: o payload antigo não pode ser reaproveitado
+    cache.store(URL, {}, [2])
+    assert cache.request_headers(URL) == {}
+    assert cache.not_modified_payload(URL) is None
+
+
+def test_change_cache_skips_unchanged_and_forces_refresh():
+    cache = ChangeCache(force_refresh_seconds=300)
+    assert cache.changed("pop-pa", (1, 2), now=0)
+    assert not cache.changed("pop-pa", (1, 2), now=100)
+    assert cache.changed("pop-pa", (1, 3), now=150)
+    assert not cache.changed("pop-pa", (1, 3), now=449)
+    # O período de atualização forçada conta a partir da última escrita, não da última consulta
+    assert cache.changed("pop-pa", (1, 3), now=450)
+    assert not cache.changed("pop-pa", (1, 3), now=500)
+    assert (cache.hits, cache.misses, cache.forced) == (3, 2, 1)
+
+
+def test_change_cache_prunes_records_no_longer_seen():
+    cache = ChangeCache()
+    cache.changed("a", 1, now=0)
+    cache.changed("b", 1, now=0)
+    cache.changed("b", 1, now=50)
+    assert cache.prune(max_age=30, now=60) == 1
+    assert len(cache) == 1
+    # "a" volta como registro novo
+    assert cache.changed("a", 1, now=61)
+    assert cache.misses == 3
+
+
+def test_unchanged_mode_write_keeps_every_point(agent_api, monkeypatch):
+    monkeypatch.setattr(agent_api, "UNCHANGED_MODE", "write")
+    agent_api.save_to_influx([location()], NOW)
+    agent_api.save_to_influx([location()], NOW)
+    assert measurements(agent_api._writer.lines) == [
+        "viaipe_location_metrics", "viaipe_interface_metrics", "viaipe_interface_metrics",
+    ] * 2
+
+
+def test_unchanged_mode_skip_writes_only_changes(agent_api, monkeypatch):
+    monkeypatch.setattr(agent_api, "UNCHANGED_MODE", "skip")
+    assert agent_api.save_to_influx([location()], NOW) == 3
+    assert agent_api.save_to_influx([location()], NOW) == 0
+
+    # Só a interface cujo tráfego mudou é escrita de novo
+    agent_api._writer.lines.clear()
+    assert agent_api.save_to_influx([location(traffic_in=101.0)], NOW) == 1
+    assert agent_api._writer.lines[0].startswith(b"viaipe_interface_metrics,")
+    assert b"interface_nome=ipe-1" in agent_api._writer.lines[0]
+
+
+def test_unchanged_mode_heartbeat_replaces_skipped_points(agent_api, monkeypatch):
+    monkeypatch.setattr(agent_api, "UNCHANGED_MODE", "heartbeat")
+    agent_api.save_to_influx([location()], NOW)
+    agent_api._writer.lines.clear()
+
+    agent_api.save_to_influx([location(lat=-1.6)], NOW)
+    assert measurements(agent_api._writer.lines) == ["viaipe_location_metrics", "viaipe_location_heartbeat"]
+    assert agent_api._writer.lines[1] == (
+        b"viaipe_location_heartbeat,location_id=pop-pa unchanged_points=2i "
+        + str(agent_api.timestamp_ns(NOW)).encode()
+    )
+
+
+def test_force_refresh_rewrites_unchanged_points(agent_api, monkeypatch):
+    monkeypatch.setattr(agent_api, "UNCHANGED_MODE", "skip")
+    monkeypatch.setattr(agent_api, "change_cache", ChangeCache(force_refresh_seconds=0))
+    agent_api.save_to_influx([location()], NOW)
+    assert agent_api.save_to_influx([location()], NOW) == 3
+    assert agent_api.change_cache.forced == 3
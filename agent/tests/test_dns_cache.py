@@ -0,0 +1,300 @@
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from dns_cache import DnsCache, DnsResponseError, build_query, parse_response, query_a, read_nameservers
+from http_timing import PageTimer
+
+QUERY_ID = 0x1234
+
+
+def question(host):
+    return build_query(host, QUERY_ID)[12:]
+
+
+def answer(name, rtype, ttl, rdata):
+    return name + struct.pack("!HHIH", rtype, 1, ttl, len(rdata)) + rdata
+
+
+def response(host, records, query_id=QUERY_ID, rcode=0, flags=0x8180):
+    """Resposta DNS com ``records`` já codificados, depois da pergunta de ``host``."""
+    header = struct.pack("!HHHHHH", query_id, flags | rcode, 1, len(records), 0, 0)
+    return header + question(host) + b"".join(records)
+
+
+def a_record(ip, ttl, name=b"\xc0\x0c"):
+    return answer(name, 1, ttl, socket.inet_aton(ip))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StubDnsServer:
+    """Servidor DNS UDP local: ``zones`` mapeia nome -> (endereços, ttl), um rcode (int),
+    ``"truncated"`` (bit TC) ou ``"malformed"`` (registro cortado no meio)."""
+
+    def __init__(self, zones, delay=0.0, stray_first=False):
+        self.zones = zones
+        self.delay = delay
+        self.stray_first = stray_first
+        self.queries = []
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.address = f"127.0.0.1:{self.sock.getsockname()[1]}"
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                data, client = self.sock.recvfrom(512)
+            except OSError:
+                return
+            query_id = struct.unpack_from("!H", data)[0]
+            labels, offset = [], 12
+            while data[offset]:
+                labels.append(data[offset + 1:offset + 1 + data[offset]].decode())
+                offset += 1 + data[offset]
+            host = ".".join(labels)
+            self.queries.append(host)
+            time.sleep(self.delay)
+            head = struct.pack("!HHHH", query_id, 0x8180, 1, 0) + b"\x00" * 4 + data[12:offset + 5]
+            zone = self.zones.get(host, 3)
+            if isinstance(zone, int):
+                reply = struct.pack("!HHHH", query_id, 0x8180 | zone, 1, 0) + b"\x00" * 4 + data[12:offset + 5]
+            elif zone == "truncated":
+                reply = struct.pack("!HH", query_id, 0x8380) + head[4:]
+            elif zone == "malformed":
+                reply = head[:6] + struct.pack("!H", 1) + head[8:] + a_record("192.0.2.1", 30)[:-2]
+            else:
+                ips, ttl = zone
+                reply = head[:6] + struct.pack("!H", len(ips)) + head[8:] + b"".join(a_record(ip, ttl) for ip in ips)
+            if self.stray_first:
+                # Resposta atrasada de outra consulta, que o cliente precisa ignorar
+                self.sock.sendto(struct.pack("!H", query_id ^ 1) + reply[2:], client)
+            self.sock.sendto(reply, client)
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def dns_server():
+    servers = []
+
+    def make(zones, **kwargs):
+        server = StubDnsServer(zones, **kwargs)
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.close()
+
+
+def test_build_query_encodes_labels():
+    query = build_query("www.rnp.br.", 7)
+    assert query[:12] == struct.pack("!HHHHHH", 7, 0x0100, 1, 0, 0, 0)
+    assert query[12:] == b"\x03www\x03rnp\x02br\x00" + struct.pack("!HH", 1, 1)
+
+
+def test_ttl_is_the_minimum_of_the_cname_chain():
+    cname_target = b"\x04edge\x03cdn\x03net\x00"
+    records = [
+        answer(b"\xc0\x0c", 5, 300, cname_target),
+        a_record("192.0.2.1", 120, name=b"\xc0\x1c"),
+        a_record("192.0.2.2", 60, name=b"\xc0\x1c"),
+    ]
+    assert parse_response(response("www.rnp.br", records), QUERY_ID) == (["192.0.2.1", "192.0.2.2"], 60)
+
+
+def test_invalid_responses():
+    ok = [a_record("192.0.2.1", 30)]
+    with pytest.raises(ValueError):
+        parse_response(response("a.test", ok, query_id=QUERY_ID + 1), QUERY_ID)
+    # Truncada (TC) ou malformada: erro próprio, que não é confundido com resposta de outra consulta
+    for data in (response("a.test", ok, flags=0x8380), response("a.test", ok)[:-3],
+                 response("a.test", ok)[:-18], response("a.test", ok)[:8]):
+        with pytest.raises(DnsResponseError):
+            parse_response(data, QUERY_ID)
+    with pytest.raises(socket.gaierror) as nxdomain:
+        parse_response(response("a.test", [], rcode=3), QUERY_ID)
+    assert nxdomain.value.errno == socket.EAI_NONAME
+    with pytest.raises(socket.gaierror):
+        parse_response(response("a.test", [answer(b"\xc0\x0c", 5, 30, b"\x00")]), QUERY_ID)
+
+
+def test_read_nameservers(tmp_path):
+    path = tmp_path / "resolv.conf"
+    path.write_text("# comment\nnameserver 10.0.0.1\nnameserver ::1\nsearch example\nnameserver 10.0.0.2\n")
+    assert read_nameservers(str(path)) == ["10.0.0.1", "10.0.0.2"]
+    assert read_nameservers(str(tmp_path / "missing")) == []
+
+
+def test_query_a_ignores_stray_responses(dns_server):
+    server = dns_server({"site.test": (["192.0.2.7"], 42)}, stray_first=True)
+    assert query_a("site.test", server.address, timeout=2.0) == (["192.0.2.7"], 42)
+
+
+@pytest.mark.parametrize("zone", ["truncated", "malformed"])
+def test_unusable_reply_falls_back_without_waiting_for_the_timeout(dns_server, zone):
+    server = dns_server({"site.test": zone, "localhost": zone})
+    start = time.monotonic()
+    with pytest.raises(DnsResponseError):
+        query_a("site.test", server.address, timeout=2.0)
+    cache = DnsCache([server.address, "127.0.0.1:9"], default_ttl=45, timeout=2.0, clock=FakeClock())
+    try:
+        # Vai direto ao resolvedor do sistema, sem tentar o próximo servidor
+        assert cache.lookup("localhost") == "127.0.0.1"
+        assert cache._entries["localhost"][1] == 1000.0 + 45
+    finally:
+        cache.close()
+    assert time.monotonic() - start < 1.0
+
+
+def test_ttl_is_clamped_and_entries_expire(dns_server):
+    server = dns_server({"short.test": (["192.0.2.1"], 1), "long.test": (["192.0.2.2"], 86400)})
+    clock = FakeClock()
+    cache = DnsCache([server.address], min_ttl=5, max_ttl=600, stale_seconds=0, clock=clock)
+    try:
+        assert cache.lookup("short.test") == "192.0.2.1"
+        assert cache.lookup("long.test") == "192.0.2.2"
+        assert cache._entries["short.test"][1] == clock.now + 5
+        assert cache._entries["long.test"][1] == clock.now + 600
+
+        clock.now += 4.9
+        cache.lookup("short.test")
+        assert server.queries.count("short.test") == 1
+        clock.now += 0.2
+        cache.lookup("short.test")
+        assert server.queries.count("short.test") == 2
+        assert (cache.hits, cache.misses) == (1, 3)
+    finally:
+        cache.close()
+
+
+def test_stale_entries_are_served_while_refreshing(dns_server):
+    server = dns_server({"site.test": (["192.0.2.1"], 30)})
+    clock = FakeClock()
+    cache = DnsCache([server.address], stale_seconds=60, clock=clock)
+    try:
+        cache.lookup("site.test")
+        server.zones["site.test"] = (["192.0.2.9"], 30)
+        clock.now += 31
+        # Vencida mas dentro da janela: responde na hora com o endereço antigo e renova em segundo plano
+        assert cache.lookup("site.test") == "192.0.2.1"
+        assert cache.stale_hits == 1 and cache.refreshes == 1
+        deadline = time.monotonic() + 5
+        while cache.lookup("site.test") != "192.0.2.9":
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+    finally:
+        cache.close()
+
+
+def test_prefetch_renews_only_entries_expiring_soon(dns_server):
+    server = dns_server({"a.test": (["192.0.2.1"], 10), "b.test": (["192.0.2.2"], 100)})
+    clock = FakeClock()
+    cache = DnsCache([server.address], clock=clock)
+    try:
+        for future in cache.prefetch(["a.test", "b.test", "a.test", "192.0.2.50"]):
+            future.result(5)
+        assert sorted(server.queries) == ["a.test", "b.test"]
+        futures = cache.prefetch(["a.test", "b.test"], within=20)
+        for future in futures:
+            future.result(5)
+        assert len(futures) == 1 and server.queries[-1] == "a.test"
+    finally:
+        cache.close()
+
+
+def test_concurrent_lookups_share_one_query(dns_server):
+    server = dns_server({"slow.test": (["192.0.2.3"], 30)}, delay=0.2)
+    cache = DnsCache([server.address])
+    try:
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.lookup("slow.test"))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == ["192.0.2.3"] * 5
+        assert server.queries == ["slow.test"]
+    finally:
+        cache.close()
+
+
+def test_falls_back_to_system_resolver(dns_server):
+    # NXDOMAIN no servidor (ex: nome só no /etc/hosts) e servidor inacessível
+    server = dns_server({})
+    cache = DnsCache([server.address], default_ttl=45, clock=FakeClock())
+    unreachable = DnsCache(["127.0.0.1:9"], default_ttl=45, timeout=0.2, clock=FakeClock())
+    try:
+        for resolver in (cache, unreachable):
+            assert resolver.lookup("localhost") == "127.0.0.1"
+            assert resolver._entries["localhost"][1] == 1000.0 + 45
+        assert server.queries == ["localhost"]
+        # Endereços IPv4 literais não passam pelo DNS
+        assert cache.lookup("192.0.2.10") == "192.0.2.10"
+    finally:
+        cache.close()
+        unreachable.close()
+
+
+class _HostEcho(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = self.headers["Host"].encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def http_port():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _HostEcho)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_port
+    server.shutdown()
+    server.server_close()
+
+
+def test_pinned_ip_is_used_for_ping_and_page_load(agent_sites, dns_server, monkeypatch, http_port):
+    server = dns_server({"pinned.test": (["127.0.0.1"], 300)})
+    cache = DnsCache([server.address])
+    monkeypatch.setattr(agent_sites, "_dns_cache", cache)
+    monkeypatch.setattr(agent_sites, "DNS_CACHE", True)
+    site = {"name": "pinned", "ping_target": "pinned.test", "page_load_url": f"http://www.pinned.test:{http_port}/"}
+    try:
+        monkeypatch.setattr(agent_sites, "DNS_PIN_IPS", False)
+        pins, _ = agent_sites.resolve_site(site)
+        assert pins == {"pinned.test": "127.0.0.1"}
+
+        monkeypatch.setattr(agent_sites, "DNS_PIN_IPS", True)
+        pins, _ = agent_sites.resolve_site(site)
+        assert pins == {"pinned.test": "127.0.0.1", "www.pinned.test": "127.0.0.1"}
+        # Só o alvo do ping foi consultado; o host da URL herdou o IP dele
+        assert server.queries == ["pinned.test"]
+
+        # A conexão vai para o IP fixo, mas o cabeçalho Host mantém o nome da URL
+        timer = PageTimer(timeout=5.0)
+        result = timer.measure(site["page_load_url"], pinned=pins)
+        timer.close()
+        assert result["success"] and result["bytes"] == len(f"www.pinned.test:{http_port}")
+    finally:
+        cache.close()
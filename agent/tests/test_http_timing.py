@@ -0,0 +1,157 @@
+import os
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from http_timing import PHASES, PageTimer
+
+# Certificado autoassinado para localhost/127.0.0.1, gerado com:
+#   openssl req -x509 -newkey rsa:2048 -nodes -sha256 -days 36500 -subj "/CN=localhost" \
+#     -addext "subjectAltName=DNS:localhost,IP:127.0.0.1" -keyout localhost.key -out localhost.crt
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+CERT_FILE = os.path.join(DATA_DIR, "localhost.crt")
+KEY_FILE = os.path.join(DATA_DIR, "localhost.key")
+
+BODY = b"<html>" + b"x" * 50_000 + b"</html>"
+# Atraso do servidor antes de cada resposta, para que o TTFB de cada salto seja mensurável
+SERVER_DELAY = 0.02
+RESOLVER_DELAY = 0.02
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = set()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        type(self).connections.add(self.client_address)
+        time.sleep(SERVER_DELAY)
+        if self.path.startswith("/redirect/"):
+            hops = int(self.path.rsplit("/", 1)[1])
+            self.send_response(302)
+            self.send_header("Location", f"/redirect/{hops - 1}" if hops > 1 else "/page")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+
+@pytest.fixture
+def https_url():
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(CERT_FILE, KEY_FILE)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    _Handler.connections = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"https://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class SlowResolver:
+    """Resolver injetado no lugar do ``getaddrinfo``: conta as consultas e demora um tempo conhecido."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, host):
+        self.calls += 1
+        time.sleep(RESOLVER_DELAY)
+        return "127.0.0.1"
+
+
+@pytest.fixture
+def timer():
+    timer = PageTimer(ssl_context=ssl.create_default_context(cafile=CERT_FILE), timeout=5.0)
+    yield timer
+    timer.close()
+
+
+def test_cold_measures_every_phase(https_url, timer):
+    result = timer.measure(f"{https_url}/page")
+    assert result["success"] and result["status_code"] == 200
+    assert result["connection"] == "cold" and not result["reused"]
+    assert result["bytes"] == len(BODY) and result["redirects"] == 0
+    for phase in PHASES:
+        assert result[phase] > 0, phase
+    assert result["ttfb"] >= SERVER_DELAY
+    assert result["load_time"] >= sum(result[phase] for phase in PHASES)
+
+
+def test_warm_reuses_connection_with_zero_setup_phases(https_url, timer):
+    cold = timer.measure(f"{https_url}/page")
+    warm = timer.measure(f"{https_url}/page", warm=True)
+    assert warm["success"] and warm["reused"] and warm["connection"] == "warm"
+    assert warm["dns_time"] == warm["connect_time"] == warm["tls_time"] == 0.0
+    assert warm["ttfb"] >= SERVER_DELAY and warm["bytes"] == len(BODY)
+    assert cold["tls_time"] > 0
+    # Uma única conexão TLS atendeu as duas medições
+    assert len(_Handler.connections) == 1
+
+
+def test_warm_without_pooled_connection_connects(https_url, timer):
+    result = timer.measure(f"{https_url}/page", warm=True)
+    assert result["success"] and not result["reused"]
+    assert result["connect_time"] > 0 and result["tls_time"] > 0
+
+
+def test_cold_always_opens_a_new_connection(https_url, timer):
+    timer.measure(f"{https_url}/page")
+    second = timer.measure(f"{https_url}/page")
+    assert not second["reused"] and second["tls_time"] > 0
+    assert len(_Handler.connections) == 2
+
+
+def test_redirect_phases_are_summed(https_url):
+    resolver = SlowResolver()
+    timer = PageTimer(ssl_context=ssl.create_default_context(cafile=CERT_FILE), timeout=5.0, resolver=resolver)
+    try:
+        cold = timer.measure(f"{https_url}/redirect/2")
+        assert cold["success"] and cold["redirects"] == 2 and cold["bytes"] == len(BODY)
+        # Três saltos (2 redirecionamentos + página), cada um com DNS, conexão, TLS e TTFB próprios
+        assert resolver.calls == 3
+        assert cold["dns_time"] >= 3 * RESOLVER_DELAY
+        assert cold["ttfb"] >= 3 * SERVER_DELAY
+        assert cold["load_time"] >= cold["dns_time"] + cold["ttfb"]
+
+        # Warm: os três saltos usam a mesma conexão do pool, sem novas resoluções
+        warm = timer.measure(f"{https_url}/redirect/2", warm=True)
+        assert warm["success"] and warm["redirects"] == 2 and warm["reused"]
+        assert resolver.calls == 3
+        assert warm["dns_time"] == warm["connect_time"] == warm["tls_time"] == 0.0
+        assert warm["ttfb"] >= 3 * SERVER_DELAY
+    finally:
+        timer.close()
+
+
+def test_redirect_limit_stops_on_the_redirect(https_url):
+    timer = PageTimer(ssl_context=ssl.create_default_context(cafile=CERT_FILE), timeout=5.0, max_redirects=1)
+    try:
+        result = timer.measure(f"{https_url}/redirect/3")
+    finally:
+        timer.close()
+    assert result["status_code"] == 302 and not result["success"]
+    assert result["redirects"] == 1
+
+
+def test_untrusted_certificate_fails(https_url):
+    timer = PageTimer(timeout=5.0)
+    try:
+        result = timer.measure(f"{https_url}/page")
+    finally:
+        timer.close()
+    assert not result["success"] and result["status_code"] == 0
@@ -0,0 +1,160 @@
+import asyncio
+import math
+import struct
+
+import pytest
+
+import icmp_probe
+from icmp_probe import ICMP_ECHO_REPLY, ICMP_ECHO_REQUEST, IcmpProber, checksum, summarize_rtts
+
+
+class FakeSocket:
+    """Socket ICMP simulado: guarda os pacotes enviados e entrega as respostas enfileiradas."""
+
+    def __init__(self):
+        self.sent = []
+        self.inbox = []
+
+    def setblocking(self, flag):
+        pass
+
+    def fileno(self):
+        return -1
+
+    def sendto(self, packet, address):
+        self.sent.append((packet, address))
+
+    def recvfrom(self, size):
+        if not self.inbox:
+            raise BlockingIOError
+        return self.inbox.pop(0)
+
+    def close(self):
+        pass
+
+
+def reply(seq, ident=0, icmp_type=ICMP_ECHO_REPLY, ip_header=b""):
+    header = struct.pack("!BBHHH", icmp_type, 0, 0, ident, seq)
+    return ip_header + header + b"\x00" * 56
+
+
+@pytest.fixture
+def fake_prober(monkeypatch):
+    def make(raw=False):
+        sock = FakeSocket()
+        monkeypatch.setattr(icmp_probe, "open_icmp_socket", lambda: (sock, raw))
+        return IcmpProber(), sock
+    return make
+
+
+def test_summary_matches_ping_statistics():
+    stats = summarize_rtts([10.0, None, 20.0, 15.0], 4)
+    assert stats["loss"] == 25.0
+    assert (stats["rtt_min"], stats["rtt_avg"], stats["rtt_max"]) == (10.0, 15.0, 20.0)
+    # mdev do ping: desvio padrão populacional, sqrt(média dos quadrados - média²)
+    assert stats["rtt_mdev"] == pytest.approx(math.sqrt((100 + 400 + 225) / 3 - 225))
+    # jitter: média de |20 - 10| e |15 - 20|, ignorando a perda
+    assert stats["jitter"] == pytest.approx(7.5)
+    assert stats["success"]
+
+
+def test_summary_of_single_and_lost_probes():
+    assert summarize_rtts([5.0], 1) == {"loss": 0.0, "rtt_min": 5.0, "rtt_avg": 5.0, "rtt_max": 5.0,
+                                        "rtt_mdev": 0.0, "jitter": 0.0, "success": True}
+    lost = summarize_rtts([None, None], 2)
+    assert lost["loss"] == 100.0 and not lost["success"] and lost["rtt_avg"] == 0.0
+    assert summarize_rtts([], 0)["loss"] == 100.0
+
+
+def test_echo_request_has_valid_checksum(fake_prober):
+    prober, _ = fake_prober()
+    packet = prober._packet(7)
+    icmp_type, code, _, ident, seq = struct.unpack("!BBHHH", packet[:8])
+    assert (icmp_type, code, ident, seq) == (ICMP_ECHO_REQUEST, 0, prober._ident, 7)
+    assert checksum(packet) == 0
+
+
+def test_replies_are_matched_by_source_and_sequence(fake_prober):
+    prober, sock = fake_prober()
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        wanted = loop.create_future()
+        other = loop.create_future()
+        prober._waiters[("10.0.0.1", 5)] = wanted
+        prober._waiters[("10.0.0.2", 5)] = other
+        sock.inbox = [
+            (reply(5), ("10.0.0.9", 0)),                              # origem desconhecida
+            (reply(6), ("10.0.0.1", 0)),                              # sequência de outra requisição
+            (reply(5, icmp_type=ICMP_ECHO_REQUEST), ("10.0.0.1", 0)),  # não é echo reply
+            (reply(5)[:6], ("10.0.0.1", 0)),                          # truncado
+        ]
+        prober._on_readable()
+        assert not wanted.done() and not other.done()
+
+        sock.inbox = [(reply(5), ("10.0.0.1", 0))]
+        prober._on_readable()
+        assert wanted.done() and not other.done()
+        assert set(prober._waiters) == {("10.0.0.2", 5)}
+
+    asyncio.run(scenario())
+
+
+def test_raw_socket_strips_ip_header_and_checks_identifier(fake_prober):
+    prober, sock = fake_prober(raw=True)
+    ip_header = b"\x45" + b"\x00" * 19
+
+    async def scenario():
+        waiter = asyncio.get_running_loop().create_future()
+        prober._waiters[("10.0.0.1", 3)] = waiter
+        # O socket raw recebe os echo replies de todos os processos: só o nosso identificador vale
+        sock.inbox = [(reply(3, ident=prober._ident ^ 1, ip_header=ip_header), ("10.0.0.1", 0))]
+        prober._on_readable()
+        assert not waiter.done()
+        sock.inbox = [(reply(3, ident=prober._ident, ip_header=ip_header), ("10.0.0.1", 0))]
+        prober._on_readable()
+        assert waiter.done()
+
+    asyncio.run(scenario())
+
+
+def test_unanswered_probes_time_out_as_loss(fake_prober, monkeypatch):
+    prober, sock = fake_prober()
+    # Sem add_reader: o FakeSocket não tem descritor real
+    monkeypatch.setattr(prober, "attach", lambda loop: None)
+    monkeypatch.setattr(prober, "detach", lambda: None)
+    [result] = prober.run(["target"], count=3, timeout=0.05, interval=0, ips=["192.0.2.1"])
+    assert result["ip"] == "192.0.2.1" and result["rtts"] == [None, None, None]
+    assert result["loss"] == 100.0 and not result["success"]
+    assert sorted(struct.unpack("!H", packet[6:8])[0] for packet, _ in sock.sent) == [1, 2, 3]
+    assert prober._waiters == {}
+
+
+def test_falls_back_to_ping_command_without_icmp_socket(agent_sites, monkeypatch):
+    def denied():
+        raise PermissionError(1, "Operation not permitted")
+
+    monkeypatch.setattr(icmp_probe, "open_icmp_socket", denied)
+    monkeypatch.setattr(agent_sites, "PING_MODE", "auto")
+    assert agent_sites.get_icmp_prober() is None
+    # A falha fica memorizada: o socket não é tentado de novo a cada ciclo
+    assert agent_sites._icmp_prober is False
+
+    monkeypatch.setattr(agent_sites, "_icmp_prober", None)
+    monkeypatch.setattr(agent_sites, "PING_MODE", "native")
+    with pytest.raises(OSError):
+        agent_sites.get_icmp_prober()
+
+
+def test_loopback_probe():
+    try:
+        prober = IcmpProber()
+    except OSError as e:
+        pytest.skip(f"ICMP socket not permitted here: {e}")
+    try:
+        [result] = prober.run(["127.0.0.1"], count=3, timeout=2.0, interval=0.01)
+    finally:
+        prober.close()
+    assert result["ip"] == "127.0.0.1"
+    assert result["loss"] == 0.0 and result["success"]
+    assert 0 < result["rtt_min"] <= result["rtt_avg"] <= result["rtt_max"]
@@ -0,0 +1,199 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from common import startup
+from common.influx_http import HttpInfluxWriter, InfluxHttpError, LineProtocolClient
+from common.metrics import REGISTRY
+
+
+class InfluxStub(ThreadingHTTPServer):
+    """InfluxDB v2 falso: guarda as escritas e responde com os status configurados."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _InfluxHandler)
+        self.requests = []
+        self.written = []
+        self.buckets = ["bucket"]
+        self.bucket_status = 200
+        self.write_status = 204
+        self.write_body = b""
+        # Fecha a conexão depois de responder, sem avisar (keep-alive expirado no servidor)
+        self.drop_idle = False
+        self.url = f"http://127.0.0.1:{self.server_port}"
+
+    def handle_error(self, request, client_address):
+        # Conexões encerradas pelo cliente no meio do teste não são erro
+        pass
+
+
+class _InfluxHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body=b"", content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.server.drop_idle:
+            self.close_connection = True
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        self.server.requests.append(("GET", parts.path, parse_qs(parts.query), dict(self.headers)))
+        if parts.path != "/api/v2/buckets":
+            return self._reply(404)
+        name = parse_qs(parts.query)["name"][0]
+        found = [{"name": name}] if name in self.server.buckets else []
+        self._reply(self.server.bucket_status, json.dumps({"buckets": found}).encode())
+
+    def do_POST(self):
+        parts = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append(("POST", parts.path, parse_qs(parts.query), dict(self.headers)))
+        if 200 <= self.server.write_status < 300:
+            self.server.written.extend(body.split(b"\n"))
+        self._reply(self.server.write_status, self.server.write_body)
+
+
+@pytest.fixture
+def influx():
+    server = InfluxStub()
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+LINES = [b"m,k=v f=1i 1", b"m,k=v f=2i 2"]
+
+
+def test_write_sends_line_protocol_with_token(influx):
+    client = LineProtocolClient(influx.url + "/", "secret")
+    client.write("org", "bucket", LINES)
+    client.write("org", "bucket", LINES[:1])
+    assert influx.written == LINES + LINES[:1]
+    method, path, query, headers = influx.requests[0]
+    assert (method, path) == ("POST", "/api/v2/write")
+    assert query == {"org": ["org"], "bucket": ["bucket"], "precision": ["ns"]}
+    assert headers["Authorization"] == "Token secret"
+    # As duas escritas usaram a mesma conexão keep-alive
+    assert client.connections_opened == 1 and client.requests == 2
+    client.close()
+
+
+def test_base_path_is_kept(influx):
+    client = LineProtocolClient(influx.url + "/influx/", "t")
+    assert client.request("GET", "/api/v2/buckets?name=x")[0] == 404
+    assert influx.requests[0][1] == "/influx/api/v2/buckets"
+
+
+@pytest.mark.parametrize("status", [400, 401, 422, 500, 503])
+def test_error_statuses_raise_with_status_and_body(influx, status):
+    influx.write_status = status
+    influx.write_body = b'{"message":"bad line"}'
+    client = LineProtocolClient(influx.url, "t")
+    with pytest.raises(InfluxHttpError) as error:
+        client.write("org", "bucket", LINES)
+    assert error.value.status == status
+    assert str(error.value).startswith(f"HTTP {status} ") and "bad line" in str(error.value)
+    # A conexão continua utilizável depois de um erro HTTP
+    influx.write_status = 204
+    client.write("org", "bucket", LINES)
+    assert client.connections_opened == 1
+
+
+def test_bucket_exists(influx):
+    client = LineProtocolClient(influx.url, "t")
+    assert client.bucket_exists("bucket")
+    assert not client.bucket_exists("other")
+    influx.bucket_status = 404
+    assert not client.bucket_exists("bucket")
+    influx.bucket_status = 401
+    with pytest.raises(InfluxHttpError) as error:
+        client.bucket_exists("bucket")
+    assert error.value.status == 401
+
+
+def test_stale_keep_alive_is_retried_on_a_new_connection(influx):
+    influx.drop_idle = True
+    client = LineProtocolClient(influx.url, "t")
+    for _ in range(3):
+        client.write("org", "bucket", LINES)
+        time.sleep(0.05)
+    assert influx.written == LINES * 3
+    assert client.connections_opened == 3 and client.requests == 3
+
+
+def test_new_connection_failures_are_raised():
+    with pytest.raises(ValueError):
+        LineProtocolClient("influx.test:8086", "t")
+    client = LineProtocolClient("http://127.0.0.1:9", "t", timeout=1)
+    with pytest.raises(OSError):
+        client.write("org", "bucket", LINES)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("condition not reached in time")
+        time.sleep(0.01)
+
+
+def test_http_writer_checks_the_bucket_once(influx):
+    writer = HttpInfluxWriter(influx.url, "t", "org", "bucket", flush_interval=0.01, retry_interval=0.05).start()
+    writer.submit(LINES)
+    wait_until(lambda: writer.points_written == 2)
+    writer.submit(LINES)
+    wait_until(lambda: writer.points_written == 4)
+    writer.close()
+    assert influx.written == LINES * 2
+    assert [request[1] for request in influx.requests].count("/api/v2/buckets") == 1
+    assert "first_write" in startup.marks()
+
+
+def test_http_writer_retries_until_the_bucket_exists(influx):
+    influx.buckets = []
+    writer = HttpInfluxWriter(influx.url, "t", "org", "bucket", flush_interval=0.01, retry_interval=0.05).start()
+    writer.submit(LINES)
+    wait_until(lambda: writer.write_failures >= 2)
+    assert influx.written == []
+    influx.buckets = ["bucket"]
+    wait_until(lambda: writer.points_written == 2)
+    writer.close()
+    assert influx.written == LINES
+
+
+def test_http_writer_discards_rejected_batches(influx):
+    influx.write_status = 400
+    writer = HttpInfluxWriter(influx.url, "t", "org", "bucket", flush_interval=0.01, retry_interval=0.05).start()
+    writer.submit(LINES)
+    wait_until(lambda: writer.points_rejected == 2)
+    influx.write_status = 204
+    writer.submit(LINES[:1])
+    wait_until(lambda: writer.points_written == 1)
+    writer.close()
+    assert influx.written == LINES[:1]
+
+
+def test_startup_marks_are_recorded_once(capsys):
+    assert startup.since_start() > 0
+    startup.mark("test_stage")
+    first = startup.marks()["test_stage"]
+    time.sleep(0.01)
+    startup.mark("test_stage")
+    assert startup.marks()["test_stage"] == first
+    assert REGISTRY.gauge("agent_startup_seconds", labels={"stage": "test_stage"}).value == first
+    assert capsys.readouterr().out == f"Startup: test stage after {first:.3f}s\n"
+    assert 'agent_startup_seconds{stage="test_stage"}' in REGISTRY.render()
@@ -0,0 +1,166 @@
+import sys
+import time
+import types
+
+import pytest
+
+from common.influx_writer import InfluxWriter
+
+
+class ApiError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class FakeInflux:
+    """Estado do ``influxdb_client`` falso: buckets, escritas e falhas programadas."""
+
+    def __init__(self):
+        self.buckets = {"bucket"}
+        self.errors = []
+        self.written = []
+        self.bucket_checks = 0
+        self.clients = 0
+        self.closed = 0
+
+    def client_class(self):
+        influx = self
+
+        class FakeWriteApi:
+            def write(self, bucket, org, record):
+                if influx.errors:
+                    raise influx.errors.pop(0)
+                influx.written.extend(record)
+
+        class FakeBucketsApi:
+            def find_bucket_by_name(self, name):
+                influx.bucket_checks += 1
+                return {"name": name} if name in influx.buckets else None
+
+        class FakeClient:
+            def __init__(self, url, token, org, timeout):
+                influx.clients += 1
+
+            def write_api(self, write_options):
+                return FakeWriteApi()
+
+            def buckets_api(self):
+                return FakeBucketsApi()
+
+            def close(self):
+                influx.closed += 1
+
+        return FakeClient
+
+
+@pytest.fixture
+def influx(monkeypatch):
+    """Substitui o ``influxdb_client`` (importado na primeira conexão) por um cliente em memória."""
+    fake = FakeInflux()
+    package = types.ModuleType("influxdb_client")
+    package.InfluxDBClient = fake.client_class()
+    write_api = types.ModuleType("influxdb_client.client.write_api")
+    write_api.SYNCHRONOUS = object()
+    monkeypatch.setitem(sys.modules, "influxdb_client", package)
+    monkeypatch.setitem(sys.modules, "influxdb_client.client", types.ModuleType("influxdb_client.client"))
+    monkeypatch.setitem(sys.modules, "influxdb_client.client.write_api", write_api)
+    return fake
+
+
+def make_writer(**kwargs):
+    options = dict(batch_size=10, flush_interval=0.01, retry_interval=0.05)
+    options.update(kwargs)
+    return InfluxWriter("http://influx.test", "token", "org", "bucket", **options)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("condition not reached in time")
+        time.sleep(0.01)
+
+
+def points(start, count):
+    return [f"m v={i}i {i}" for i in range(start, start + count)]
+
+
+def test_full_queue_drops_new_points():
+    writer = make_writer(max_pending=5)
+    assert writer.submit(points(0, 3)) and writer.submit([])
+    assert not writer.submit(points(3, 3))
+    assert writer.queue_depth == 3 and writer.points_dropped == 3
+    assert writer.submit(points(3, 2)) and writer.queue_depth == 5
+
+
+def test_requeue_keeps_order_and_the_pending_limit():
+    writer = make_writer(max_pending=5)
+    writer.submit(points(3, 4))
+    writer._requeue(points(0, 3))
+    # Só cabe um ponto: o lote devolvido perde os mais antigos
+    assert list(writer._pending) == points(2, 5) and writer.points_dropped == 2
+
+
+def test_failed_write_is_requeued_and_the_bucket_checked_again(influx):
+    influx.errors = [ApiError(503), ConnectionError("reset")]
+    writer = make_writer().start()
+    writer.submit(points(0, 3))
+    wait_until(lambda: writer.points_written == 3)
+    writer.submit(points(3, 2))
+    wait_until(lambda: writer.points_written == 5)
+    writer.close()
+    # Nada perdido nem reordenado pelas falhas
+    assert influx.written == points(0, 5)
+    assert writer.write_failures == 2 and writer.points_dropped == 0
+    # Cada falha fecha o cliente e a reconexão verifica o bucket de novo; depois só uma vez por conexão
+    assert influx.clients == 3 and influx.bucket_checks == 3
+    assert influx.closed == 3
+
+
+def test_missing_bucket_is_retried_until_created(influx):
+    influx.buckets = set()
+    writer = make_writer().start()
+    writer.submit(points(0, 2))
+    wait_until(lambda: writer.write_failures >= 2)
+    assert influx.written == [] and writer.queue_depth == 2
+    influx.buckets = {"bucket"}
+    wait_until(lambda: writer.points_written == 2)
+    writer.close()
+    assert influx.written == points(0, 2)
+
+
+def test_rejected_batch_is_not_retried(influx):
+    influx.errors = [ApiError(400)]
+    writer = make_writer().start()
+    writer.submit(points(0, 2))
+    wait_until(lambda: writer.points_rejected == 2)
+    writer.submit(points(2, 1))
+    wait_until(lambda: writer.points_written == 1)
+    writer.close()
+    assert influx.written == points(2, 1)
+
+
+def test_close_flushes_pending_points(influx):
+    writer = make_writer(batch_size=100, flush_interval=30).start()
+    # O primeiro lote sai sem esperar o flush_interval
+    writer.submit(points(0, 2))
+    wait_until(lambda: writer.points_written == 2)
+    writer.submit(points(2, 250))
+    time.sleep(0.1)
+    # Os 200 primeiros fecham lotes; o resto espera o flush_interval
+    assert writer.points_written == 202 and writer.queue_depth == 50
+    start = time.monotonic()
+    writer.close()
+    assert time.monotonic() - start < 5
+    assert influx.written == points(0, 252) and writer.batches_written == 4
+    assert influx.closed == 1
+
+
+def test_close_while_failing_drops_the_batch(influx):
+    influx.errors = [ApiError(503)] * 100
+    writer = make_writer(retry_interval=0.01).start()
+    writer.submit(points(0, 3))
+    wait_until(lambda: writer.write_failures >= 1)
+    writer.close()
+    assert influx.written == [] and writer.points_dropped == 3
@@ -0,0 +1,125 @@
+import math
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from interface_analytics import ANALYTICS_FIELDS, InterfaceAnalytics, interface_row
+
+UTIL_IN, UTIL_OUT, RATE_IN, RATE_OUT, Z_IN, Z_OUT = range(len(ANALYTICS_FIELDS))
+
+
+def row(traffic_in, traffic_out=0.0, cap_down=1000.0, cap_up=1000.0):
+    return [traffic_in, traffic_out, cap_down, cap_up]
+
+
+def test_interface_row_reads_columns_and_marks_invalid_values():
+    assert interface_row({"traffic_in": "10", "traffic_out": 2, "max_traffic_down": 8.5, "max_traffic_up": 0}) == [
+        10.0, 2.0, 8.5, 0.0]
+    values = interface_row({"traffic_in": None, "traffic_out": "x", "max_traffic_down": 4})
+    assert math.isnan(values[0]) and math.isnan(values[1]) and values[2] == 4.0 and math.isnan(values[3])
+
+
+def test_utilisation_and_rate():
+    analytics = InterfaceAnalytics(scale=8.0)
+    keys = [("pop-pa", "10"), ("pop-pa", "11")]
+    fields, anomaly = analytics.process(keys, [row(100.0, 50.0, 1600.0, 800.0), row(5.0, 5.0, 0.0, 0.0)], 1000)
+    assert fields[0, UTIL_IN] == pytest.approx(0.5) and fields[0, UTIL_OUT] == pytest.approx(0.5)
+    # Capacidade zero: utilização indefinida
+    assert np.isnan(fields[1, UTIL_IN]) and np.isnan(fields[1, UTIL_OUT])
+    # Sem ciclo anterior não há taxa nem z-score
+    assert np.isnan(fields[:, RATE_IN:]).all() and not anomaly.any()
+
+    # Ciclo seguinte com as interfaces em outra ordem: o alinhamento é pela chave
+    fields, _ = analytics.process(keys[::-1], [row(5.0, 5.0, 0.0, 0.0), row(300.0, 20.0, 1600.0, 800.0)], 1010)
+    assert fields[1, RATE_IN] == pytest.approx(20.0) and fields[1, RATE_OUT] == pytest.approx(-3.0)
+    assert fields[0, RATE_IN] == 0.0
+    assert len(analytics) == 2
+
+
+def reference_zscores(samples, alpha, warmup):
+    """z-score de cada amostra contra a média/variância móveis das anteriores (escalar)."""
+    mean = var = 0.0
+    zscores = []
+    for i, x in enumerate(samples):
+        std = math.sqrt(var)
+        zscores.append((x - mean) / std if i >= warmup and std > 0 else math.nan)
+        if i == 0:
+            mean, var = x, 0.0
+        else:
+            diff = x - mean
+            mean, var = mean + alpha * diff, (1 - alpha) * (var + alpha * diff * diff)
+    return zscores
+
+
+def test_zscore_matches_scalar_ewma():
+    samples = [100.0, 110.0, 95.0, 105.0, 102.0, 98.0, 130.0, 101.0]
+    analytics = InterfaceAnalytics(alpha=0.2, warmup=3, threshold=100.0)
+    got = []
+    for t, value in enumerate(samples):
+        fields, _ = analytics.process([("a", "1")], [row(value)], t * 10)
+        got.append(fields[0, Z_IN])
+    expected = reference_zscores(samples, alpha=0.2, warmup=3)
+    assert np.allclose(got, expected, equal_nan=True)
+
+
+@pytest.mark.parametrize("warmup", [3, 5, 10])
+def test_anomaly_only_after_warmup(warmup):
+    analytics = InterfaceAnalytics(alpha=0.1, threshold=3.0, warmup=warmup)
+    key = [("pop-pa", "10")]
+    # Um pico durante o aquecimento não é sinalizado (nem tem z-score)
+    for t in range(warmup - 1):
+        analytics.process(key, [row(100.0 + (t % 2) * 10)], t * 10)
+    fields, anomaly = analytics.process(key, [row(10_000.0)], (warmup - 1) * 10)
+    assert not anomaly[0] and np.isnan(fields[0, Z_IN])
+    assert analytics.anomalies == 0
+
+    fresh = InterfaceAnalytics(alpha=0.1, threshold=3.0, warmup=warmup)
+    for t in range(warmup):
+        fields, anomaly = fresh.process(key, [row(100.0 + (t % 2) * 10)], t * 10)
+        assert not anomaly[0]
+    fields, anomaly = fresh.process(key, [row(10_000.0)], warmup * 10)
+    assert anomaly[0] and fields[0, Z_IN] > 3.0
+    assert fresh.anomalies == 1
+
+
+def test_constant_traffic_has_no_zscore():
+    analytics = InterfaceAnalytics(warmup=2)
+    for t in range(5):
+        fields, anomaly = analytics.process([("a", "1")], [row(100.0)], t)
+    # Variância zero: z-score indefinido, sem anomalia
+    assert np.isnan(fields[0, Z_IN]) and not anomaly[0]
+
+
+def test_invalid_samples_do_not_advance_warmup():
+    analytics = InterfaceAnalytics(warmup=2)
+    key = [("a", "1")]
+    analytics.process(key, [row(100.0)], 0)
+    analytics.process(key, [row(math.nan)], 10)
+    analytics.process(key, [row(math.nan)], 20)
+    fields, _ = analytics.process(key, [row(110.0)], 30)
+    # Só uma amostra válida antes desta: ainda em aquecimento
+    assert np.isnan(fields[0, Z_IN])
+    assert analytics._count[analytics._slots[key[0]]] == 2
+
+
+def test_idle_interfaces_are_compacted_keeping_state():
+    analytics = InterfaceAnalytics(warmup=1, max_idle_cycles=3)
+    stays, leaves = ("a", "1"), ("b", "2")
+    analytics.process([stays, leaves], [row(100.0), row(50.0)], 0)
+    for t in range(1, 7):
+        fields, _ = analytics.process([stays], [row(100.0 + t)], t * 10)
+    assert len(analytics) == 1
+    # A interface que ficou manteve a taxa de variação (estado preservado na compactação)
+    assert fields[0, RATE_IN] == pytest.approx(0.1)
+
+
+def test_many_interfaces_grow_state():
+    analytics = InterfaceAnalytics()
+    keys = [("loc", str(i)) for i in range(3000)]
+    values = [row(float(i), cap_down=8.0 * (i + 1)) for i in range(3000)]
+    fields, _ = analytics.process(keys, values, 0)
+    assert len(analytics) == 3000
+    assert fields[2999, UTIL_IN] == pytest.approx(2999 * 8.0 / (8.0 * 3000))
+    fields, _ = analytics.process(keys, values, 10)
+    assert (fields[:, RATE_IN] == 0).all()
@@ -0,0 +1,172 @@
+import math
+from datetime import datetime, timezone
+
+import pytest
+from influxdb_client import Point, WritePrecision
+
+from common.line_format import format_line
+from line_protocol import (HEARTBEAT_MEASUREMENT, INTERFACE_FIELDS, INTERFACE_MEASUREMENT, LOCATION_FIELDS,
+                           LOCATION_MEASUREMENT, SMOKE_FIELDS, ViaIpeEncoder)
+
+NOW = datetime(2024, 5, 1, 12, 30, 15, 123456)
+
+# Valores de tag que exercitam o escape do Point
+TAG_VALUES = [
+    "PoP PA",
+    "a,b=c",
+    "tab\there",
+    "line\nbreak\r",
+    "ends with\\",
+    "mid\\dle",
+    "acentuação ç",
+    "",
+]
+
+# Floats que exercitam a formatação (inclusive o corte do ".0")
+FLOAT_VALUES = [0.0, -0.0, 1.0, 2.5, 0.1, 1e16, 1.5e-7, -123456789.0, 10 ** 20, 7]
+
+
+def reference(measurement, tags, fields, now=NOW):
+    """Linha gerada pelo influxdb_client, como o agente fazia antes do codificador."""
+    point = Point(measurement)
+    for key, value in tags:
+        point.tag(key, value)
+    for key, value in fields:
+        point.field(key, value)
+    point.time(now, WritePrecision.NS)
+    return point.to_line_protocol().encode()
+
+
+def encoded(build):
+    encoder = ViaIpeEncoder()
+    encoder.begin(NOW)
+    build(encoder)
+    return encoder.lines()
+
+
+def location_reference(location_id, name, location, smoke=None):
+    fields = [(field, float(location.get(key, 0.0))) for field, key in LOCATION_FIELDS]
+    if smoke is not None:
+        fields += [(field, float(smoke.get(key, 0.0))) for field, key in SMOKE_FIELDS]
+    return reference(LOCATION_MEASUREMENT, [("location_id", location_id), ("location_name", name)], fields)
+
+
+def interface_reference(location_id, name, interface):
+    tags = [
+        ("location_id", location_id),
+        ("location_name", name),
+        ("interface_nome", str(interface.get("nome", "unknown"))),
+        ("interface_graph_id", str(interface.get("traffic_graph_id", "unknown"))),
+        ("interface_tipo", str(interface.get("tipo", "unknown"))),
+        ("interface_client_side", str(interface.get("client_side", "unknown"))),
+    ]
+    fields = [(field, float(interface.get(key, 0.0))) for field, key in INTERFACE_FIELDS]
+    return reference(INTERFACE_MEASUREMENT, tags, fields)
+
+
+@pytest.mark.parametrize("value", TAG_VALUES)
+def test_location_tags_are_escaped_like_point(value):
+    location = {"lat": -1.5, "lng": -48.25}
+
+    def build(encoder):
+        encoder.add_location(encoder.location_tags("pop-" + value, value), location)
+
+    assert encoded(build) == [location_reference("pop-" + value, value, location)]
+
+
+def test_trailing_backslash_gets_a_space_like_point():
+    lines = encoded(lambda e: e.add_location(e.location_tags("id", "x\\"), {"lat": 1, "lng": 2}))
+    assert lines[0].startswith(b"viaipe_location_metrics,location_id=id,location_name=x\\  lat=1,lng=2 ")
+    assert lines == [location_reference("id", "x\\", {"lat": 1, "lng": 2})]
+
+
+@pytest.mark.parametrize("value", FLOAT_VALUES)
+def test_float_formatting_matches_point(value):
+    location = {"lat": value, "lng": value}
+    smoke = {key: value for _, key in SMOKE_FIELDS}
+
+    def build(encoder):
+        encoder.add_location(encoder.location_tags("id", "name"), location, smoke)
+
+    assert encoded(build) == [location_reference("id", "name", location, smoke)]
+
+
+def test_non_finite_fields_are_dropped_like_point():
+    location = {"lat": math.nan, "lng": 2.0}
+    smoke = {"loss": math.inf, "avg_val": -math.inf, "val": 3.0}
+
+    def build(encoder):
+        encoder.add_location(encoder.location_tags("id", "name"), location, smoke)
+
+    lines = encoded(build)
+    assert b"lat=" not in lines[0] and b"smoke_loss" not in lines[0]
+    assert lines == [location_reference("id", "name", location, smoke)]
+
+
+def test_point_without_finite_fields_is_skipped():
+    lines = encoded(lambda e: e.add_location(e.location_tags("id", "name"), {"lat": math.nan, "lng": math.inf}))
+    assert lines == []
+    assert reference(LOCATION_MEASUREMENT, [("location_id", "id")], [("lat", math.nan)]) == b""
+
+
+def test_interfaces_match_point():
+    interfaces = [
+        {"nome": "ipe 1", "traffic_graph_id": 10, "tipo": "backbone", "client_side": "A",
+         "traffic_in": 123.5, "traffic_out": 2.0, "max_in": math.nan},
+        {"nome": "x=y,z\\", "traffic_graph_id": "", "tipo": "", "max_traffic_up": 1e9},
+        {},
+    ]
+
+    def build(encoder):
+        tags = encoder.location_tags("pop-pa", "PoP PA")
+        for interface in interfaces:
+            encoder.add_interface(tags, interface, str(interface.get("nome", "unknown")),
+                                  str(interface.get("traffic_graph_id", "unknown")))
+
+    assert encoded(build) == [interface_reference("pop-pa", "PoP PA", interface) for interface in interfaces]
+
+
+def test_add_fields_matches_point():
+    # Os campos saem na ordem recebida; o Point os ordena
+    fields = [("count", 3), ("label", 'say "hi" \\ bye'), ("ratio", 0.5), ("skip", math.nan), ("whole", 4.0)]
+
+    def build(encoder):
+        encoder.add_fields("m", encoder.location_tags("id", "name"), fields)
+
+    assert encoded(build) == [reference("m", [("location_id", "id"), ("location_name", "name")], fields)]
+
+
+def test_add_fields_writes_bools_as_integers():
+    # interface_anomaly é documentado como inteiro (0/1); o Point escreveria true/false
+    lines = encoded(lambda e: e.add_fields("m", e.location_tags("id", ""), [("flag", True), ("other", False)]))
+    assert lines == [reference("m", [("location_id", "id")], [("flag", 1), ("other", 0)])]
+
+
+def test_heartbeat_matches_point():
+    lines = encoded(lambda e: e.add_heartbeat("pop pa", 7))
+    assert lines == [reference(HEARTBEAT_MEASUREMENT, [("location_id", "pop pa")], [("unchanged_points", 7)])]
+
+
+def test_timestamp_is_shared_and_timezone_aware_input_is_converted():
+    aware = NOW.replace(tzinfo=timezone.utc)
+    encoder = ViaIpeEncoder()
+    encoder.begin(aware)
+    encoder.add_heartbeat("a", 1)
+    encoder.add_heartbeat("b", 2)
+    timestamps = {line.rsplit(b" ", 1)[1] for line in encoder.take()}
+    assert timestamps == {reference("m", [], [("f", 1)], aware).rsplit(b" ", 1)[1]}
+    # take() esvazia o buffer, mas mantém o timestamp do ciclo
+    assert encoder.lines() == []
+    encoder.add_heartbeat("c", 3)
+    assert encoder.getvalue().endswith(b"\n") and len(encoder) == 1
+
+
+def test_format_line_matches_point():
+    tags = {"site": "a b", "empty": "", "none": None, "z": "x\\"}
+    fields = {"up": True, "down": False, "count": 2, "rtt": 12.0, "nan": math.nan, "none": None, "text": "ok"}
+    expected = reference(
+        "m", [(key, value) for key, value in tags.items() if value is not None],
+        [(key, value) for key, value in fields.items() if value is not None],
+    )
+    assert format_line("m", tags, fields, NOW).encode() == expected
+    assert format_line("m", tags, {"nan": math.nan}, NOW) == ""
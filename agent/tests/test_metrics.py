@@ -0,0 +1,117 @@
+import math
+import urllib.error
+import urllib.request
+
+import pytest
+
+from common.metrics import MetricsRegistry, serve
+
+
+def test_render_counters_gauges_and_label_escaping():
+    registry = MetricsRegistry()
+    registry.counter("agent_points_total", "Points written", {"agent": "api"}).inc(3)
+    registry.counter("agent_points_total", labels={"agent": "api"}).inc()
+    registry.counter("agent_points_total", labels={"agent": 'si"tes\\x\n'}).inc()
+    registry.gauge("agent_queue", "Queue depth").set(7)
+    assert registry.render() == (
+        '# HELP agent_points_total Points written\n'
+        '# TYPE agent_points_total counter\n'
+        'agent_points_total{agent="api"} 4.0\n'
+        'agent_points_total{agent="si\\"tes\\\\x\\n"} 1.0\n'
+        '# HELP agent_queue Queue depth\n'
+        '# TYPE agent_queue gauge\n'
+        'agent_queue 7.0\n'
+    )
+
+
+def test_same_name_and_labels_return_the_same_metric():
+    registry = MetricsRegistry()
+    assert registry.counter("a", labels={"x": "1", "y": "2"}) is registry.counter("a", labels={"y": "2", "x": "1"})
+    assert registry.counter("a") is not registry.counter("a", labels={"x": "1"})
+    with pytest.raises(ValueError):
+        registry.gauge("a")
+
+
+def test_histogram_buckets_sum_and_count():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("agent_cycle_seconds", "Cycle", {"agent": "api"}, buckets=(1, 0.1, 10))
+    for value in (0.05, 0.1, 0.5, 1.0, 20.0):
+        histogram.observe(value)
+    # Limites inclusivos (le) e contagem acumulada, terminando em +Inf
+    assert histogram.cumulative() == [(0.1, 2), (1, 4), (10, 4), (math.inf, 5)]
+    lines = registry.render().splitlines()
+    assert lines[1:] == [
+        '# TYPE agent_cycle_seconds histogram',
+        'agent_cycle_seconds_bucket{agent="api",le="0.1"} 2',
+        'agent_cycle_seconds_bucket{agent="api",le="1.0"} 4',
+        'agent_cycle_seconds_bucket{agent="api",le="10.0"} 4',
+        'agent_cycle_seconds_bucket{agent="api",le="+Inf"} 5',
+        'agent_cycle_seconds_sum{agent="api"} 21.65',
+        'agent_cycle_seconds_count{agent="api"} 5',
+    ]
+
+
+def test_histogram_quantile_interpolates_within_the_bucket():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("h", buckets=(1, 2, 4))
+    assert histogram.quantile(0.5) == 0.0
+    for value in (0.5, 1.5, 1.5, 3.0):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 1.5
+    assert histogram.quantile(1.0) == 4
+    histogram.observe(100)
+    # Acima do último limite o quantil fica no limite
+    assert histogram.quantile(1.0) == 4
+
+
+def test_collectors_are_exposed_as_gauges():
+    registry = MetricsRegistry()
+    registry.add_collector("agent_writer", lambda: {"pending": 3, "written": 10.5, "state": "ok"})
+
+    def broken():
+        raise RuntimeError("boom")
+
+    registry.add_collector("agent_broken", broken)
+    assert registry.render() == (
+        "# TYPE agent_writer_pending gauge\nagent_writer_pending 3.0\n"
+        "# TYPE agent_writer_written gauge\nagent_writer_written 10.5\n"
+    )
+
+
+def test_to_lines():
+    registry = MetricsRegistry()
+    registry.counter("agent_points_total", labels={"sink": "file a,b"}).inc(2)
+    registry.gauge("agent_nan").set(math.nan)
+    histogram = registry.histogram("agent_write_seconds", buckets=(1, 2))
+    histogram.observe(0.5)
+    histogram.observe(1.5)
+    lines = registry.to_lines(tags={"host": "pop pa", "agent": "api"})
+    timestamps = {line.rsplit(" ", 1)[1] for line in lines}
+    assert len(timestamps) == 1
+    timestamp = timestamps.pop()
+    # Valores não finitos são omitidos
+    assert lines == [
+        f"agent_self,agent=api,host=pop\\ pa,metric=agent_points_total,sink=file\\ a\\,b value=2.0 {timestamp}",
+        f"agent_self,agent=api,host=pop\\ pa,metric=agent_write_seconds count=2i,sum=2.0,p50=1.0,p99=1.98 {timestamp}",
+    ]
+
+
+def test_serve_answers_metrics_on_an_ephemeral_port():
+    registry = MetricsRegistry()
+    registry.counter("agent_requests_total").inc()
+    server = serve(registry, 0, host="127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_port}"
+        with urllib.request.urlopen(url + "/metrics?x=1", timeout=5) as response:
+            assert response.headers["Content-Type"] == "text/plain; version=0.0.4; charset=utf-8"
+            assert response.read().decode() == registry.render()
+        # Cada requisição lê os valores atuais
+        registry.counter("agent_requests_total").inc()
+        with urllib.request.urlopen(url + "/", timeout=5) as response:
+            assert b"agent_requests_total 2.0" in response.read()
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + "/other", timeout=5)
+        assert error.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
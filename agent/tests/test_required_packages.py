@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+from .conftest import AGENT_API_ENV, AGENT_DIR, INFLUXDB_ENV
+
+ZSTD_FILE_SINK_ENV = {"OUTPUT_SINKS": "influxdb,file", "FILE_SINK_DIR": tempfile.gettempdir(),
+                      "FILE_SINK_COMPRESSION": "zstd"}
+ZSTD_MESSAGE = "zstandard (needed by FILE_SINK_COMPRESSION=zstd; install requirements-zstd.txt)"
+
+
+def import_agent(module, env, blocked=()):
+    """Importa o agente num processo novo, com ``blocked`` ausentes para o ``find_spec``.
+
+    Roda fora do repositório para o ``load_dotenv`` não carregar um ``.env`` local.
+    """
+    code = f"import sys\nfor name in {list(blocked)!r}:\n    sys.modules[name] = None\nimport {module}\n"
+    path = os.pathsep.join([AGENT_DIR, os.path.join(AGENT_DIR, module)])
+    environ = {name: value for name, value in os.environ.items()
+               if not name.startswith(("VIAIPE_", "INFLUXDB_", "PAGE_LOAD_", "AGENT_", "OUTPUT_SINKS"))}
+    environ.update(env, PYTHONPATH=path)
+    return subprocess.run([sys.executable, "-c", code], env=environ, cwd=tempfile.gettempdir(),
+                          capture_output=True, text=True, timeout=60)
+
+
+@pytest.mark.parametrize("env, blocked, message", [
+    ({}, ["requests"], "requests (needed by VIAIPE_API_URL; install requirements-api.txt)"),
+    ({"VIAIPE_STREAMING": "true"}, ["ijson"], "ijson (needed by VIAIPE_STREAMING; install requirements-streaming.txt)"),
+    ({"VIAIPE_API_URLS": "http://127.0.0.1:9/a,http://127.0.0.1:9/b"}, ["aiohttp"],
+     "aiohttp (needed by VIAIPE_API_URLS; install requirements-regions.txt)"),
+    ({"VIAIPE_ANALYTICS": "true"}, ["numpy"], "numpy (needed by VIAIPE_ANALYTICS; install requirements-analytics.txt)"),
+    ({}, ["influxdb_client"], "influxdb_client (needed by AGENT_RUNTIME=full; install requirements-influxdb.txt)"),
+    (ZSTD_FILE_SINK_ENV, ["zstandard"], ZSTD_MESSAGE),
+])
+def test_agent_api_names_the_missing_feature_package(env, blocked, message):
+    result = import_agent("agent_api", dict(AGENT_API_ENV, **env), blocked)
+    assert result.returncode != 0
+    assert f"Missing packages for the configured features: {message}" in result.stderr
+
+
+def test_agent_api_slim_needs_only_the_enabled_features():
+    # Coleta por VIAIPE_API_URLS no runtime slim: sem requests, ijson, numpy nem influxdb_client
+    env = dict(AGENT_API_ENV, AGENT_RUNTIME="slim", VIAIPE_API_URLS="http://127.0.0.1:9/a")
+    result = import_agent("agent_api", env, ["requests", "ijson", "numpy", "influxdb_client"])
+    assert result.returncode == 0, result.stderr
+
+
+def test_agent_sites_needs_requests_only_for_legacy_timing():
+    env = dict(INFLUXDB_ENV, AGENT_RUNTIME="slim")
+    result = import_agent("agent_sites", env, ["requests", "influxdb_client"])
+    assert "requests (needed by PAGE_LOAD_TIMING=off; install requirements-legacy-timing.txt)" in result.stderr
+
+    result = import_agent("agent_sites", dict(env, PAGE_LOAD_TIMING="cold"), ["requests", "influxdb_client"])
+    assert result.returncode == 0, result.stderr
+
+
+def test_agent_sites_needs_zstandard_only_for_zstd_files():
+    env = dict(INFLUXDB_ENV, **ZSTD_FILE_SINK_ENV)
+    result = import_agent("agent_sites", env, ["zstandard"])
+    assert ZSTD_MESSAGE in result.stderr
+
+    result = import_agent("agent_sites", dict(env, OUTPUT_SINKS="influxdb"), ["zstandard"])
+    assert result.returncode == 0, result.stderr
+
+
+@pytest.mark.parametrize("agent", ["agent_api", "agent_sites"])
+def test_requirement_files_match_the_checked_features(agent):
+    directory = os.path.join(AGENT_DIR, agent)
+    with open(os.path.join(directory, "requirements-slim.txt")) as f:
+        assert f.read().split() == ["python-dotenv"]
+    # O requirements.txt completo inclui todas as funcionalidades
+    files = sorted(name for name in os.listdir(directory) if name.startswith("requirements-"))
+    with open(os.path.join(directory, "requirements.txt")) as f:
+        assert sorted(line.split()[1] for line in f if line.strip()) == files
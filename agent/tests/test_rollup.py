@@ -0,0 +1,150 @@
+import math
+import random
+
+import pytest
+
+from rollup import QuantileSketch, RollupAggregator, parse_window, window_label
+
+QUANTILES = [0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 0.999, 1.0]
+
+
+def exact_quantile(values, q):
+    # Mesma definição de posto do sketch: o menor valor com mais de q * (n - 1) valores antes
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def sample(seed, count=20_000):
+    rng = random.Random(seed)
+    # Tráfego de interface: de kbit/s a dezenas de Gbit/s, com cauda longa
+    return [rng.lognormvariate(15, 2) for _ in range(count)]
+
+
+def assert_within_accuracy(sketch, values, accuracy=0.01):
+    for q in QUANTILES:
+        expected = exact_quantile(values, q)
+        assert sketch.quantile(q) == pytest.approx(expected, rel=accuracy * 1.0001), q
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_sketch_quantiles_within_one_percent(seed):
+    values = sample(seed)
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+    assert sketch.count == len(values)
+    assert_within_accuracy(sketch, values)
+
+
+def test_zero_and_negative_values_count_as_zero():
+    sketch = QuantileSketch()
+    for value in [0.0, -5.0, 0.0, 10.0]:
+        sketch.add(value)
+    assert sketch.zero_count == 3
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1.0) == pytest.approx(10.0, rel=0.01)
+    assert QuantileSketch().quantile(0.5) == 0.0
+
+
+def test_merged_sketch_equals_sketch_of_all_values():
+    values = sample(4)
+    whole = QuantileSketch()
+    parts = [QuantileSketch() for _ in range(4)]
+    for i, value in enumerate(values):
+        whole.add(value)
+        parts[i % 4].add(value)
+    merged = QuantileSketch()
+    for part in parts:
+        merged.merge(part)
+    assert merged.count == whole.count
+    assert [merged.quantile(q) for q in QUANTILES] == [whole.quantile(q) for q in QUANTILES]
+    assert_within_accuracy(merged, values)
+
+
+def test_bin_limit_keeps_high_quantiles_accurate():
+    values = sample(5)
+    sketch = QuantileSketch(max_bins=200)
+    for value in values:
+        sketch.add(value)
+    assert len(sketch._bins) == 200
+    # Os valores abaixo do menor bin mantido foram colapsados nele
+    lowest = math.exp(sketch._log_gamma * (sketch._offset - 1))
+    for q in QUANTILES:
+        expected = exact_quantile(values, q)
+        if expected > lowest:
+            assert sketch.quantile(q) == pytest.approx(expected, rel=0.0101), q
+        else:
+            assert expected <= sketch.quantile(q) <= lowest * 1.03, q
+    assert sketch.quantile(0.99) == pytest.approx(exact_quantile(values, 0.99), rel=0.0101)
+
+
+def test_parse_and_label_windows():
+    assert [parse_window(w) for w in ("90s", "5m", " 1H ", "2d", "30")] == [90, 300, 3600, 172800, 30]
+    assert [window_label(s) for s in (45, 60, 300, 3600, 5400, 86400)] == ["45s", "1m", "5m", "1h", "90m", "1d"]
+
+
+def test_windows_must_be_multiples_of_the_smallest():
+    with pytest.raises(ValueError):
+        RollupAggregator([60, 90])
+    with pytest.raises(ValueError):
+        RollupAggregator([0])
+
+
+def parse_line(line):
+    head, fields, timestamp = line.rsplit(" ", 2)
+    values = {}
+    for part in fields.split(","):
+        key, value = part.split("=")
+        values[key] = int(value[:-1]) if value.endswith("i") else float(value)
+    return head, values, int(timestamp)
+
+
+def test_larger_windows_merge_closed_base_windows():
+    rng = random.Random(6)
+    aggregator = RollupAggregator([60, 300], sketch_fields=["traffic_in"])
+    samples = {}
+    # 10 minutos de amostras a cada 10 s, começando num múltiplo de 5 min
+    start = 1_714_564_800
+    lines = []
+    for t in range(start, start + 600, 10):
+        value = rng.lognormvariate(10, 1)
+        samples[t] = value
+        aggregator.add("viaipe_interface_metrics", ",interface_graph_id=10", {"traffic_in": value}, t)
+        lines += aggregator.collect(t)
+    lines += aggregator.collect(start + 600)
+
+    parsed = [parse_line(line) for line in lines]
+    one_minute = [p for p in parsed if p[0].startswith("viaipe_interface_metrics_1m,")]
+    five_minutes = [p for p in parsed if p[0].startswith("viaipe_interface_metrics_5m,")]
+    assert len(one_minute) == 10 and len(five_minutes) == 2
+    assert aggregator.series_count() == 0
+
+    for head, fields, timestamp in five_minutes:
+        assert head == "viaipe_interface_metrics_5m,interface_graph_id=10"
+        end = timestamp // 10 ** 9
+        values = [v for t, v in samples.items() if end - 300 <= t < end]
+        assert fields["samples"] == len(values) == 30
+        assert fields["traffic_in_min"] == pytest.approx(min(values))
+        assert fields["traffic_in_max"] == pytest.approx(max(values))
+        assert fields["traffic_in_mean"] == pytest.approx(sum(values) / len(values))
+        assert fields["traffic_in_last"] == pytest.approx(values[-1])
+        # O sketch da janela de 5 min é a soma dos sketches de 1 min, com o mesmo erro
+        for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            assert fields[f"traffic_in_{name}"] == pytest.approx(exact_quantile(values, q), rel=0.0101)
+
+
+def test_flush_writes_finished_windows_and_drops_incomplete_ones():
+    aggregator = RollupAggregator([60, 3600])
+    aggregator.add("m", ",k=v", {"f": 2.0}, 30)
+    aggregator.add("m", ",k=v", {"f": 4.0}, 90)
+    aggregator.add("m", ",k=v", {"f": 6.0}, 130)
+    assert aggregator.collect(100) == ["m_1m,k=v f_min=2,f_max=2,f_mean=2,f_last=2,samples=1i 60000000000"]
+    # A janela 60-120 já terminou; 120-180 e a de 1h estão incompletas e não são escritas
+    assert aggregator.flush(150) == ["m_1m,k=v f_min=4,f_max=4,f_mean=4,f_last=4,samples=1i 120000000000"]
+    assert aggregator.series_count() == 0 and aggregator.lines_emitted == 2
+    # Depois de um reinício a janela é escrita uma única vez, só com as amostras novas
+    aggregator.add("m", ",k=v", {"f": 8.0}, 170)
+    assert aggregator.collect(3600) == [
+        "m_1m,k=v f_min=8,f_max=8,f_mean=8,f_last=8,samples=1i 180000000000",
+        "m_1h,k=v f_min=8,f_max=8,f_mean=8,f_last=8,samples=1i 3600000000000",
+    ]
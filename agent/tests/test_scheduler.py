@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from scheduler import SiteScheduler, normalize_sites
+
+
+def sites(count, host=None, interval=60.0):
+    return [{"name": f"site{i}", "ping_target": host or f"host{i}", "interval": interval, "offset": 0.0}
+            for i in range(count)]
+
+
+class ConcurrencyProbe:
+    """``run_site`` que mede quantos testes rodam ao mesmo tempo."""
+
+    def __init__(self, duration=0.05):
+        self.duration = duration
+        self.active = 0
+        self.peak = 0
+        self.finished = 0
+
+    async def __call__(self, site):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.duration)
+        finally:
+            self.active -= 1
+        self.finished += 1
+        return [{"site_name": site["name"]}]
+
+
+def run_for(scheduler, seconds):
+    async def main():
+        try:
+            await asyncio.wait_for(scheduler.run(), seconds)
+        except asyncio.TimeoutError:
+            pass
+    asyncio.run(main())
+
+
+def test_global_cap_is_respected_across_event_loops():
+    probe = ConcurrencyProbe()
+    results = []
+    # Criado fora de qualquer event loop, como no agent_sites
+    scheduler = SiteScheduler(sites(6), probe, results.extend, global_concurrency=2, report_interval=60)
+
+    # Cada asyncio.run usa um event loop novo; o limite precisa valer (e funcionar) nos dois
+    for _ in range(2):
+        run_for(scheduler, 0.4)
+        assert probe.peak == 2
+
+    assert scheduler.errors == 0
+    assert probe.finished == scheduler.runs == 12
+    assert len(results) == 12
+
+
+def test_per_host_cap():
+    probe = ConcurrencyProbe()
+    scheduler = SiteScheduler(sites(4, host="same.example"), probe, lambda results: None,
+                              global_concurrency=10, per_host_concurrency=1, report_interval=60)
+    run_for(scheduler, 0.4)
+    assert probe.peak == 1 and probe.finished == 4
+    assert scheduler.stats()["lag_max"] >= 0.1
+
+
+def test_site_still_running_skips_its_next_slot():
+    probe = ConcurrencyProbe(duration=0.25)
+    scheduler = SiteScheduler(sites(1, interval=0.1), probe, lambda results: None, report_interval=60)
+    run_for(scheduler, 0.38)
+    assert scheduler.runs == 1
+    assert scheduler.skipped_in_flight >= 1
+
+
+def test_sites_without_interval_get_the_defaults():
+    builtin = [{"name": "a", "ping_target": "a.example"}, {"name": "b", "page_load_url": "https://b.example"}]
+    probe = ConcurrencyProbe(duration=0.01)
+    scheduler = SiteScheduler(normalize_sites(builtin, 0.1), probe, lambda results: None, report_interval=60)
+    assert all(site["interval"] == 0.1 and 0 <= site["offset"] < 0.1 for site in builtin)
+    run_for(scheduler, 0.35)
+    assert scheduler.errors == 0 and scheduler.runs >= 4
+
+
+def test_builtin_sites_run_in_scheduled_mode(agent_sites):
+    # Sem SITES_CONFIG_FILE o modo agendado usa a lista embutida
+    assert agent_sites.TEST_SITES and not agent_sites.SITES_CONFIG_FILE
+    for site in agent_sites.TEST_SITES:
+        assert site["interval"] == agent_sites.INTERVAL_SECONDS
+        assert 0 <= site["offset"] < site["interval"]
+    scheduler = SiteScheduler(agent_sites.TEST_SITES, ConcurrencyProbe(), lambda results: None, report_interval=60)
+    run_for(scheduler, 0.2)
+    assert scheduler.errors == 0
+
+
+def test_invalid_sites_are_rejected():
+    for sites_value in ({"name": "a"}, [{"ping_target": "x"}], [{"name": "a"}],
+                        [{"name": "a", "ping_target": "x"}] * 2, [{"name": "a", "ping_target": "x", "interval": 0}]):
+        with pytest.raises(ValueError):
+            normalize_sites(sites_value, 60, "TEST_SITES")
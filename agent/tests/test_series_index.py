@@ -0,0 +1,124 @@
+import json
+
+from line_protocol import ViaIpeEncoder
+from series_index import SeriesIndex
+
+INTERFACE = {"tipo": "backbone", "client_side": "false"}
+
+
+def cycle(index, now, locations):
+    """Um ciclo do coletor: ``locations`` mapeia location_id -> (nome, {graph_id: nome da interface})."""
+    index.begin(now)
+    tags = {}
+    for location_id, (location_name, interfaces) in locations.items():
+        tags[location_id] = index.location(location_id, location_name)
+        for graph_id, interface_name in interfaces.items():
+            tags[(location_id, graph_id)] = index.interface(location_id, graph_id, location_name, interface_name,
+                                                            INTERFACE)
+    index.end()
+    return tags
+
+
+def test_full_tags_match_the_encoder(tmp_path):
+    index = SeriesIndex(str(tmp_path / "series.json"))
+    tags = cycle(index, 100, {"pop,pa": ("PoP Pará", {10: "Link=RNP 1"})})
+    encoder = ViaIpeEncoder()
+    location_tags = encoder.location_tags("pop,pa", "PoP Pará")
+    assert tags["pop,pa"] == location_tags
+    assert tags[("pop,pa", 10)] == encoder.interface_tags(location_tags, INTERFACE, "Link=RNP 1", 10)
+    # Ciclo seguinte com os mesmos valores: o mesmo objeto internado
+    assert cycle(index, 110, {"pop,pa": ("PoP Pará", {10: "Link=RNP 1"})})[("pop,pa", 10)] is tags[("pop,pa", 10)]
+
+
+def test_limit_rejects_only_new_series(tmp_path, capsys):
+    index = SeriesIndex(str(tmp_path / "series.json"), max_series=4, alert_ratio=0.75)
+    tags = cycle(index, 100, {"a": ("A", {1: "if1", 2: "if2"})})
+    assert None not in tags.values() and index.stats()["series"] == 3
+    assert "ALERT: series index at 75%" in capsys.readouterr().out
+
+    tags = cycle(index, 110, {"a": ("A", {1: "if1", 2: "if2", 3: "if3", 4: "if4"}), "b": ("B", {5: "if5"})})
+    # A quarta série entra; as seguintes são recusadas, e as já conhecidas continuam aceitas
+    assert tags[("a", 3)] is not None
+    assert tags[("a", 4)] is None and tags["b"] is None and tags[("b", 5)] is None
+    assert tags["a"] is not None and tags[("a", 1)] is not None
+    assert index.stats() == {"series": 4, "limit": 4, "added": 1, "renamed": 0, "rejected": 3, "pruned": 0}
+    assert "ALERT: series index full (4/4), dropped points of 3 new series" in capsys.readouterr().out
+
+
+def test_rename_updates_tags_in_place(tmp_path):
+    index = SeriesIndex(str(tmp_path / "series.json"))
+    before = cycle(index, 100, {"a": ("A", {1: "old name"})})
+    after = cycle(index, 110, {"a": ("A", {1: "new name"})})
+    assert len(index) == 2 and index.renamed == 1 and index.added == 0
+    assert after[("a", 1)] != before[("a", 1)] and "interface_nome=new\\ name" in after[("a", 1)]
+
+
+def test_ids_mode_keeps_series_across_renames(tmp_path):
+    index = SeriesIndex(str(tmp_path / "series.json"), tag_mode="ids", metadata_interval=3600)
+    index.begin(100)
+    location_tags = index.location("a", "A")
+    tags = index.interface("a", 1, "A", "old name", INTERFACE)
+    assert (location_tags, tags) == (",location_id=a", ",interface_graph_id=1,location_id=a")
+    rows = index.metadata_rows()
+    assert rows[1] == (tags, [("interface_client_side", "false"), ("interface_nome", "old name"),
+                              ("interface_tipo", "backbone"), ("location_name", "A"), ("renames", 0)])
+    index.end()
+
+    # Sem mudança os metadados só voltam depois de metadata_interval
+    index.begin(200)
+    index.interface("a", 1, "A", "old name", INTERFACE)
+    assert index.metadata_rows() == []
+    index.end()
+
+    # Renomeação: mesmas tags (sem série nova), metadados reescritos na hora
+    index.begin(300)
+    assert index.interface("a", 1, "A", "new name", INTERFACE) == tags
+    [(row_tags, fields)] = index.metadata_rows()
+    assert row_tags == tags and ("interface_nome", "new name") in fields and ("renames", 1) in fields
+    index.end()
+
+
+def test_graph_id_conflict_keeps_the_first_interface(tmp_path):
+    index = SeriesIndex(str(tmp_path / "series.json"), tag_mode="ids")
+    index.begin(100)
+    assert index.interface("a", 1, "A", "first", INTERFACE) == ",interface_graph_id=1,location_id=a"
+    assert index.interface("a", 1, "A", "second", INTERFACE) is None
+    index.end()
+    assert index.conflicts == 1 and index.renamed == 0
+    assert index._series[("a", 1)][0][1] == "first"
+
+
+def test_index_persists_across_restarts(tmp_path):
+    path = str(tmp_path / "state" / "series.json")
+    index = SeriesIndex(path, max_series=3)
+    cycle(index, 100, {"a": ("A", {1: "if1"})})
+    cycle(index, 110, {"a": ("A", {1: "renamed"})})
+    with open(path, encoding="utf-8") as f:
+        saved = json.load(f)
+    assert saved["version"] == 1 and len(saved["series"]) == 2
+
+    restarted = SeriesIndex(path, max_series=3)
+    assert len(restarted) == 2
+    tags = cycle(restarted, 120, {"a": ("A", {1: "renamed", 2: "if2"}), "b": ("B", {})})
+    # Valores iguais aos gravados não contam como renomeação; o limite considera as séries carregadas
+    assert restarted.renamed == 0 and restarted.added == 1
+    assert tags["b"] is None and restarted.rejected == 1
+    assert restarted._series[("a", 1)][6] == 1
+
+
+def test_expired_series_are_pruned_and_saved(tmp_path):
+    path = str(tmp_path / "series.json")
+    index = SeriesIndex(path, ttl=60)
+    cycle(index, 100, {"a": ("A", {1: "if1"}), "b": ("B", {})})
+    cycle(index, 200, {"a": ("A", {1: "if1"})})
+    assert index.pruned == 1 and len(index) == 2
+    assert len(SeriesIndex(path)) == 2
+
+
+def test_invalid_index_file_starts_empty(tmp_path, capsys):
+    path = tmp_path / "series.json"
+    path.write_text('{"version": 99, "series": []}')
+    assert len(SeriesIndex(str(path))) == 0
+    path.write_text('{"version": 1, "series": [["a", null')
+    assert len(SeriesIndex(str(path))) == 0
+    assert capsys.readouterr().out.count("Ignoring series index") == 2
@@ -0,0 +1,163 @@
+import functools
+import os
+import time
+import zlib
+
+import pytest
+
+from sharding import ShardPool, partition, shard_hash
+
+LOCATIONS = [{"id": f"loc-{i}", "name": f"Location {i}"} for i in range(500)]
+
+
+def ids(shard):
+    return [location["id"] for location in shard]
+
+
+def test_shard_hash_is_crc32_of_the_id():
+    assert shard_hash("pop-pa") == zlib.crc32(b"pop-pa")
+    assert shard_hash(42) == shard_hash("42")
+
+
+def test_partition_is_stable_and_complete():
+    shards, duplicates = partition(LOCATIONS, 4)
+    assert duplicates == 0
+    assert sorted(sum(map(ids, shards), [])) == sorted(ids(LOCATIONS))
+    assert all(shards)
+    for shard_index, shard in enumerate(shards):
+        for location in shard:
+            assert shard_hash(location["id"]) % 4 == shard_index
+    # A ordem do payload não muda a fatia de cada localidade
+    again, _ = partition(LOCATIONS[::-1], 4)
+    assert [sorted(ids(shard)) for shard in again] == [sorted(ids(shard)) for shard in shards]
+
+
+def test_partition_skips_repeated_locations():
+    repeated = LOCATIONS[:10] + [dict(location, name="other endpoint") for location in LOCATIONS[:3]]
+    shards, duplicates = partition(repeated, 2)
+    assert duplicates == 3
+    kept = sum(shards, [])
+    assert len(kept) == 10 and all(location["name"] != "other endpoint" for location in kept)
+
+
+def test_instances_split_locations_and_spread_over_processes():
+    seen = []
+    for instance in range(3):
+        shards, _ = partition(LOCATIONS, 4, index=instance, instance_count=3)
+        # A fatia de cada instância ocupa todos os seus processos
+        assert all(shards)
+        for location in sum(shards, []):
+            assert shard_hash(location["id"]) % 3 == instance
+        seen += sum(map(ids, shards), [])
+    assert sorted(seen) == sorted(ids(LOCATIONS))
+
+
+# Handlers do pool: funções do módulo para poderem ser enviadas ao processo (spawn)
+_calls = 0
+
+
+def count_calls(shard, locations, now):
+    global _calls
+    _calls += 1
+    return {"shard": shard, "pid": os.getpid(), "calls": _calls, "ids": ids(locations), "now": now}
+
+
+def crash_on(marker, shard, locations, now):
+    if marker in ids(locations):
+        os._exit(1)
+    return len(locations)
+
+
+def sleep_on(marker, shard, locations, now):
+    if marker in ids(locations):
+        time.sleep(1.0)
+    return len(locations)
+
+
+def fail_on(marker, shard, locations, now):
+    if marker in ids(locations):
+        raise ValueError("bad location")
+    return len(locations)
+
+
+def touch(directory):
+    with open(os.path.join(directory, f"closed-{os.getpid()}"), "w"):
+        pass
+
+
+@pytest.fixture
+def pools():
+    created = []
+
+    def make(*args, **kwargs):
+        pool = ShardPool(*args, **kwargs).start()
+        created.append(pool)
+        return pool
+
+    yield make
+    for pool in created:
+        pool.close(timeout=5)
+
+
+@pytest.mark.parametrize("start_method", ["spawn", "fork"])
+def test_each_shard_keeps_its_process_across_cycles(pools, start_method):
+    pool = pools(2, count_calls, start_method=start_method)
+    shards, _ = partition(LOCATIONS[:20], 2)
+    first = pool.run(shards, 1, timeout=30)
+    second = pool.run(shards, 2, timeout=30)
+    for shard in range(2):
+        assert first[shard]["shard"] == second[shard]["shard"] == shard
+        assert first[shard]["ids"] == ids(shards[shard])
+        # Mesmo processo e estado preservado entre os ciclos
+        assert first[shard]["pid"] == second[shard]["pid"] != os.getpid()
+        assert (first[shard]["calls"], second[shard]["calls"]) == (1, 2)
+        assert (first[shard]["now"], second[shard]["now"]) == (1, 2)
+    assert first[0]["pid"] != first[1]["pid"]
+
+
+def test_crashed_shard_is_restarted_and_its_cycle_lost(pools):
+    pool = pools(2, functools.partial(crash_on, "loc-0"), start_method="fork")
+    shards, _ = partition(LOCATIONS[:20], 2)
+    crashed = next(i for i, shard in enumerate(shards) if "loc-0" in ids(shard))
+    results = pool.run(shards, 1, timeout=10)
+    assert results[crashed] is None
+    assert results[1 - crashed] == len(shards[1 - crashed])
+    assert (pool.failures, pool.restarts) == (1, 1)
+
+    # O processo novo atende o ciclo seguinte normalmente
+    shards[crashed] = [location for location in shards[crashed] if location["id"] != "loc-0"]
+    assert pool.run(shards, 2, timeout=10) == [len(shard) for shard in shards]
+
+
+def test_slow_shard_times_out_without_failing_the_others(pools):
+    pool = pools(2, functools.partial(sleep_on, "loc-0"), start_method="fork")
+    shards, _ = partition(LOCATIONS[:20], 2)
+    slow = next(i for i, shard in enumerate(shards) if "loc-0" in ids(shard))
+    results = pool.run(shards, 1, timeout=0.3)
+    assert results[slow] is None and pool.failures == 1
+    # A fatia rápida responde mesmo quando a lenta consome todo o prazo antes dela
+    assert results[1 - slow] == len(shards[1 - slow])
+    shards[slow] = [location for location in shards[slow] if location["id"] != "loc-0"]
+    assert pool.run(shards, 2, timeout=10) == [len(shard) for shard in shards]
+
+
+def test_handler_error_loses_only_that_shard(pools):
+    pool = pools(2, functools.partial(fail_on, "loc-0"), start_method="fork")
+    shards, _ = partition(LOCATIONS[:20], 2)
+    failed = next(i for i, shard in enumerate(shards) if "loc-0" in ids(shard))
+    results = pool.run(shards, 1, timeout=10)
+    assert results[failed] is None and results[1 - failed] == len(shards[1 - failed])
+    # Erro do handler não derruba o processo
+    assert pool.restarts == 0
+
+
+def test_close_runs_shutdown_in_every_process(tmp_path):
+    pool = ShardPool(3, count_calls, shutdown=functools.partial(touch, str(tmp_path)), start_method="fork").start()
+    pool.run([[], [], []], 0, timeout=10)
+    pool.close(timeout=5)
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_pool_needs_a_process():
+    with pytest.raises(ValueError):
+        ShardPool(0, count_calls)
@@ -0,0 +1,150 @@
+import gzip
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from common.sinks import FanOut, FileSink, QueuedSink, UdpSink, build_writer, parse_address, parse_sinks
+
+LINES = [b"m,k=v f=1i 1", b"m,k=v f=2i 2"]
+
+
+def write_files(sink, count):
+    """Escreve ``count`` arquivos completos; retorna os nomes na ordem de criação."""
+    names = []
+    for _ in range(count):
+        sink._write(LINES)
+        names.append(os.path.basename(sink._path))
+        sink._rotate()
+    return names
+
+
+def test_rotation_publishes_complete_files(tmp_path):
+    sink = FileSink(str(tmp_path), prefix="agent_sites", rotate_bytes=1)
+    sink._write(LINES)
+    [name] = os.listdir(tmp_path)
+    assert name.startswith("agent_sites-") and name.endswith(".lp.gz")
+    with gzip.open(tmp_path / name) as f:
+        assert f.read() == b"\n".join(LINES) + b"\n"
+    # Um arquivo novo por rotação (com sufixo se aberto no mesmo segundo)
+    sink._write(LINES)
+    assert len(os.listdir(tmp_path)) == 2 and sink.files_written == 2
+
+
+@pytest.mark.parametrize("compression", ["gzip", "none"])
+def test_max_files_prunes_only_this_prefix(tmp_path, compression):
+    # Arquivos de outros processos/destinos no mesmo diretório
+    foreign = set(write_files(FileSink(str(tmp_path), prefix="agent_api-shard0", compression=compression), 3))
+    foreign |= {"agent_api-notes.lp", "agent_api-20240101T000000.lp.gz.part", "agent_api-20240101T000000.lp.zst"}
+    for name in foreign - set(os.listdir(tmp_path)):
+        (tmp_path / name).write_bytes(b"")
+
+    sink = FileSink(str(tmp_path), prefix="agent_api", compression=compression, max_files=2)
+    written = write_files(sink, 4)
+    # Ficam os dois arquivos mais novos deste destino e todos os outros
+    assert set(os.listdir(tmp_path)) == foreign | set(written[-2:])
+
+
+@pytest.fixture
+def receiver():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(5)
+    yield sock
+    sock.close()
+
+
+def receive(sock, count):
+    return [sock.recv(65536) for _ in range(count)]
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("condition not reached in time")
+        time.sleep(0.01)
+
+
+def test_udp_sink_packs_lines_into_datagrams(receiver):
+    sink = UdpSink("localhost", receiver.getsockname()[1], max_packet=30).start()
+    # Resolvido na criação: o sendto não recebe o hostname
+    assert sink.address[:2] == ("127.0.0.1", receiver.getsockname()[1])
+    sink.submit(LINES * 2)
+    # Duas linhas (26 bytes) por datagrama de até 30 bytes
+    assert receive(receiver, 2) == [b"\n".join(LINES) + b"\n"] * 2
+    wait_until(lambda: sink.packets_sent == 2)
+    sink.close()
+    assert sink.points_written == 4 and sink.packets_dropped == 0
+
+
+def test_udp_sink_rejects_unresolvable_hosts():
+    with pytest.raises(EnvironmentError):
+        UdpSink("udp-sink.invalid", 8089)
+
+
+class BrokenSink(QueuedSink):
+    name = "broken"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.release = threading.Event()
+
+    def _write(self, lines):
+        # Destino travado até o fim do teste e depois com erro
+        self.release.wait(5)
+        raise OSError("unreachable")
+
+
+def test_fan_out_isolates_a_stuck_sink(receiver):
+    broken = BrokenSink(max_pending=2)
+    udp = UdpSink("127.0.0.1", receiver.getsockname()[1])
+    writer = FanOut([broken, udp]).start()
+    for line in LINES * 3:
+        writer.submit([line])
+    # O destino travado enche a fila e descarta; o UDP recebe tudo
+    assert receive(receiver, 1)[0].startswith(LINES[0])
+    wait_until(lambda: udp.points_written == 6)
+    assert broken.points_dropped > 0
+    stats = writer.stats()
+    assert stats["udp_points_written"] == 6 and stats["broken_points_written"] == 0
+    broken.release.set()
+    writer.close()
+    assert broken.write_failures >= 1
+    assert writer.stats_line().startswith("broken: queue=0")
+
+
+def test_parse_sinks_and_address():
+    assert parse_sinks(" InfluxDB, file ,") == ["influxdb", "file"]
+    for text in ("", "influxdb,kafka"):
+        with pytest.raises(EnvironmentError):
+            parse_sinks(text)
+    assert parse_address("telegraf:8089") == ("telegraf", 8089)
+    assert parse_address("[::1]:8089") == ("::1", 8089)
+    for text in ("telegraf", "telegraf:port"):
+        with pytest.raises(EnvironmentError):
+            parse_address(text)
+
+
+def test_build_writer(tmp_path, receiver):
+    created = []
+
+    def influxdb():
+        created.append(True)
+        return FileSink(str(tmp_path / "influx"), compression="none")
+
+    writer = build_writer(["file"], influxdb=influxdb, file_dir=str(tmp_path / "files"), file_compression="none")
+    # Um só destino é retornado sem FanOut, e o InfluxDB só é criado se estiver na lista
+    assert isinstance(writer, FileSink) and not created
+    writer.close()
+
+    port = receiver.getsockname()[1]
+    writer = build_writer(["influxdb", "udp"], influxdb=influxdb, udp_address=f"127.0.0.1:{port}")
+    assert isinstance(writer, FanOut) and [sink.name for sink in writer.sinks] == ["file", "udp"]
+    writer.submit(LINES)
+    assert receive(receiver, 1) == [b"\n".join(LINES) + b"\n"]
+    writer.close()
+    with open(tmp_path / "influx" / os.listdir(tmp_path / "influx")[0], "rb") as f:
+        assert f.read() == b"\n".join(LINES) + b"\n"
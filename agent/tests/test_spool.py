@@ -0,0 +1,164 @@
+import os
+import time
+
+import pytest
+
+from common.influx_writer import InfluxWriter
+from common.spool import WriteSpool
+
+
+def lines(start, count):
+    return [f"m,n={i} v={i}i {i}".encode() for i in range(start, start + count)]
+
+
+def replay(spool, max_lines=1000):
+    """Lê e confirma todos os segmentos fechados; retorna as linhas na ordem."""
+    replayed = []
+    while True:
+        batch, token = spool.read_batch(max_lines)
+        if token is None:
+            return replayed
+        replayed.extend(batch)
+        spool.ack(token)
+
+
+def segment_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith("spool-"))
+
+
+def test_only_closed_segments_are_replayed(tmp_path):
+    spool = WriteSpool(str(tmp_path), segment_bytes=100, segment_age_seconds=3600)
+    spool.append(lines(0, 10))  # passa de 100 bytes: o segmento é fechado
+    spool.append(lines(10, 1))  # segmento ativo, ainda aberto
+    assert segment_files(tmp_path) == ["spool-0000000000.lp", "spool-0000000001.lp"]
+
+    assert replay(spool) == lines(0, 10)
+    assert segment_files(tmp_path) == ["spool-0000000001.lp"]
+    assert spool.lines_replayed == 10 and bool(spool)
+
+
+def test_active_segment_rotates_by_age(tmp_path):
+    spool = WriteSpool(str(tmp_path), segment_age_seconds=0)
+    spool.append(lines(0, 3))
+    assert replay(spool) == lines(0, 3)
+    assert not spool and segment_files(tmp_path) == []
+
+
+def test_partial_reads_resume_from_the_acked_offset(tmp_path):
+    spool = WriteSpool(str(tmp_path), segment_age_seconds=0)
+    spool.append(lines(0, 5))
+    batch, token = spool.read_batch(2)
+    assert batch == lines(0, 2)
+    # Sem ack o mesmo lote é lido de novo
+    assert spool.read_batch(2)[0] == lines(0, 2)
+    spool.ack(token)
+    assert spool.read_batch(10)[0] == lines(2, 3)
+
+
+def test_size_limit_evicts_oldest_segments(tmp_path):
+    spool = WriteSpool(str(tmp_path), max_bytes=300, segment_bytes=100, segment_age_seconds=3600)
+    for start in range(0, 40, 5):
+        spool.append(lines(start, 5))
+    assert spool.size_bytes <= 300
+    assert spool.segments_evicted > 0 and spool.bytes_evicted > 0
+    replayed = replay(spool)
+    spool.close()
+    replayed += replay(spool)
+    # Os descartados são sempre os mais antigos; os mais novos são preservados em ordem
+    assert 0 < len(replayed) < 40
+    assert replayed == lines(40 - len(replayed), len(replayed))
+
+
+def test_age_limit_evicts_old_segments(tmp_path):
+    spool = WriteSpool(str(tmp_path), max_age_seconds=60, segment_age_seconds=0)
+    spool.append(lines(0, 2))
+    spool.append(lines(2, 2))
+    old = time.time() - 120
+    os.utime(tmp_path / "spool-0000000000.lp", (old, old))
+    assert replay(spool) == lines(2, 2)
+    assert spool.segments_evicted == 1
+
+
+def test_segments_survive_restart_and_torn_lines_are_dropped(tmp_path):
+    spool = WriteSpool(str(tmp_path), segment_age_seconds=3600)
+    spool.append(lines(0, 3))
+    # Agente derrubado no meio de uma escrita: o segmento ativo fica com uma linha incompleta
+    with open(tmp_path / "spool-0000000000.lp", "ab") as f:
+        f.write(b"m,n=torn v=")
+
+    restarted = WriteSpool(str(tmp_path), segment_age_seconds=3600)
+    restarted.append(lines(3, 1))
+    assert segment_files(tmp_path) == ["spool-0000000000.lp", "spool-0000000001.lp"]
+    assert replay(restarted) == lines(0, 3)
+
+
+class StatusError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class ScriptedWriter(InfluxWriter):
+    """``InfluxWriter`` sem rede: ``_send`` levanta o erro configurado ou registra o lote."""
+
+    def __init__(self, **kwargs):
+        super().__init__("http://influx.test", "token", "org", "bucket", flush_interval=0.01,
+                         retry_interval=0.05, **kwargs)
+        self.error = None
+        self.sent = []
+
+    def _connect(self):
+        pass
+
+    def _send(self, batch):
+        if self.error is not None:
+            raise self.error
+        self.sent.extend(batch)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail("condition not reached in time")
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize("status", [400, 422])
+def test_rejected_batches_are_discarded_not_spooled(tmp_path, status):
+    spool = WriteSpool(str(tmp_path), segment_age_seconds=0)
+    writer = ScriptedWriter(spool=spool).start()
+    writer.error = StatusError(status)
+    writer.submit(lines(0, 3))
+    wait_until(lambda: writer.points_rejected == 3)
+
+    writer.error = None
+    writer.submit(lines(3, 2))
+    wait_until(lambda: writer.points_written == 2)
+    writer.close()
+    assert writer.sent == lines(3, 2)
+    assert spool.lines_spooled == 0 and not spool
+
+
+def test_failed_batches_are_spooled_and_replayed(tmp_path):
+    spool = WriteSpool(str(tmp_path), segment_age_seconds=0)
+    writer = ScriptedWriter(spool=spool).start()
+    writer.error = StatusError(503)
+    writer.submit(lines(0, 4))
+    wait_until(lambda: spool.lines_spooled == 4)
+
+    writer.error = None
+    wait_until(lambda: spool.lines_replayed == 4)
+    writer.close()
+    assert writer.sent == lines(0, 4)
+    assert writer.points_rejected == 0 and not spool
+
+
+def test_rejected_spooled_lines_are_discarded(tmp_path):
+    spool = WriteSpool(str(tmp_path), segment_age_seconds=0)
+    spool.append(lines(0, 3))
+    writer = ScriptedWriter(spool=spool)
+    writer.error = StatusError(400)
+    writer._replay_spool()
+    assert writer.points_rejected == 3 and not spool
+    assert writer.sent == []
@@ -0,0 +1,96 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Maior que o buffer de leitura do ijson, para o corpo chegar em vários blocos
+LOCATIONS = [{"id": f"loc-{i}", "data": {"interfaces": [], "name": "x" * 100}} for i in range(2000)]
+PAYLOAD = json.dumps(LOCATIONS).encode()
+
+
+class ApiStub(ThreadingHTTPServer):
+    """API ViaIpe falsa: responde o payload, um 304 ou um corpo truncado."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _ApiHandler)
+        self.requests = []
+        # Bytes do corpo enviados antes de derrubar a conexão (None: corpo inteiro)
+        self.truncate_at = None
+        self.url = f"http://127.0.0.1:{self.server_port}/api"
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = PAYLOAD if self.server.truncate_at is None else PAYLOAD[:self.server.truncate_at]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = True
+
+
+@pytest.fixture
+def api(agent_api, monkeypatch):
+    server = ApiStub()
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    monkeypatch.setattr(agent_api, "API_URL", server.url)
+    monkeypatch.setattr(agent_api, "STREAMING", True)
+    monkeypatch.setattr(agent_api, "CIRCUIT_BREAKER_THRESHOLD", 1)
+    monkeypatch.setattr(agent_api, "breakers", {})
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_stream_yields_every_location_and_records_success(agent_api, api):
+    stream = agent_api.fetch_data()
+    # O resultado só é registrado depois que o corpo chega inteiro
+    assert agent_api.conditional_cache.request_headers(api.url) == {}
+    assert list(stream) == LOCATIONS
+    assert agent_api.get_breaker(api.url).failures == 0
+    assert agent_api.conditional_cache.request_headers(api.url) == {"If-None-Match": '"v1"'}
+
+
+def test_truncated_stream_is_recorded_as_failure(agent_api, api):
+    api.truncate_at = len(PAYLOAD) // 2
+    failures = agent_api.FETCH_FAILURES.value
+    streamed = list(agent_api.fetch_data())
+    assert 0 < len(streamed) < len(LOCATIONS) and streamed == LOCATIONS[:len(streamed)]
+    assert agent_api.FETCH_FAILURES.value == failures + 1
+    assert agent_api.get_breaker(api.url).state_name == "open"
+    # Sem validadores guardados: a próxima busca baixa o payload de novo em vez de receber 304
+    assert agent_api.conditional_cache.request_headers(api.url) == {}
+
+
+def test_not_modified_stream_is_skipped_without_failure(agent_api, api):
+    list(agent_api.fetch_data())
+    assert agent_api.fetch_data() is None
+    assert api.requests[-1]["If-None-Match"] == '"v1"'
+    assert agent_api.conditional_cache.not_modified == 1
+    assert agent_api.get_breaker(api.url).failures == 0
+
+
+def test_consumer_stopping_early_is_not_a_failure(agent_api, api):
+    stream = agent_api.fetch_data()
+    assert next(stream) == LOCATIONS[0]
+    stream.close()
+    assert agent_api.get_breaker(api.url).failures == 0
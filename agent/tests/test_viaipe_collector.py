@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from aiohttp import web
+
+from viaipe_collector import RegionCollector
+
+SLOW_SECONDS = 2.0
+
+
+@pytest.fixture
+def stub_api():
+    """Stub aiohttp com duas regiões saudáveis, uma lenta e uma com erro 500."""
+    async def region(request):
+        name = request.match_info["name"]
+        if name == "slow":
+            await asyncio.sleep(SLOW_SECONDS)
+        if name == "fail":
+            return web.Response(status=500)
+        count = {"norte": 2, "sul": 1}.get(name, 1)
+        return web.json_response([{"id": f"{name}-{i}", "name": name} for i in range(count)])
+
+    app = web.Application()
+    app.router.add_get("/api/{name}", region)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{port}/api"
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def test_slow_and_failing_regions_lose_only_their_own_data(stub_api):
+    urls = [f"{stub_api}/{name}" for name in ("norte", "slow", "sul", "fail")]
+    collector = RegionCollector(urls, timeout=0.5, concurrency=4)
+    try:
+        start = time.perf_counter()
+        locations = collector.fetch()
+        elapsed = time.perf_counter() - start
+    finally:
+        collector.close()
+
+    assert sorted(location["id"] for location in locations) == ["norte-0", "norte-1", "sul-0"]
+    # A região lenta é cortada pelo próprio timeout, sem segurar o ciclo
+    assert elapsed < SLOW_SECONDS
+    results = collector.last_results
+    assert results[urls[0]]["ok"] and results[urls[0]]["locations"] == 2
+    assert results[urls[2]]["ok"] and results[urls[2]]["locations"] == 1
+    assert not results[urls[1]]["ok"] and results[urls[1]]["locations"] == 0
+    assert not results[urls[3]]["ok"] and results[urls[3]]["locations"] == 0
+
+
+def test_breaker_skips_open_region(stub_api):
+    class Breaker:
+        def __init__(self, open_):
+            self.open = open_
+            self.results = []
+
+        def allow(self):
+            return not self.open
+
+        def record_success(self):
+            self.results.append(True)
+
+        def record_failure(self):
+            self.results.append(False)
+
+    breakers = {f"{stub_api}/norte": Breaker(False), f"{stub_api}/sul": Breaker(True), f"{stub_api}/fail": Breaker(False)}
+    collector = RegionCollector(list(breakers), timeout=1, breaker_for=breakers.get)
+    try:
+        locations = collector.fetch()
+    finally:
+        collector.close()
+
+    assert sorted(location["id"] for location in locations) == ["norte-0", "norte-1"]
+    assert breakers[f"{stub_api}/norte"].results == [True]
+    assert breakers[f"{stub_api}/sul"].results == []
+    assert breakers[f"{stub_api}/fail"].results == [False]